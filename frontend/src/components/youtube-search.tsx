@@ -162,16 +162,16 @@ const YoutubeSearch = () => {
               <CardHeader>
                 <CardTitle
                   className="text-lg text-blue-400"
-                  dangerouslySetInnerHTML={{ __html: result.highlighted_name }}
+                  dangerouslySetInnerHTML={{ __html: result.name }}
                 />
               </CardHeader>
               <CardContent>
                 <div
                   className="text-gray-300"
-                  dangerouslySetInnerHTML={{ __html: result.content_snippet }}
+                  dangerouslySetInnerHTML={{ __html: result.snippet }}
                 />
                 <div className="mt-2 text-sm text-gray-400">
-                  Relevance Score: {Math.round(result.relevance_score)}%
+                  Relevance Score: {Math.round(result.score)}%
                 </div>
               </CardContent>
             </Card>
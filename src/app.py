@@ -1,13 +1,28 @@
 # app.py
-from flask import Flask
-from flask_cors import CORS
-from search_routes import search_bp
-from youtube_routes import youtube_bp
-from search import init_search_module
-from cache import init_cache_module
-from llm.llm_module import init_llm
-from autocomplete import init_autocomplete
-from index import init_db, add_video, add_transcript_segments, search_transcripts
+from config.startup import timed, startup_report
+
+with timed('import flask'):
+    from flask import Flask
+    from flask_cors import CORS
+with timed('import search_routes'):
+    from search_routes import search_bp
+with timed('import youtube_routes'):
+    from youtube_routes import youtube_bp
+with timed('import search'):
+    from search import (
+        init_search_module, prepare_documents, corpus_version, document_id, document_path,
+        normalized_terms, encode_query,
+    )
+with timed('import cache'):
+    from cache import init_cache_module
+with timed('import llm'):
+    from llm.llm_module import init_llm
+with timed('import autocomplete'):
+    from autocomplete import init_autocomplete
+with timed('import index'):
+    from index import init_db, add_video, add_transcript_segments, search_transcripts, get_video_documents
+from functools import partial
+from config.config import CACHE_SEMANTIC_MODEL
 import os
 
 def create_app():
@@ -33,9 +48,29 @@ def create_app():
 
     # Initialize database
     print("\nInitializing database...", flush=True)
-    init_db()
+    with timed('init database'):
+        init_db()
     print("Database initialization complete!", flush=True)
 
+    # Cheap engines are ready before serving, heavy ones keep loading in the background;
+    # /search/ready reports their progress
+    print("\nInitializing search module", flush=True)
+    with timed('load documents'):
+        documents = prepare_documents(get_video_documents())
+    with timed('init search engines'):
+        init_search_module(documents)
+    # Cached results are tied to the corpus version and dropped when it changes; keys are
+    # built from the same normalized terms the syntactic engines search for
+    with timed('init cache'):
+        init_cache_module(
+            index_version=corpus_version,
+            doc_id=document_id,
+            doc_path=document_path,
+            normalize_query=normalized_terms,
+            embed_query=partial(encode_query, CACHE_SEMANTIC_MODEL),
+        )
+    print(startup_report(), flush=True)
+
     return app
 
 app = create_app()
@@ -57,17 +92,15 @@ if __name__ == '__main__':
     
     # Initialize database first
     print("\nInitializing database...", flush=True)
-    init_db()
+    with timed('init database (main)'):
+        init_db()
     
     # Initialize other modules if needed
-    # print("\nInitializing search module", flush=True)
-    # init_search_module(documents)
-    # print("\nInitializing cache module", flush=True)
-    # init_cache_module()
     # print("\nInitializing autocomplete module", flush=True)
     # init_autocomplete(documents, 0)
     # print("\nInitializing LLM module", flush=True)
     # init_llm()
     
     print("\nAll modules initialized!", flush=True)
+    print(startup_report(), flush=True)
     app.run(debug=True, host='0.0.0.0')
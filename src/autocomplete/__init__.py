@@ -1,63 +1,84 @@
-import sqlite3
+import atexit
 import os
+import queue
 import re
-from collections import defaultdict
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.feature_extraction.text import TfidfVectorizer
-from config.config import DATA_FOLDER
+from config.config import (
+    DATA_FOLDER, INDEX_PROCESSES, CLICK_FLUSH_INTERVAL, CLICK_FLUSH_BATCH, CLICK_QUEUE_SIZE,
+    AUTOCOMPLETE_FUZZY_DISTANCE, AUTOCOMPLETE_FUZZY_PREFIX_LENGTH, AUTOCOMPLETE_FUZZY_BUDGET_MS,
+)
+from config.database import get_connection
 import numpy as np
 
-from search.syntactic_helper import clear_text 
+from search.syntactic_helper import clear_text, clear_texts
+from autocomplete import prefix_index, fuzzy_index
 
 AUTOCOMPLETE_DB_PATH = os.path.join(DATA_FOLDER, 'autocomplete.db')
 MAX_PHRASE_LENGTH = 5
-BATCH_SIZE = 1000
-TOP_TFIDF_WORDS = 20
+# Documents per phrase extraction task when INDEX_PROCESSES > 1
+PHRASE_SHARD_SIZE = 256
 
 MIN_TFIDF_THRESHOLD_WORD = 0.01
 MIN_TFIDF_THRESHOLD_PHRASE = 0.02
 MIN_TFIDF_THRESHOLD_DOC_NAME = 0.005
 
-# Weights for the ranking formula
-TFIDF_WEIGHT = 0.3
-CLICK_COUNT_WEIGHT = 0.3
-DOC_NAME_WEIGHT = 0.4
-
 
 STOP_WORDS = set([
 'www', 'http', 'https'
 ])
 
+# Clicks waiting for the writer thread: phrases, or an Event to set once everything queued
+# before it is written. Repeated phrases are summed, so a flush is one UPDATE per phrase.
+_click_queue = queue.Queue(maxsize=CLICK_QUEUE_SIZE)
+_click_writer = None
+_click_writer_lock = threading.Lock()
+click_stats = {'queued': 0, 'dropped': 0, 'written': 0, 'flushes': 0, 'failed': 0}
+
+# Suggestions are served from this in-memory prefix index (see prefix_index), loaded from
+# autocomplete_items on first use and replaced whenever the table changes; SQLite only
+# persists it. Rebuilds and click updates hold _index_lock around their database work so
+# the index always matches the table.
+_index = None
+_index_lock = threading.Lock()
+
+# Symmetric-delete index over the phrase prefixes for fuzzy suggestions (see fuzzy_index),
+# built on a background thread after each load; until it is ready fuzzy requests only get
+# exact completions. Click updates keep the phrases, so it stays valid until the next reload.
+_fuzzy = None
+
 
-def get_db_connection():
-    conn = sqlite3.connect(AUTOCOMPLETE_DB_PATH)
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
+def get_db_connection(readonly=False):
+    """A pooled connection for a `with` block; suggestions are served from a read-only one."""
+    return get_connection(AUTOCOMPLETE_DB_PATH, readonly=readonly)
 
 def init_autocomplete(documents, indexed_count=0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.executescript('''
-        CREATE TABLE IF NOT EXISTS autocomplete_items (
-            id INTEGER PRIMARY KEY,
-            phrase TEXT UNIQUE,
-            tfidf_score REAL,
-            click_count INTEGER DEFAULT 0,
-            is_doc_name BOOLEAN DEFAULT 0
-        );
-        CREATE INDEX IF NOT EXISTS idx_autocomplete_items_phrase ON autocomplete_items(phrase);
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn, conn:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS autocomplete_items (
+                id INTEGER PRIMARY KEY,
+                phrase TEXT UNIQUE,
+                tfidf_score REAL,
+                click_count INTEGER DEFAULT 0,
+                is_doc_name BOOLEAN DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_autocomplete_items_phrase ON autocomplete_items(phrase);
+        ''')
     
     if indexed_count > 0:
         populate_autocomplete_from_documents(documents)
+    load_autocomplete_index()
 
 
 def clean_text(text):
-    text = clear_text(text)
-    
+    return clean_normalized_text(clear_text(text))
+
+
+def clean_normalized_text(text):
     # Remove links
     text = re.sub(r'https?://\S+|www\.\S+', '', text)
     
@@ -99,12 +120,9 @@ def consolidate_phrases(phrases):
     return consolidated
 
 def add_or_update_items(items, is_doc_name=False):
-    if not items:
-        return
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    """Upsert (phrase, tfidf_score) items passing their threshold, in one executemany transaction."""
+    global _index
+    rows = []
     for item, tfidf_score in items:
         if is_doc_name:
             threshold = MIN_TFIDF_THRESHOLD_DOC_NAME
@@ -114,100 +132,215 @@ def add_or_update_items(items, is_doc_name=False):
             threshold = MIN_TFIDF_THRESHOLD_WORD
 
         if tfidf_score >= threshold or is_doc_name:
-            cursor.execute('''
+            rows.append((item, tfidf_score, is_doc_name, tfidf_score, is_doc_name))
+    if not rows:
+        return
+
+    with _index_lock:
+        with get_db_connection() as conn, conn:
+            conn.executemany('''
                 INSERT INTO autocomplete_items (phrase, tfidf_score, is_doc_name)
                 VALUES (?, ?, ?)
                 ON CONFLICT(phrase) DO UPDATE SET 
                     tfidf_score = MAX(tfidf_score, ?),
                     is_doc_name = ?
-            ''', (item, tfidf_score, is_doc_name, tfidf_score, is_doc_name))
-    
-    conn.commit()
-    conn.close()
+            ''', rows)
+        # Rebuilt from the table on the next suggestion request
+        _index = None
 
 def populate_autocomplete_from_documents(documents):
-    phrases = []
-    doc_names = []
-    
-    # Clean the documents once
-    cleaned_documents = [clean_text(doc['content']) for doc in documents]
-    
+    """
+    Store every 1 to MAX_PHRASE_LENGTH word phrase of the documents whose best word
+    tf-idf passes its threshold, plus the document names, in one transaction per kind.
+    With INDEX_PROCESSES > 1 phrases are extracted from shards of documents in parallel.
+    """
+    # Clean the documents once, normalizing them as one batch
+    normalized_documents = clear_texts([doc['content'] for doc in documents], processes=INDEX_PROCESSES)
+    cleaned_documents = [clean_normalized_text(text) for text in normalized_documents]
+
     # Use the cleaned documents for TF-IDF
     vectorizer = TfidfVectorizer(stop_words=list(STOP_WORDS), token_pattern=r'\b\w+\b', lowercase=True)
-    tfidf_matrix = vectorizer.fit_transform(cleaned_documents)
-    feature_names = vectorizer.get_feature_names_out()
+    tfidf_matrix = vectorizer.fit_transform(cleaned_documents).tocsr()
+    tfidf_matrix.sort_indices()
 
-    for doc_index, (doc, cleaned_content) in enumerate(zip(documents, cleaned_documents)):
-        words = cleaned_content.split()
-        
-        for i in range(len(words)):
-            for j in range(i + 1, min(i + MAX_PHRASE_LENGTH + 1, len(words) + 1)):
-                phrase = ' '.join(words[i:j])
-                phrase_words = [word for word in phrase.split() if word in vectorizer.vocabulary_]
-                if phrase_words:
-                    tfidf_scores = [tfidf_matrix[doc_index, vectorizer.vocabulary_[word]] for word in phrase_words]
-                    tfidf_score = np.max(tfidf_scores)
-                    phrases.append((phrase, tfidf_score))
-
-        doc_name = doc['name']
-        if doc_name:
-            doc_names.append((doc_name, 1.0))  
-        doc_name = clean_text(doc['name'])
-        if doc_name:
-            doc_names.append((doc_name, 1.0))  
-
-
-    consolidated_phrases = consolidate_phrases(phrases)
-    add_or_update_items(consolidated_phrases)
+    shards = [
+        (cleaned_documents[start:start + PHRASE_SHARD_SIZE], tfidf_matrix[start:start + PHRASE_SHARD_SIZE], vectorizer.vocabulary_)
+        for start in range(0, len(documents), PHRASE_SHARD_SIZE)
+    ]
+    if INDEX_PROCESSES > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=INDEX_PROCESSES) as executor:
+            shard_phrases = list(executor.map(_shard_phrases, shards))
+    else:
+        shard_phrases = [_shard_phrases(shard) for shard in shards]
 
+    phrases = {}
+    for found in shard_phrases:
+        for phrase, tfidf_score in found.items():
+            if tfidf_score > phrases.get(phrase, 0.0):
+                phrases[phrase] = tfidf_score
+    add_or_update_items(list(phrases.items()))
+
+    doc_names = []
+    cleaned_names = [clean_normalized_text(text) for text in clear_texts([doc['name'] for doc in documents])]
+    for doc, cleaned_name in zip(documents, cleaned_names):
+        if doc['name']:
+            doc_names.append((doc['name'], 1.0))
+        if cleaned_name:
+            doc_names.append((cleaned_name, 1.0))
     add_or_update_items(doc_names, is_doc_name=True)
-    
-    quality_words = []
-    for doc_index, doc in enumerate(documents):
-        top_tfidf_features = tfidf_matrix[doc_index].tocoo()
-        top_words = [feature_names[i] for i in top_tfidf_features.col[top_tfidf_features.data.argsort()[-TOP_TFIDF_WORDS:]]]
-        for word in top_words:
-            if word in vectorizer.vocabulary_:
-                tfidf_score = tfidf_matrix[doc_index, vectorizer.vocabulary_[word]]
-                quality_words.append((word, tfidf_score))
-
-    if quality_words:
-        consolidated_words = consolidate_phrases(quality_words)
-        add_or_update_items(consolidated_words)
-    else:
-        print("No quality words found.")
+
+def _shard_phrases(shard):
+    """{phrase: best tf-idf} of one shard of (cleaned documents, their tf-idf rows, vocabulary)."""
+    cleaned_documents, tfidf_rows, vocabulary = shard
+    phrases = {}
+    for doc_index, cleaned_content in enumerate(cleaned_documents):
+        words = cleaned_content.split()
+        row = tfidf_rows[doc_index]
+        if not words or not row.nnz:
+            continue
+
+        # Score of every word from the document's sparse row (-inf for words outside the vocabulary)
+        word_ids = np.array([vocabulary.get(word, -1) for word in words])
+        slots = np.searchsorted(row.indices, word_ids).clip(max=row.nnz - 1)
+        found = (word_ids >= 0) & (row.indices[slots] == word_ids)
+        word_scores = np.where(found, row.data[slots], -np.inf)
+
+        # Sliding-window maximum: window_scores[i] is the best word score of words[i:i + length]
+        window_scores = word_scores
+        for length in range(1, min(MAX_PHRASE_LENGTH, len(words)) + 1):
+            if length > 1:
+                window_scores = np.maximum(window_scores[:-1], word_scores[length - 1:])
+            threshold = MIN_TFIDF_THRESHOLD_WORD if length == 1 else MIN_TFIDF_THRESHOLD_PHRASE
+            for start in np.flatnonzero(window_scores >= threshold).tolist():
+                phrase = ' '.join(words[start:start + length])
+                tfidf_score = float(window_scores[start])
+                if tfidf_score > phrases.get(phrase, 0.0):
+                    phrases[phrase] = tfidf_score
+    return phrases
 
 
 def update_click_count(phrase):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE autocomplete_items
-        SET click_count = click_count + 1
-        WHERE phrase = ?
-    ''', (phrase.lower(),))
-    
-    conn.commit()
-    conn.close()
+    """Count a click; it is written by the background writer within CLICK_FLUSH_INTERVAL seconds."""
+    _start_click_writer()
+    try:
+        _click_queue.put_nowait(phrase.lower())
+        click_stats['queued'] += 1
+    except queue.Full:
+        click_stats['dropped'] += 1
 
-def get_autocomplete_suggestions(query, limit=10):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT phrase,
-               (? * tfidf_score + 
-                ? * (CAST(click_count AS REAL) / (SELECT MAX(click_count) FROM autocomplete_items)) + 
-                ? * CAST(is_doc_name AS REAL)) AS combined_score
-        FROM autocomplete_items
-        WHERE phrase LIKE ? || '%'
-        ORDER BY combined_score DESC, length(phrase) ASC
-        LIMIT ?
-    ''', (TFIDF_WEIGHT, CLICK_COUNT_WEIGHT, DOC_NAME_WEIGHT, query.lower(), limit))
-    
-    suggestions = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
-    
+def flush_click_counts(timeout=None):
+    """Wait until every click queued so far is written; False on timeout or when no writer runs."""
+    if _click_writer is None or not _click_writer.is_alive():
+        return False
+    done = threading.Event()
+    _click_queue.put(done)
+    return done.wait(timeout)
+
+def _start_click_writer():
+    global _click_writer
+    if _click_writer is not None:
+        return
+    with _click_writer_lock:
+        if _click_writer is None:
+            _click_writer = threading.Thread(target=_write_clicks, name='click-writer', daemon=True)
+            _click_writer.start()
+            # Write what is still queued when the process exits normally
+            atexit.register(flush_click_counts, CLICK_FLUSH_INTERVAL * 5)
+
+def _write_clicks():
+    pending = Counter()
+    pending_count = 0
+    waiting = []
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = _click_queue.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+        if isinstance(item, threading.Event):
+            waiting.append(item)
+        elif item is not None:
+            pending[item] += 1
+            pending_count += 1
+            if deadline is None:
+                deadline = time.monotonic() + CLICK_FLUSH_INTERVAL
+
+        if waiting or pending_count >= CLICK_FLUSH_BATCH or (deadline is not None and time.monotonic() >= deadline):
+            if pending:
+                _flush_clicks(pending)
+            pending = Counter()
+            pending_count = 0
+            deadline = None
+            for done in waiting:
+                done.set()
+            waiting = []
+
+def _flush_clicks(pending):
+    """One transaction adding each phrase's clicks; a failed batch is dropped, not retried."""
+    global _index
+    try:
+        with _index_lock:
+            with get_db_connection() as conn, conn:
+                conn.executemany('''
+                    UPDATE autocomplete_items
+                    SET click_count = click_count + ?
+                    WHERE phrase = ?
+                ''', [(count, phrase) for phrase, count in pending.items()])
+            if _index is not None:
+                _index = prefix_index.with_clicks(_index, pending)
+        click_stats['written'] += sum(pending.values())
+        click_stats['flushes'] += 1
+    except sqlite3.Error as e:
+        click_stats['failed'] += sum(pending.values())
+        print(f"Failed to write {len(pending)} click counts: {e}")
+
+def load_autocomplete_index():
+    """Rebuild the in-memory index from autocomplete_items; the fuzzy index follows in the background."""
+    global _index, _fuzzy
+    with _index_lock:
+        with get_db_connection(readonly=True) as conn:
+            rows = conn.execute(
+                'SELECT phrase, tfidf_score, click_count, is_doc_name FROM autocomplete_items'
+            ).fetchall()
+        _index = index = prefix_index.build(rows)
+        _fuzzy = None
+    print(f"Autocomplete index loaded with {len(rows)} phrases.")
+    if AUTOCOMPLETE_FUZZY_DISTANCE > 0:
+        threading.Thread(target=_build_fuzzy_index, args=(index['keys'],), name='autocomplete-fuzzy', daemon=True).start()
+    return index
+
+def _build_fuzzy_index(keys):
+    global _fuzzy
+    fuzzy = fuzzy_index.build(keys, AUTOCOMPLETE_FUZZY_PREFIX_LENGTH, AUTOCOMPLETE_FUZZY_DISTANCE)
+    with _index_lock:
+        # A reload while building made these keys obsolete
+        if _index is not None and _index['keys'] is keys:
+            _fuzzy = fuzzy
+    print(f"Autocomplete fuzzy index built with {len(fuzzy['deletes'])} entries.")
+
+def get_autocomplete_suggestions(query, limit=10, fuzzy=False):
+    """
+    The best completions of query; with fuzzy, slots left after the exact completions are
+    filled with completions of corrections of its first characters.
+    """
+    index = _index
+    if index is None:
+        try:
+            index = load_autocomplete_index()
+        except sqlite3.Error as e:
+            print(f"Autocomplete index unavailable: {e}")
+            return []
+    suggestions = prefix_index.complete(index, query, limit)
+
+    corrector = _fuzzy
+    if fuzzy and len(suggestions) < limit and corrector is not None and corrector['keys'] is index['keys']:
+        suggestions += fuzzy_index.complete(corrector, index, query, limit - len(suggestions),
+                                            exclude=set(suggestions), budget_ms=AUTOCOMPLETE_FUZZY_BUDGET_MS)
     return suggestions
+
+def autocomplete_stats():
+    index = _index
+    stats = prefix_index.stats(index) if index is not None else {'phrases': None}
+    fuzzy = _fuzzy
+    return dict(stats, fuzzy_entries=len(fuzzy['deletes']) if fuzzy is not None else None, clicks=dict(click_stats))
@@ -0,0 +1,91 @@
+import time
+from collections import defaultdict
+from autocomplete import prefix_index
+
+# Typo-tolerant completion over a prefix index (symmetric delete). Typos are corrected in
+# the first prefix_length characters of a query, where a wrong keystroke leaves no exact
+# completions; the rest of the query is kept as typed. Every distinct phrase prefix of up
+# to prefix_length + max_distance characters is stored under each string obtained by
+# deleting up to max_distance of its characters. A prefix within max_distance edits of
+# the query's head shares at least one of those strings with the head's own deletes, so
+# candidates are found by dictionary lookups and then checked with the real distance
+# (optimal string alignment: insertions, deletions, substitutions, transpositions).
+
+# Shorter queries are too ambiguous to correct
+MIN_QUERY_LENGTH = 3
+
+def _deletes(text, max_distance):
+    """text and every string left after deleting up to max_distance of its characters."""
+    variants = {text}
+    frontier = {text}
+    for _ in range(max_distance):
+        frontier = {variant[:position] + variant[position + 1:] for variant in frontier for position in range(len(variant))}
+        variants |= frontier
+    return variants
+
+def build(keys, prefix_length, max_distance):
+    """Deletes of the prefixes of the (lowercased, sorted) phrase keys of a prefix index."""
+    # Heads shorter than MIN_QUERY_LENGTH are not corrected, so neither are prefixes that could only match them
+    shortest, longest = max(1, MIN_QUERY_LENGTH - max_distance), prefix_length + max_distance
+    prefixes = {key[:length] for key in keys for length in range(shortest, min(len(key), longest) + 1)}
+    deletes = defaultdict(list)
+    for prefix in prefixes:
+        for variant in _deletes(prefix, max_distance):
+            deletes[variant].append(prefix)
+    return {
+        'keys': keys,
+        'deletes': dict(deletes),
+        'prefix_length': prefix_length,
+        'max_distance': max_distance,
+    }
+
+def distance(a, b):
+    """Optimal string alignment distance between a and b."""
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before_previous[j - 2] + 1)
+        before_previous, previous = previous, current
+    return previous[-1]
+
+def corrections(fuzzy, query, deadline=None):
+    """
+    (distance, corrected query) pairs, closest first; query is lowercased. Candidates
+    are checked until deadline (a time.perf_counter() value) passes.
+    """
+    head, tail = query[:fuzzy['prefix_length']], query[fuzzy['prefix_length']:]
+    if len(head) < MIN_QUERY_LENGTH:
+        return []
+    found = {}
+    for variant in _deletes(head, fuzzy['max_distance']):
+        for prefix in fuzzy['deletes'].get(variant, ()):
+            # Truncations and extensions of the head complete to its exact matches
+            if prefix in found or head.startswith(prefix) or prefix.startswith(head):
+                continue
+            if deadline is not None and time.perf_counter() > deadline:
+                return sorted((edits, prefix + tail) for prefix, edits in found.items())
+            edits = distance(head, prefix)
+            if edits <= fuzzy['max_distance']:
+                found[prefix] = edits
+    return sorted((edits, prefix + tail) for prefix, edits in found.items())
+
+def complete(fuzzy, index, query, limit=10, exclude=(), budget_ms=5.0):
+    """
+    The best limit completions of corrections of query, fewest edits first, then by score.
+    Corrections are tried until budget_ms is spent.
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    ranked = {}
+    for edits, corrected in corrections(fuzzy, query.lower(), deadline):
+        if time.perf_counter() > deadline:
+            break
+        # Excluded phrases must not use up the limit
+        for position in prefix_index.best_positions(index, corrected, limit + len(exclude)):
+            phrase = index['phrases'][position]
+            if phrase not in exclude and phrase not in ranked:
+                ranked[phrase] = (edits, -index['scores'][position], index['lengths'][position])
+    return sorted(ranked, key=ranked.get)[:limit]
@@ -0,0 +1,123 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+# Autocomplete phrases in memory, sorted by their lowercased form, so the phrases
+# starting with a prefix are one contiguous range found by binary search. Each phrase has
+# a combined score (tf-idf, clicks relative to the most clicked phrase, document name) and
+# suggestions are the best scored phrases in the range, shorter first on ties.
+# Short prefixes match large ranges; their top suggestions are precomputed.
+#
+# An index is a dict of parallel arrays and is never mutated: updates return a new one.
+
+# Ranks match the SQL formula the suggestions used to be computed with
+TFIDF_WEIGHT = 0.3
+CLICK_COUNT_WEIGHT = 0.3
+DOC_NAME_WEIGHT = 0.4
+
+# Prefixes up to this length matching more than PRECOMPUTE_MIN_MATCHES phrases get their
+# top PRECOMPUTED_TOP_K suggestions stored
+PRECOMPUTED_PREFIX_LENGTH = 3
+PRECOMPUTE_MIN_MATCHES = 256
+PRECOMPUTED_TOP_K = 10
+
+# Sorts after every character, so prefix + LAST_CHARACTER bounds the prefix range
+LAST_CHARACTER = chr(0x10FFFF)
+
+def build(rows):
+    """An index of (phrase, tfidf_score, click_count, is_doc_name) rows."""
+    rows = sorted(rows, key=lambda row: row[0].lower())
+    index = {
+        'keys': [row[0].lower() for row in rows],
+        'phrases': [row[0] for row in rows],
+        'tfidf': np.array([row[1] or 0.0 for row in rows], dtype=np.float64),
+        'clicks': np.array([row[2] or 0 for row in rows], dtype=np.int64),
+        'doc_name': np.array([bool(row[3]) for row in rows], dtype=np.float64),
+        'lengths': np.array([len(row[0]) for row in rows], dtype=np.int64),
+    }
+    index['positions'] = {phrase: position for position, phrase in enumerate(index['phrases'])}
+    return _with_scores(index)
+
+def _with_scores(index):
+    max_clicks = index['clicks'].max() if len(index['clicks']) else 0
+    clicks = index['clicks'] / max_clicks if max_clicks > 0 else np.zeros(len(index['clicks']))
+    scores = TFIDF_WEIGHT * index['tfidf'] + CLICK_COUNT_WEIGHT * clicks + DOC_NAME_WEIGHT * index['doc_name']
+    index = dict(index, scores=scores, max_clicks=max_clicks)
+    return dict(index, top=_precompute(index))
+
+def _precompute(index):
+    top = {}
+    keys = index['keys']
+    for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+        start = 0
+        while start < len(keys):
+            if len(keys[start]) < length:
+                start += 1
+                continue
+            prefix = keys[start][:length]
+            end = bisect_right(keys, prefix + LAST_CHARACTER, start)
+            if end - start > PRECOMPUTE_MIN_MATCHES:
+                top[prefix] = _best(index, start, end, PRECOMPUTED_TOP_K)
+            start = end
+    return top
+
+def _best(index, start, end, limit):
+    """Positions of the best limit phrases in [start, end): score descending, then length."""
+    scores = index['scores'][start:end]
+    if len(scores) > limit:
+        # Everything scoring at least the limit-th best score, ties included
+        threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((index['lengths'][start:end][candidates], -scores[candidates]))
+    return (candidates[order[:limit]] + start).tolist()
+
+def best_positions(index, prefix, limit=10):
+    """Positions of the best limit phrases starting with prefix (lowercased)."""
+    if limit <= PRECOMPUTED_TOP_K and prefix in index['top']:
+        return index['top'][prefix][:limit]
+    start = bisect_left(index['keys'], prefix)
+    end = bisect_right(index['keys'], prefix + LAST_CHARACTER, start)
+    return _best(index, start, end, limit) if end > start else []
+
+def complete(index, prefix, limit=10):
+    """The best limit phrases starting with prefix (case-insensitive)."""
+    return [index['phrases'][position] for position in best_positions(index, prefix.lower(), limit)]
+
+def with_clicks(index, counts):
+    """The index with counts ({phrase: clicks}) added; unknown phrases are ignored."""
+    positions = [(index['positions'][phrase], count) for phrase, count in counts.items() if phrase in index['positions']]
+    if not positions:
+        return index
+    clicks = index['clicks'].copy()
+    for position, count in positions:
+        clicks[position] += count
+    index = dict(index, clicks=clicks)
+
+    # A new maximum rescales the click part of every score
+    if clicks.max() != index['max_clicks']:
+        return _with_scores(index)
+
+    scores = index['scores'].copy()
+    changed = np.array([position for position, _ in positions])
+    scores[changed] = (TFIDF_WEIGHT * index['tfidf'][changed]
+                       + CLICK_COUNT_WEIGHT * clicks[changed] / index['max_clicks']
+                       + DOC_NAME_WEIGHT * index['doc_name'][changed])
+    index = dict(index, scores=scores)
+
+    top = dict(index['top'])
+    keys = index['keys']
+    prefixes = {keys[position][:length] for position in changed.tolist()
+                for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+    for prefix in prefixes & top.keys():
+        start = bisect_left(keys, prefix)
+        end = bisect_right(keys, prefix + LAST_CHARACTER, start)
+        top[prefix] = _best(index, start, end, PRECOMPUTED_TOP_K)
+    return dict(index, top=top)
+
+def stats(index):
+    return {
+        'phrases': len(index['phrases']),
+        'precomputed_prefixes': len(index['top']),
+        'max_clicks': int(index['max_clicks']),
+    }
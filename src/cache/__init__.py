@@ -1,72 +1,364 @@
-from config.config import DATA_FOLDER
-from typing import List, Dict, Optional, Any
-import json
+from config.config import (
+    DATA_FOLDER, CACHE_TTL, CACHE_MEMORY_MAX_BYTES, CACHE_DB_MAX_BYTES, CACHE_MAINTENANCE_INTERVAL,
+    CACHE_UNORDERED_METHODS, CACHE_SEMANTIC_THRESHOLD, CACHE_SEMANTIC_MAX_ENTRIES,
+)
+from cache.serialization import encode_results, decode_results
+from config.database import get_connection
+from collections import OrderedDict
+from typing import Callable, List, Dict, Optional, Any
+import numpy as np
 import os
 import sqlite3
+import threading
+import time
 
 CACHE_DB_PATH = os.path.join(DATA_FOLDER, 'cache.db')
 
-def init_cache_module():
+# Two tiers: a byte-bounded LRU of decoded responses in this process, in front of the
+# SQLite table shared by all workers. Entries expire after CACHE_TTL seconds and are
+# tagged with the index version they were computed against; an entry from another
+# version is a miss, so results are dropped as soon as the corpus changes. SQLite rows hold
+# results in the binary form of cache.serialization, which refers to documents by doc id.
+#
+# Requests only read SQLite and insert new rows. Everything else runs on a background
+# thread every CACHE_MAINTENANCE_INTERVAL seconds: the access times of hits (batched in
+# _pending_access) are written, expired and stale rows purged, the table trimmed to
+# CACHE_DB_MAX_BYTES and the file vacuumed. A database error in a request is a cache miss.
+#
+# _memory maps cache_key -> (expires_at, index_version, size, response), least recently used first.
+_memory = OrderedDict()
+_memory_bytes = 0
+_memory_lock = threading.Lock()
+_metrics = {
+    'memory_hits': 0, 'disk_hits': 0, 'semantic_hits': 0, 'misses': 0, 'expired': 0, 'stale': 0,
+    'stores': 0, 'memory_evictions': 0, 'disk_evictions': 0, 'vacuums': 0, 'errors': 0,
+}
+# cache_key -> time of its latest hit not yet written to last_access, guarded by _memory_lock
+_pending_access = {}
+_maintenance_thread = None
+
+# Optional semantic tier (CACHE_SEMANTIC_THRESHOLD > 0): embeddings of the queries stored by
+# this process, per request signature (everything in the key but the query), so a new query
+# close enough to a cached one reuses its entry. Snippets and highlights are those of the
+# cached query. _semantic maps signature -> {'keys': [cache_key], 'rows': {cache_key: row},
+# 'embeddings': a row per key, 'next': row overwritten next once full}, guarded by _memory_lock.
+_semantic = {}
+
+_index_version: Callable[[], Optional[str]] = lambda: None
+_doc_id: Callable[[str], Optional[int]] = lambda path: None
+_doc_path: Callable[[int], Optional[str]] = lambda doc_id: None
+_normalize_query: Callable[[str], List[str]] = lambda query: query.casefold().split()
+_embed_query: Optional[Callable[[str], Any]] = None
+
+# Vacuum once this share of the database file is free pages
+VACUUM_FREE_RATIO = 0.25
+
+def init_cache_module(index_version: Optional[Callable[[], Optional[str]]] = None,
+                      doc_id: Optional[Callable[[str], Optional[int]]] = None,
+                      doc_path: Optional[Callable[[int], Optional[str]]] = None,
+                      normalize_query: Optional[Callable[[str], List[str]]] = None,
+                      embed_query: Optional[Callable[[str], Any]] = None):
+    """
+    index_version() identifies the current corpus; cached results from other versions are ignored.
+    doc_id(path) and doc_path(doc_id) map result ids to the document store's integer ids and back.
+    normalize_query(query) gives the terms cache keys are built from, and embed_query(query) a
+    normalized embedding for the semantic tier.
+    """
+    global _index_version, _doc_id, _doc_path, _normalize_query, _embed_query
+    if index_version is not None:
+        _index_version = index_version
+    if doc_id is not None and doc_path is not None:
+        _doc_id, _doc_path = doc_id, doc_path
+    if normalize_query is not None:
+        _normalize_query = normalize_query
+    if embed_query is not None:
+        _embed_query = embed_query
     create_table()
+    _start_maintenance()
 
 def get_db_connection():
-    return sqlite3.connect(CACHE_DB_PATH)
+    """A pooled connection, for the duration of a `with` block."""
+    return get_connection(CACHE_DB_PATH)
 
 def create_table():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cache (
-            cache_key TEXT PRIMARY KEY,
-            search_results TEXT,
-            ai_response TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn, conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                cache_key TEXT PRIMARY KEY,
+                search_results TEXT,
+                ai_response TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Columns added for expiry and eviction; rows from before them have NULL expiry and are purged
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(cache)')}
+        for column, column_type in (('expires_at', 'REAL'), ('index_version', 'TEXT'),
+                                    ('size', 'INTEGER'), ('last_access', 'REAL')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE cache ADD COLUMN {column} {column_type}')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)')
+        # Rows written before results were stored in binary form
+        cursor.execute("DELETE FROM cache WHERE typeof(search_results) != 'blob'")
+
+def _request_signature(aggregation_method: str, search_methods: List[str], options: List[str]) -> str:
+    return '|'.join([aggregation_method, ','.join(sorted(search_methods)), ','.join(sorted(options))])
 
 def generate_cache_key(query: str, aggregation_method: str, search_methods: List[str], options: List[str]) -> str:
-    key_components = [
-        query,
-        aggregation_method,
-        ','.join(sorted(search_methods)),
-        ','.join(sorted(options))
-    ]
-    return '|'.join(key_components)
-
-def store_results(query: str, aggregation_method: str, search_methods: List[str], options: List[str], 
+    """
+    Queries with the same normalized terms share a key; for requests that only use
+    methods whose ranking ignores term order (CACHE_UNORDERED_METHODS) the order does not
+    matter either.
+    """
+    # A query of nothing but stop words keeps its plain words
+    terms = _normalize_query(query) or query.casefold().split()
+    if search_methods and CACHE_UNORDERED_METHODS.issuperset(search_methods):
+        terms = sorted(terms)
+    return '|'.join([' '.join(terms), _request_signature(aggregation_method, search_methods, options)])
+
+def _remember(cache_key: str, expires_at: float, version: Optional[str], size: int, response: Dict):
+    """Put a response in the memory tier, evicting least recently used entries past the byte budget."""
+    global _memory_bytes
+    if size > CACHE_MEMORY_MAX_BYTES:
+        return
+    with _memory_lock:
+        previous = _memory.pop(cache_key, None)
+        if previous is not None:
+            _memory_bytes -= previous[2]
+        _memory[cache_key] = (expires_at, version, size, response)
+        _memory_bytes += size
+        while _memory_bytes > CACHE_MEMORY_MAX_BYTES:
+            _, evicted = _memory.popitem(last=False)
+            _memory_bytes -= evicted[2]
+            _metrics['memory_evictions'] += 1
+
+def _forget(cache_key: str):
+    global _memory_bytes
+    with _memory_lock:
+        entry = _memory.pop(cache_key, None)
+        if entry is not None:
+            _memory_bytes -= entry[2]
+
+def store_results(query: str, aggregation_method: str, search_methods: List[str], options: List[str],
                   search_results: List[Dict[str, Any]], ai_response: Optional[str] = None):
     cache_key = generate_cache_key(query, aggregation_method, search_methods, options)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    serialized_results = json.dumps(search_results)
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO cache (cache_key, search_results, ai_response)
-        VALUES (?, ?, ?)
-    ''', (cache_key, serialized_results, ai_response))
-    conn.commit()
-    conn.close()
+    version = _index_version()
+    now = time.time()
+    expires_at = now + CACHE_TTL
+
+    serialized_results, decoded_size = encode_results(search_results, _doc_id)
+    size = len(serialized_results) + len(ai_response or '')
+
+    _remember(cache_key, expires_at, version, decoded_size + len(ai_response or ''),
+              {'search_results': search_results, 'ai_response': ai_response})
+
+    try:
+        with get_db_connection() as conn, conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO cache (cache_key, search_results, ai_response, expires_at, index_version, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (cache_key, serialized_results, ai_response, expires_at, version, size, now))
+    except sqlite3.Error as e:
+        # The memory tier still has the entry; other workers compute it again
+        print(f"Cache store failed: {e}")
+        with _memory_lock:
+            _metrics['errors'] += 1
+    else:
+        with _memory_lock:
+            _metrics['stores'] += 1
+    if CACHE_SEMANTIC_THRESHOLD > 0:
+        _semantic_add(_request_signature(aggregation_method, search_methods, options), cache_key, query)
 
 def get_results(query: str, aggregation_method: str, search_methods: List[str], options: List[str]) -> Optional[Dict]:
     cache_key = generate_cache_key(query, aggregation_method, search_methods, options)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT search_results, ai_response FROM cache WHERE cache_key = ?', (cache_key,))
-    result = cursor.fetchone()
-    conn.close()
-    if result:
-        return {
-            'search_results': json.loads(result[0]),
-            'ai_response': result[1]
-        }
-    return None
+    version = _index_version()
+    now = time.time()
+
+    response = _lookup(cache_key, version, now)
+    if response is None and CACHE_SEMANTIC_THRESHOLD > 0:
+        neighbour = _semantic_neighbour(_request_signature(aggregation_method, search_methods, options), query)
+        if neighbour is not None and neighbour != cache_key:
+            response = _lookup(neighbour, version, now)
+            if response is not None:
+                with _memory_lock:
+                    _metrics['semantic_hits'] += 1
+    if response is None:
+        with _memory_lock:
+            _metrics['misses'] += 1
+    return response
+
+def _lookup(cache_key: str, version: Optional[str], now: float) -> Optional[Dict]:
+    """The fresh response stored under cache_key, from memory or else from SQLite."""
+    with _memory_lock:
+        entry = _memory.get(cache_key)
+        if entry is not None and entry[0] > now and entry[1] == version:
+            _memory.move_to_end(cache_key)
+            _pending_access[cache_key] = now
+            _metrics['memory_hits'] += 1
+            return entry[3]
+    if entry is not None:
+        _forget(cache_key)
+
+    try:
+        with get_db_connection() as conn:
+            result = conn.execute(
+                'SELECT search_results, ai_response, expires_at, index_version FROM cache WHERE cache_key = ?',
+                (cache_key,)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Cache lookup failed: {e}")
+        with _memory_lock:
+            _metrics['errors'] += 1
+        return None
+    if result is None:
+        return None
+
+    # Expired and stale rows are purged by the next maintenance pass, unreadable ones
+    # overwritten when the results are stored again
+    search_results, ai_response, expires_at, row_version = result
+    fresh = expires_at is not None and expires_at > now and row_version == version
+    decoded = decode_results(search_results, _doc_path) if fresh else None
+    if decoded is None:
+        with _memory_lock:
+            _metrics['stale' if row_version != version or fresh else 'expired'] += 1
+        return None
+
+    decoded_results, decoded_size = decoded
+    response = {
+        'search_results': decoded_results,
+        'ai_response': ai_response
+    }
+    _remember(cache_key, expires_at, row_version, decoded_size + len(ai_response or ''), response)
+    with _memory_lock:
+        _pending_access[cache_key] = now
+        _metrics['disk_hits'] += 1
+    return response
+
+def _embed(query: str) -> Optional[np.ndarray]:
+    if _embed_query is None:
+        return None
+    try:
+        return np.asarray(_embed_query(query), dtype=np.float32)
+    except Exception as e:
+        # The semantic tier is an optimization; searches go on without it
+        print(f"Semantic cache embedding failed: {e}")
+        return None
+
+def _semantic_neighbour(signature: str, query: str) -> Optional[str]:
+    """Key of the most similar cached query with this signature, if it passes CACHE_SEMANTIC_THRESHOLD."""
+    if signature not in _semantic:
+        return None
+    embedding = _embed(query)
+    if embedding is None:
+        return None
+    with _memory_lock:
+        entry = _semantic[signature]
+        scores = entry['embeddings'][:len(entry['keys'])] @ embedding
+        best = int(np.argmax(scores))
+        return entry['keys'][best] if scores[best] >= CACHE_SEMANTIC_THRESHOLD else None
+
+def _semantic_add(signature: str, cache_key: str, query: str):
+    """Index the query embedding; past CACHE_SEMANTIC_MAX_ENTRIES the oldest row is overwritten."""
+    embedding = _embed(query)
+    if embedding is None:
+        return
+    with _memory_lock:
+        entry = _semantic.get(signature)
+        if entry is None:
+            entry = _semantic[signature] = {
+                'keys': [], 'rows': {}, 'next': 0,
+                'embeddings': np.empty((min(16, CACHE_SEMANTIC_MAX_ENTRIES), len(embedding)), dtype=np.float32),
+            }
+        if cache_key in entry['rows']:
+            return
+        keys = entry['keys']
+        if len(keys) < CACHE_SEMANTIC_MAX_ENTRIES:
+            row = len(keys)
+            if row == len(entry['embeddings']):
+                grown = np.empty((min(2 * row, CACHE_SEMANTIC_MAX_ENTRIES), len(embedding)), dtype=np.float32)
+                grown[:row] = entry['embeddings']
+                entry['embeddings'] = grown
+            keys.append(cache_key)
+        else:
+            row = entry['next']
+            del entry['rows'][keys[row]]
+            keys[row] = cache_key
+            entry['next'] = (row + 1) % CACHE_SEMANTIC_MAX_ENTRIES
+        entry['embeddings'][row] = embedding
+        entry['rows'][cache_key] = row
+
+def _start_maintenance():
+    global _maintenance_thread
+    with _memory_lock:
+        if _maintenance_thread is None:
+            _maintenance_thread = threading.Thread(target=_run_maintenance, name='cache-maintenance', daemon=True)
+            _maintenance_thread.start()
+
+def _run_maintenance():
+    while True:
+        try:
+            maintain()
+        except sqlite3.Error as e:
+            # Another worker holding the database too long; the next pass catches up
+            print(f"Cache maintenance failed: {e}")
+            with _memory_lock:
+                _metrics['errors'] += 1
+        time.sleep(CACHE_MAINTENANCE_INTERVAL)
+
+def maintain():
+    """
+    Write the batched access times of cache hits, purge expired and stale rows, evict
+    least recently used rows past CACHE_DB_MAX_BYTES and vacuum once enough of the file
+    is free space.
+    """
+    with _memory_lock:
+        accessed = list(_pending_access.items())
+        _pending_access.clear()
+
+    now = time.time()
+    version = _index_version()
+    with get_db_connection() as conn, conn:
+        conn.executemany('UPDATE cache SET last_access = ? WHERE cache_key = ?',
+                         [(accessed_at, cache_key) for cache_key, accessed_at in accessed])
+        conn.execute('DELETE FROM cache WHERE expires_at IS NULL OR expires_at <= ? OR index_version IS NOT ?', (now, version))
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total > CACHE_DB_MAX_BYTES:
+            # Walk from the least recently used row until enough bytes are freed
+            excess = total - CACHE_DB_MAX_BYTES
+            evicted = conn.execute('''
+                DELETE FROM cache WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key, SUM(size) OVER (ORDER BY last_access, cache_key) - size AS freed_before
+                        FROM cache
+                    ) WHERE freed_before < ?
+                )
+            ''', (excess,)).rowcount
+            with _memory_lock:
+                _metrics['disk_evictions'] += evicted
+
+    with get_db_connection() as conn:
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if page_count and freelist_count / page_count > VACUUM_FREE_RATIO:
+            conn.execute('VACUUM')
+            with _memory_lock:
+                _metrics['vacuums'] += 1
+
+def cache_stats() -> Dict[str, Any]:
+    with _memory_lock:
+        stats = dict(_metrics, memory_entries=len(_memory), memory_bytes=_memory_bytes,
+                     semantic_entries=sum(len(entry['keys']) for entry in _semantic.values()))
+    lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+    return stats
 
 def clear_cache():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM cache')
-    conn.commit()
-    conn.close()
+    global _memory_bytes
+    with _memory_lock:
+        _memory.clear()
+        _memory_bytes = 0
+        _semantic.clear()
+        _pending_access.clear()
+    with get_db_connection() as conn, conn:
+        conn.execute('DELETE FROM cache')
@@ -0,0 +1,104 @@
+import json
+import struct
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple, Any
+from config.config import CACHE_COMPRESSION_LEVEL
+
+# Cached search results in a compact binary form, zlib-compressed:
+#   header   format version, number of results
+#   ids      int64 doc id per result (-1 when the result's path is not in the document store)
+#   scores   float64 relevance score per result
+#   lengths  uint32 byte length of each string below, four per result
+#   strings  UTF-8 name, snippet, path (only for id -1) and JSON of any other fields
+#            (chunks, debug explanations; empty when there are none)
+# Paths are not stored for documents in the store; they are looked up from the doc id
+# when the entry is read back.
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BI')
+STRINGS_PER_RESULT = 4
+
+# Fields with a slot of their own; everything else goes into the JSON extras
+FIXED_FIELDS = ('id', 'name', 'score', 'snippet')
+
+def encode_results(results: List[Dict[str, Any]], doc_id: Callable[[str], Optional[int]]) -> Tuple[bytes, int]:
+    """(compressed payload, uncompressed size) of compact search results."""
+    ids = []
+    scores = []
+    strings = []
+    for result in results:
+        result_id = doc_id(result['id'])
+        ids.append(-1 if result_id is None else result_id)
+        scores.append(result['score'])
+        extras = {field: value for field, value in result.items() if field not in FIXED_FIELDS}
+        strings.extend([
+            result.get('name') or '',
+            result.get('snippet') or '',
+            result['id'] if result_id is None else '',
+            json.dumps(extras) if extras else '',
+        ])
+
+    encoded = [string.encode('utf-8') for string in strings]
+    count = len(results)
+    body = b''.join([
+        HEADER.pack(FORMAT_VERSION, count),
+        struct.pack(f'<{count}q', *ids),
+        struct.pack(f'<{count}d', *scores),
+        struct.pack(f'<{len(encoded)}I', *map(len, encoded)),
+        *encoded,
+    ])
+    return zlib.compress(body, CACHE_COMPRESSION_LEVEL), len(body)
+
+def decode_results(payload: bytes, doc_path: Callable[[int], Optional[str]]) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """
+    (results, uncompressed size) encoded in payload, or None when it is unreadable or
+    refers to a document that is gone.
+    """
+    try:
+        body = zlib.decompress(payload)
+        decoded = _decode_body(body)
+    # UnicodeDecodeError and json.JSONDecodeError are ValueErrors
+    except (zlib.error, struct.error, TypeError, ValueError):
+        return None
+    if decoded is None:
+        return None
+
+    results = []
+    for result_id, result in decoded:
+        if result_id >= 0:
+            result['id'] = doc_path(result_id)
+            if result['id'] is None:
+                return None
+        results.append(result)
+    return results, len(body)
+
+def _decode_body(body: bytes) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+    """[(doc id, result)] in body, None for another format version; raises when body is malformed."""
+    version, count = HEADER.unpack_from(body)
+    if version != FORMAT_VERSION:
+        return None
+
+    offset = HEADER.size
+    ids = struct.unpack_from(f'<{count}q', body, offset)
+    offset += 8 * count
+    scores = struct.unpack_from(f'<{count}d', body, offset)
+    offset += 8 * count
+    lengths = struct.unpack_from(f'<{STRINGS_PER_RESULT * count}I', body, offset)
+    offset += 4 * len(lengths)
+
+    strings = []
+    for length in lengths:
+        if offset + length > len(body):
+            raise ValueError("String runs past the end of the cached payload")
+        strings.append(body[offset:offset + length].decode('utf-8'))
+        offset += length
+    if offset != len(body):
+        raise ValueError("Trailing bytes in the cached payload")
+
+    decoded = []
+    for index, (result_id, score) in enumerate(zip(ids, scores)):
+        name, snippet, path, extras = strings[STRINGS_PER_RESULT * index:STRINGS_PER_RESULT * (index + 1)]
+        result = {'id': path, 'name': name, 'score': score, 'snippet': snippet}
+        if extras:
+            result.update(json.loads(extras))
+        decoded.append((result_id, result))
+    return decoded
@@ -8,3 +8,121 @@ DATA_FOLDER = os.path.join(PROJECT_ROOT, 'data')
 
 # Ensure the data folder exists
 os.makedirs(DATA_FOLDER, exist_ok=True)
+
+# NLTK data is looked up here first; `python -m search.syntactic_helper` fills it at build time.
+# Kept outside DATA_FOLDER, which is usually a mounted volume.
+NLTK_DATA_PATH = os.environ.get('NLTK_DATA_PATH', os.path.join(PROJECT_ROOT, 'nltk_data'))
+
+# Fall back to downloading missing NLTK data at runtime; set to 0 in air-gapped deployments
+NLTK_AUTO_DOWNLOAD = os.environ.get('NLTK_AUTO_DOWNLOAD', '1') == '1'
+
+# Text normalization: 'nltk' (word_tokenize) or 'regex' (faster approximation of it).
+# Documents and queries must be normalized with the same tokenizer.
+TEXT_TOKENIZER = os.environ.get('TEXT_TOKENIZER', 'nltk')
+
+# Number of distinct tokens whose lemma is memoized
+LEMMA_CACHE_SIZE = int(os.environ.get('LEMMA_CACHE_SIZE', 100000))
+
+# Worker processes used to normalize documents at index time (1 disables the pool)
+INDEX_PROCESSES = int(os.environ.get('INDEX_PROCESSES', 1))
+
+# Local embedding backend (sentence-transformer engines): device and runtime to encode on
+# ('torch' or 'onnx') and chunks encoded per batch
+EMBEDDING_DEVICE = os.environ.get('EMBEDDING_DEVICE', 'cpu')
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 32))
+
+# Storage type of document vectors: 'float32', 'float16' (half the memory) or 'int8' (a quarter)
+EMBEDDING_VECTOR_DTYPE = os.environ.get('EMBEDDING_VECTOR_DTYPE', 'float16')
+
+# Query embeddings kept per process (shared by all semantic engines) and their lifetime in seconds
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 1024))
+QUERY_EMBEDDING_CACHE_TTL = float(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', 3600))
+
+# Search engines that are only loaded the first time a search selects them
+SEARCH_LAZY_ENGINES = [name for name in os.environ.get('SEARCH_LAZY_ENGINES', 'st_2,st_3').split(',') if name]
+
+# Search engines /search/ready waits for. The others (external APIs, optional models) are
+# reported there but never hold readiness back, whether they are loading or have failed.
+SEARCH_REQUIRED_ENGINES = [
+    name for name in os.environ.get('SEARCH_REQUIRED_ENGINES', 'fulltext,bm25,tfidf').split(',') if name
+]
+
+# Threads running the methods of hybrid searches, shared by all requests
+HYBRID_SEARCH_WORKERS = int(os.environ.get('HYBRID_SEARCH_WORKERS', 8))
+
+# Per-method time budget of a hybrid search in seconds. The query embedding calls of the
+# semantic engines give up after the same time, so a slow API does not keep a worker busy.
+SEARCH_METHOD_TIMEOUTS = {
+    'fulltext': 1.0,
+    'bm25': 1.0,
+    'tfidf': 1.0,
+    'openai': 3.0,
+    'st_1': 2.0,
+    'st_2': 2.0,
+    'st_3': 2.0,
+}
+DEFAULT_SEARCH_METHOD_TIMEOUT = 2.0
+
+# Nearest-neighbour index of the semantic engines: 'flat' (exact), 'hnsw', 'ivf_flat' or 'ivf_pq'.
+# `python -m search.ann_index` compares their recall and latency.
+ANN_INDEX_TYPE = os.environ.get('ANN_INDEX_TYPE', 'flat')
+ANN_HNSW_M = int(os.environ.get('ANN_HNSW_M', 32))
+ANN_HNSW_EF_CONSTRUCTION = int(os.environ.get('ANN_HNSW_EF_CONSTRUCTION', 200))
+ANN_HNSW_EF_SEARCH = int(os.environ.get('ANN_HNSW_EF_SEARCH', 64))
+ANN_IVF_NLIST = int(os.environ.get('ANN_IVF_NLIST', 0))  # 0 picks about 4 * sqrt(vectors)
+ANN_IVF_NPROBE = int(os.environ.get('ANN_IVF_NPROBE', 16))
+ANN_PQ_M = int(os.environ.get('ANN_PQ_M', 16))
+
+# SQLite connections (cache, autocomplete, index): durability of commits in WAL mode
+# ('NORMAL' can only lose the last commits on power loss, 'FULL' syncs every commit),
+# page cache per connection, bytes memory-mapped for reads, and how long a statement
+# waits for a lock before failing
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 2 ** 20))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# Prepared statements kept per connection
+SQLITE_STATEMENT_CACHE_SIZE = int(os.environ.get('SQLITE_STATEMENT_CACHE_SIZE', 256))
+# Connections kept open per database and mode, shared by all threads; a thread waits up to
+# the busy timeout for one to be free
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+
+# Autocomplete click counts are queued and written in batches by a background thread:
+# at most every CLICK_FLUSH_INTERVAL seconds (so a crash loses at most that much) or once
+# CLICK_FLUSH_BATCH clicks are pending. Clicks beyond CLICK_QUEUE_SIZE waiting are dropped.
+CLICK_FLUSH_INTERVAL = float(os.environ.get('CLICK_FLUSH_INTERVAL', 1.0))
+CLICK_FLUSH_BATCH = int(os.environ.get('CLICK_FLUSH_BATCH', 1000))
+CLICK_QUEUE_SIZE = int(os.environ.get('CLICK_QUEUE_SIZE', 100000))
+
+# Typo-tolerant autocomplete (fuzzy=1): edits allowed in the first
+# AUTOCOMPLETE_FUZZY_PREFIX_LENGTH characters of the query (0 disables the fuzzy index)
+# and the time a request may spend on corrections
+AUTOCOMPLETE_FUZZY_DISTANCE = int(os.environ.get('AUTOCOMPLETE_FUZZY_DISTANCE', 1))
+AUTOCOMPLETE_FUZZY_PREFIX_LENGTH = int(os.environ.get('AUTOCOMPLETE_FUZZY_PREFIX_LENGTH', 6))
+AUTOCOMPLETE_FUZZY_BUDGET_MS = float(os.environ.get('AUTOCOMPLETE_FUZZY_BUDGET_MS', 5))
+
+# Query result cache: lifetime in seconds, byte budget of the in-process tier and of the
+# SQLite tier, and seconds between the background maintenance passes (access times,
+# expiry, eviction, vacuum)
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 24 * 3600))
+CACHE_MEMORY_MAX_BYTES = int(os.environ.get('CACHE_MEMORY_MAX_BYTES', 64 * 2 ** 20))
+CACHE_DB_MAX_BYTES = int(os.environ.get('CACHE_DB_MAX_BYTES', 512 * 2 ** 20))
+CACHE_MAINTENANCE_INTERVAL = float(os.environ.get('CACHE_MAINTENANCE_INTERVAL', 600))
+# zlib level of cached results (0 stores them uncompressed, 9 is smallest)
+CACHE_COMPRESSION_LEVEL = int(os.environ.get('CACHE_COMPRESSION_LEVEL', 6))
+
+# Cache keys use the normalized query terms (case, spacing, stop words, lemmas). Requests
+# using only these methods also ignore term order ('' to keep order everywhere). Only list
+# methods whose ranking does not depend on it: bm25 and tfidf also score the query's
+# bigrams, so swapping two words changes their results.
+CACHE_UNORDERED_METHODS = frozenset(
+    name for name in os.environ.get('CACHE_UNORDERED_METHODS', 'fulltext').split(',') if name
+)
+
+# Semantic cache tier: a miss reuses the results of a cached query whose embedding (with
+# CACHE_SEMANTIC_MODEL) has at least this cosine similarity; 0 disables the tier.
+# CACHE_SEMANTIC_MAX_ENTRIES query embeddings are kept per kind of request.
+CACHE_SEMANTIC_THRESHOLD = float(os.environ.get('CACHE_SEMANTIC_THRESHOLD', 0))
+CACHE_SEMANTIC_MODEL = os.environ.get('CACHE_SEMANTIC_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+CACHE_SEMANTIC_MAX_ENTRIES = int(os.environ.get('CACHE_SEMANTIC_MAX_ENTRIES', 10000))
@@ -0,0 +1,102 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config.config import (
+    SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_STATEMENT_CACHE_SIZE, SQLITE_POOL_SIZE,
+)
+
+# SQLite connections shared by the cache, autocomplete and index modules. Every
+# (database, mode) has a pool of at most SQLITE_POOL_SIZE connections shared by all
+# threads, so the PRAGMAs and SQLite's prepared statement cache (cached_statements)
+# survive between requests however many threads the server starts. Write connections run
+# in WAL mode, which lets readers proceed while a writer commits; query paths use
+# read-only connections.
+#
+# get_connection is a context manager: the connection belongs to the caller until the
+# block ends and must not be closed. Writes go through `with conn:` inside it so each one
+# is committed (or rolled back) at the end of that block.
+
+# (path, readonly, foreign_keys) -> {'idle': Queue of connections, 'opened': count}
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Databases whose journal mode was already switched to WAL by this process
+_wal_paths = set()
+_wal_lock = threading.Lock()
+
+@contextmanager
+def get_connection(path, readonly=False, foreign_keys=False):
+    """A pooled connection to the database at path, opened and tuned on first use."""
+    pool = _pool((path, readonly, foreign_keys))
+    conn = _acquire(pool, path, readonly, foreign_keys)
+    try:
+        yield conn
+    finally:
+        # Never hand the next caller an open transaction
+        if conn.in_transaction:
+            conn.rollback()
+        pool['idle'].put(conn)
+
+def _pool(key):
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = {'idle': queue.Queue(), 'opened': 0}
+        return pool
+
+def _acquire(pool, path, readonly, foreign_keys):
+    try:
+        return pool['idle'].get_nowait()
+    except queue.Empty:
+        pass
+    with _pools_lock:
+        opening = pool['opened'] < SQLITE_POOL_SIZE
+        if opening:
+            pool['opened'] += 1
+    if opening:
+        try:
+            return _connect(path, readonly, foreign_keys)
+        except sqlite3.Error:
+            with _pools_lock:
+                pool['opened'] -= 1
+            raise
+    try:
+        return pool['idle'].get(timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    except queue.Empty:
+        raise sqlite3.OperationalError(f"No free connection to {path} within the busy timeout") from None
+
+def _connect(path, readonly, foreign_keys):
+    # Pooled connections move between threads, one thread at a time
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+        # The journal mode is stored in the database file, so once per process is enough
+        with _wal_lock:
+            if path not in _wal_paths:
+                conn.execute("PRAGMA journal_mode=WAL")
+                _wal_paths.add(path)
+        conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    if foreign_keys:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def close_connections():
+    """Close every idle pooled connection, e.g. before the process exits."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                conn = pool['idle'].get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with _pools_lock:
+                pool['opened'] -= 1
@@ -0,0 +1,21 @@
+import time
+from contextlib import contextmanager
+
+# (label, seconds) for every timed startup step, in the order they ran
+STARTUP_TIMINGS = []
+
+@contextmanager
+def timed(label):
+    """Record how long the wrapped import or init step takes."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS.append((label, time.perf_counter() - start))
+
+def startup_report():
+    lines = ["Startup timings:"]
+    for label, seconds in STARTUP_TIMINGS:
+        lines.append(f"  {label:<40} {seconds * 1000:9.1f} ms")
+    lines.append(f"  {'total':<40} {sum(seconds for _, seconds in STARTUP_TIMINGS) * 1000:9.1f} ms")
+    return "\n".join(lines)
@@ -5,7 +5,8 @@ from .youtube_processor import (
     delete_video,
     get_connection,
     search_transcripts,
-    get_video_transcript
+    get_video_transcript,
+    get_video_documents
 )
 
 from .youtube_service import (
@@ -146,23 +146,24 @@ def add_channel(url: str) -> Dict:
 
 def get_indexed_channels() -> List[Dict]:
     """Get list of indexed videos with stats"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection(readonly=True) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT 
-            v.video_id,
-            v.title,
-            v.url,
-            v.published_at,
-            COUNT(DISTINCT t.transcript_id) as transcripts_count
-        FROM videos v
-        LEFT JOIN transcripts t ON t.video_id = v.video_id
-        GROUP BY v.video_id
-    ''')
+        cursor.execute('''
+            SELECT 
+                v.video_id,
+                v.title,
+                v.url,
+                v.published_at,
+                COUNT(DISTINCT t.transcript_id) as transcripts_count
+            FROM videos v
+            LEFT JOIN transcripts t ON t.video_id = v.video_id
+            GROUP BY v.video_id
+        ''')
+        rows = cursor.fetchall()
 
     videos = []
-    for row in cursor.fetchall():
+    for row in rows:
         videos.append({
             'video_id': row[0],
             'title': row[1],
@@ -171,7 +172,6 @@ def get_indexed_channels() -> List[Dict]:
             'transcripts_count': row[4]
         })
 
-    conn.close()
     return videos
 
 def remove_channel(channel_id: str) -> bool:
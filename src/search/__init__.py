@@ -1,8 +1,15 @@
 from .bm25_search import init as init_bm25, search as search_bm25
 from .openai_search import init as init_openai, search as search_openai
+from .fulltext_search import init as init_fulltext, search as search_fulltext
+from .tfidf_search import init as init_tfidf, search as search_tfidf
 
+from .engine_registry import register_engine, init_engines, readiness, remove_documents
 from .hybrid_search import search as hybrid_search
+from .search_module import prepare_documents
+from .syntactic_helper import normalized_terms
+from .embeddings import encode_query
+from .document_store import version as corpus_version, doc_id as document_id, path as document_path
 
 def init_search_module(documents):
-    init_bm25(documents)
-    init_openai(documents)
+    """Low-cost engines are ready on return; the rest warm up in the background or load on first use."""
+    init_engines(documents)
@@ -0,0 +1,199 @@
+import argparse
+import json
+import math
+import os
+import time
+import uuid
+import numpy as np
+from config.config import (
+    ANN_INDEX_TYPE, ANN_HNSW_M, ANN_HNSW_EF_CONSTRUCTION, ANN_HNSW_EF_SEARCH,
+    ANN_IVF_NLIST, ANN_IVF_NPROBE, ANN_PQ_M,
+)
+from search import embedding_store
+
+# FAISS indexes over normalized embeddings (inner product = cosine) for the semantic engines.
+#   flat      exact search, the reference for recall
+#   hnsw      graph index; efSearch trades recall for latency, no training needed
+#   ivf_flat  inverted lists over k-means cells; nprobe cells are scanned per query
+#   ivf_pq    like ivf_flat with product-quantized vectors, a fraction of the memory
+# Indexes are persisted with faiss.write_index; nothing is pickled.
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+
+# Points k-means wants per centroid; IVF indexes over fewer vectors fall back to flat
+MIN_POINTS_PER_CENTROID = 39
+PQ_BITS = 8
+
+def _faiss():
+    import faiss
+    return faiss
+
+def _nlist(num_vectors):
+    if ANN_IVF_NLIST > 0:
+        return ANN_IVF_NLIST
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID))
+
+def _pq_m(dimensions):
+    """Largest divisor of dimensions up to ANN_PQ_M; FAISS needs d % m == 0."""
+    return max(m for m in range(1, min(ANN_PQ_M, dimensions) + 1) if dimensions % m == 0)
+
+def build_index(vectors, index_type=None):
+    """An index of the given type over float32 row vectors, flat when there is too little data to train."""
+    faiss = _faiss()
+    index_type = index_type or ANN_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown ANN index type: {index_type}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dimensions = vectors.shape
+    nlist = _nlist(num_vectors)
+    min_training = nlist * MIN_POINTS_PER_CENTROID
+    if index_type == 'ivf_pq':
+        min_training = max(min_training, 2 ** PQ_BITS)
+    if index_type in ('ivf_flat', 'ivf_pq') and num_vectors < min_training:
+        print(f"{num_vectors} vectors are too few to train {index_type}, using a flat index")
+        index_type = 'flat'
+
+    if index_type == 'flat':
+        index = faiss.IndexFlatIP(dimensions)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimensions, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ANN_HNSW_EF_CONSTRUCTION
+    else:
+        quantizer = faiss.IndexFlatIP(dimensions)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, dimensions, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimensions, nlist, _pq_m(dimensions), PQ_BITS,
+                                     faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+
+    index.add(vectors)
+    return index
+
+def index_type(index):
+    faiss = _faiss()
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+def search_index(index, query_vectors, k, ef_search=None, nprobe=None):
+    """
+    (scores, ids) of the k best rows per query, ids -1 where fewer were found.
+    Recall knobs are passed per call, so concurrent searches can use different settings.
+    """
+    faiss = _faiss()
+    query_vectors = np.ascontiguousarray(np.atleast_2d(query_vectors), dtype=np.float32)
+    k = min(k, index.ntotal)
+    if k <= 0:
+        return np.empty((len(query_vectors), 0), dtype=np.float32), np.empty((len(query_vectors), 0), dtype=np.int64)
+
+    kind = index_type(index)
+    if kind == 'hnsw':
+        params = faiss.SearchParametersHNSW(efSearch=max(ef_search or ANN_HNSW_EF_SEARCH, k))
+    elif kind in ('ivf_flat', 'ivf_pq'):
+        params = faiss.SearchParametersIVF(nprobe=min(nprobe or ANN_IVF_NPROBE, index.nlist))
+    else:
+        params = None
+    return index.search(query_vectors, k, params=params)
+
+def save_index(index, path):
+    """Write atomically, so a crash never leaves a truncated index behind."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    scratch = os.path.join(directory, f".index.{uuid.uuid4().hex}.faiss")
+    _faiss().write_index(index, scratch)
+    os.replace(scratch, path)
+
+def save_manifest(manifest, path):
+    """Write the JSON manifest next to a saved index atomically, after the index itself."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    scratch = os.path.join(directory, f".manifest.{uuid.uuid4().hex}.json")
+    with open(scratch, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(scratch, path)
+
+def load_index(path):
+    """The index saved at path, or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return _faiss().read_index(path)
+    except RuntimeError:
+        return None
+
+def benchmark(vectors, query_vectors, k=10, configs=None):
+    """
+    Recall@k against exact search and mean latency per query for each
+    (index_type, {'ef_search' | 'nprobe': value}) configuration.
+    """
+    configs = configs or [
+        ('flat', {}),
+        *[('hnsw', {'ef_search': ef}) for ef in (16, 32, 64, 128, 256)],
+        *[('ivf_flat', {'nprobe': nprobe}) for nprobe in (1, 4, 16, 64)],
+        *[('ivf_pq', {'nprobe': nprobe}) for nprobe in (1, 4, 16, 64)],
+    ]
+    _, exact_ids = search_index(build_index(vectors, 'flat'), query_vectors, k)
+
+    report = []
+    built = {}
+    for kind, params in configs:
+        if kind not in built:
+            start = time.perf_counter()
+            built[kind] = (build_index(vectors, kind), time.perf_counter() - start)
+        index, build_seconds = built[kind]
+
+        start = time.perf_counter()
+        for query_vector in query_vectors:
+            search_index(index, query_vector, k, **params)
+        latency = (time.perf_counter() - start) / len(query_vectors)
+
+        _, ids = search_index(index, query_vectors, k, **params)
+        hits = sum(len(np.intersect1d(found[found >= 0], exact)) for found, exact in zip(ids, exact_ids))
+        report.append({
+            'index_type': index_type(index),
+            'params': params,
+            'recall': hits / exact_ids.size,
+            'latency_ms': latency * 1000,
+            'build_s': build_seconds,
+            'index_bytes': _faiss().serialize_index(index).nbytes,
+        })
+    return report
+
+def _sample_queries(vectors, count, noise, seed):
+    """Perturbed copies of random rows, normalized like real query embeddings."""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=count, replace=len(vectors) < count)].astype(np.float32)
+    queries += rng.normal(scale=noise, size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recall vs latency of the ANN index types against exact search.")
+    parser.add_argument('store', nargs='?',
+                        help="embedding store directory (e.g. data/st_index/st_1/vectors); random vectors when omitted")
+    parser.add_argument('--count', type=int, default=100000, help="random vectors to generate")
+    parser.add_argument('--dimensions', type=int, default=384, help="dimensions of random vectors")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--noise', type=float, default=0.05, help="perturbation of the sampled queries")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = embedding_store.load_vectors(args.store)
+        if not len(vectors):
+            parser.error(f"no embedding store at {args.store}")
+    else:
+        vectors = np.random.default_rng(0).normal(size=(args.count, args.dimensions)).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    queries = _sample_queries(vectors, args.queries, args.noise, seed=1)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dimensions, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<10}{'params':<18}{'recall':>8}{'ms/query':>10}{'build s':>9}{'MB':>9}")
+    for row in benchmark(vectors, queries, args.k):
+        params = ', '.join(f"{key}={value}" for key, value in row['params'].items())
+        print(f"{row['index_type']:<10}{params:<18}{row['recall']:>8.3f}{row['latency_ms']:>10.3f}"
+              f"{row['build_s']:>9.2f}{row['index_bytes'] / 2 ** 20:>9.1f}")
@@ -1,130 +1,709 @@
+import fcntl
+import hashlib
+import json
+import math
 import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import normalize
+from sklearn.feature_extraction.text import CountVectorizer
 from config.config import DATA_FOLDER
-import re
-import faiss
-from scipy.sparse import csr_matrix
 
+from search import document_store
 from search.syntactic_helper import clear_text, find_snippet, highlight_terms
 
-documents = None
-tfidf_vectorizer = None
-faiss_index = None
-document_paths = None
-document_names = None
-FAISS_INDEX_PATH = os.path.join(DATA_FOLDER, "faiss_bm25_index")
+# The BM25 index is a small LSM tree: immutable segments memory-mapped from
+# BM25_INDEX_PATH/segments plus one in-memory delta segment for recent additions.
+# Deletes from on-disk segments are tombstones until the next merge rewrites them.
+#
+# Each segment holds a sorted vocabulary as a UTF-8 blob plus offsets (local term ids are
+# positions in that order) and CSC postings: for local term t, the local documents containing
+# it are postings_docs[postings_indptr[t]:postings_indptr[t + 1]] with their raw term
+# frequencies in postings_tf. doc_ids maps local documents to global doc ids (ascending).
+#
+# Block-max upper bounds for dynamic pruning: local documents are split into fixed ranges of
+# BLOCK_SIZE ids; for term t, block_ids[block_indptr[t]:block_indptr[t + 1]] lists the ranges
+# holding its postings, block_max_tf / block_min_len the largest term frequency and shortest
+# document in each range, and block_offsets where each range starts in the postings arrays.
+# Lengths rather than precomputed impacts are kept so bounds follow avgdl as the corpus changes.
+#
+# index_state is replaced, never mutated, so searches work on a consistent snapshot.
+# Several worker processes may share the index directory, but only one writes to it: the
+# first process to open it takes a flock on WRITER_LOCK_FILE for its lifetime. The others
+# load the segments on disk and keep their own additions and deletions in memory (their
+# delta is never flushed, their tombstones never saved), since a manifest written from
+# one process's state would drop what another process wrote. Loading, writing and cleanup
+# also hold an exclusive flock on LOCK_FILE, and segments are written in dot-prefixed
+# scratch directories that cleanup never touches.
+index_state = None
+index_path = None
+
+BLOCK_SIZE = 128
+
+BM25_INDEX_PATH = os.path.join(DATA_FOLDER, "bm25_index")
+LOCK_FILE = '.lock'
+WRITER_LOCK_FILE = '.writer'
+INDEX_FORMAT_VERSION = 2
+SEGMENT_ARRAYS = (
+    'term_blob', 'term_offsets', 'doc_ids', 'doc_hashes', 'doc_path_blob', 'doc_path_offsets',
+    'doc_lengths', 'postings_indptr', 'postings_docs', 'postings_tf',
+    'block_indptr', 'block_ids', 'block_max_tf', 'block_min_len', 'block_offsets',
+)
+
+# Segment maintenance
+DELTA_MAX_DOCS = 1000       # The in-memory delta is flushed to disk once it grows past this
+MAX_SEGMENTS = 8            # On-disk segments are merged into one past this count
+MAX_TOMBSTONE_RATIO = 0.2   # ... or once this share of the indexed documents is deleted
 
 # BM25 parameters
 k1 = 1.5
 b = 0.75
 
-def init(docs):
-    global documents, tfidf_vectorizer, faiss_index, document_paths, document_names
-    documents = docs 
-    document_paths = [doc['path'] for doc in docs]
-    document_names = [doc['name'] for doc in docs]
-    
+SEARCH_STRATEGIES = ('exhaustive', 'block_max')
+
+_write_lock = threading.Lock()
+_writer_leases = {}     # Index path -> open WRITER_LOCK_FILE, held until the process exits
+
+def init(docs, path=BM25_INDEX_PATH):
+    """
+    Open the index at path and bring it in line with docs: unchanged documents are
+    served from the memory-mapped segments, new or edited ones are added and
+    missing ones removed. Without a usable index on disk everything is built
+    into a single fresh segment. When another process writes to path, nothing is
+    written and the differences are kept in memory.
+    """
+    global index_state, index_path
+    document_store.add_documents(docs)
+    with _write_lock:
+        writable = _acquire_writer_lease(path)
+        with _index_lock(path):
+            index_path = path
+            manifest = _read_manifest(path)
+
+            if _manifest_matches(manifest, path):
+                print(f"Loading BM25 index from {path}")
+                index_state, indexed_hashes = _load_state(path, manifest)
+                index_state = dict(index_state, writable=writable)
+                _reconcile_locked(docs, indexed_hashes)
+            else:
+                segment = _build_segment(docs, np.arange(len(docs), dtype=np.int64))
+                state = {
+                    'segments': [],
+                    'delta': None,
+                    'delta_docs': [],
+                    'documents': list(docs),
+                    'paths': {doc['path']: doc_id for doc_id, doc in enumerate(docs)},
+                    'tombstones': set(),
+                    'deleted_df': {},
+                    'next_doc_id': len(docs),
+                    'writable': writable,
+                }
+                if writable:
+                    state['segments'] = [_write_segment(path, segment)]
+                elif docs:
+                    state.update(delta=segment, delta_docs=list(enumerate(docs)))
+                index_state = _with_stats(state)
+                if writable:
+                    _write_manifest(path, index_state)
+
+            if writable:
+                _remove_orphan_segments(path, index_state)
+
+    state = index_state
+    print(f"BM25 sparse search initialized with {state['num_docs']} documents in {len(state['segments'])} segments"
+          f"{'' if writable else ' (read-only, another process writes the index)'}.")
+
+def add_documents(docs):
+    """Index docs; a document whose path is already indexed replaces the old version."""
+    document_store.add_documents(docs)
+    with _write_lock:
+        _ensure_initialized(index_state)
+        with _index_lock(index_path):
+            _add_locked(docs)
+
+def remove_documents(paths):
+    """Drop the documents with these paths from the index; unknown paths are ignored."""
+    with _write_lock:
+        _ensure_initialized(index_state)
+        with _index_lock(index_path):
+            _remove_locked(paths)
+
+def merge_segments():
+    """Rewrite every on-disk segment into one, purging tombstoned documents."""
+    with _write_lock:
+        _ensure_initialized(index_state)
+        if not index_state['writable']:
+            print("BM25 segments not merged: another process writes the index.")
+            return
+        with _index_lock(index_path):
+            _merge_locked()
+
+def get_document(path):
+    """The indexed document with this path, or None."""
+    state = index_state
+    if state is None or path not in state['paths']:
+        return None
+    return state['documents'][state['paths'][path]]
+
+def stats():
+    state = index_state
+    if state is None:
+        return {'initialized': False}
+    segments = _all_segments(state)
+    return {
+        'initialized': True,
+        'documents': state['num_docs'],
+        'segments': len(state['segments']),
+        'delta_documents': len(state['delta_docs']),
+        'tombstones': len(state['tombstones']),
+        'writable': state['writable'],
+        'index_bytes': sum(array.nbytes for segment in segments
+                           for name, array in segment.items() if name in SEGMENT_ARRAYS),
+    }
+
+@contextmanager
+def _index_lock(path):
+    """Exclusive lock on the index directory, shared with the other processes using it."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _acquire_writer_lease(path):
+    """True when this process is, or now becomes, the one process writing the index at path."""
+    if path in _writer_leases:
+        return True
+    os.makedirs(path, exist_ok=True)
+    lease = open(os.path.join(path, WRITER_LOCK_FILE), 'a')
+    try:
+        fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lease.close()
+        return False
+    _writer_leases[path] = lease
+    return True
+
+def _ensure_initialized(state):
+    if state is None:
+        raise ValueError("BM25 search not initialized. Call init() first.")
+
+def _add_locked(docs):
+    global index_state
+    replaced = [doc['path'] for doc in docs if doc['path'] in index_state['paths']]
+    if replaced:
+        _remove_locked(replaced)
+
+    state = index_state
+    paths = dict(state['paths'])
+    new_docs = []
+    for offset, doc in enumerate(docs):
+        doc_id = state['next_doc_id'] + offset
+        paths[doc['path']] = doc_id
+        new_docs.append((doc_id, doc))
+
+    state = dict(state, documents=state['documents'] + list(docs), paths=paths,
+                 next_doc_id=state['next_doc_id'] + len(docs))
+    delta_docs = state['delta_docs'] + new_docs
+    delta = _build_segment([doc for _, doc in delta_docs], np.array([doc_id for doc_id, _ in delta_docs]))
+
+    if len(delta_docs) <= DELTA_MAX_DOCS or not state['writable']:
+        index_state = _with_stats(dict(state, delta=delta, delta_docs=delta_docs))
+        return
+
+    # Flush: the delta becomes an immutable on-disk segment
+    segment = _write_segment(index_path, delta)
+    index_state = _with_stats(dict(state, segments=state['segments'] + [segment], delta=None, delta_docs=[]))
+    _write_manifest(index_path, index_state)
+    if len(index_state['segments']) > MAX_SEGMENTS:
+        _merge_locked()
+
+def _remove_locked(paths):
+    global index_state
+    state = index_state
+    doc_ids = {state['paths'][path] for path in paths if path in state['paths']}
+    if not doc_ids:
+        return
+
+    tombstones = set(state['tombstones'])
+    deleted_df = dict(state['deleted_df'])
+    segments = []
+    for segment in state['segments']:
+        local = np.flatnonzero(np.isin(segment['doc_ids'], list(doc_ids)))
+        if len(local):
+            segment = _mark_deleted(segment, local)
+            tombstones.update(int(doc_id) for doc_id in segment['doc_ids'][local])
+            # Keep IDF exact without touching the immutable postings
+            for term, count in _document_terms(segment, local).items():
+                deleted_df[term] = deleted_df.get(term, 0) + count
+        segments.append(segment)
+
+    # The delta is cheap to rebuild, so documents are dropped from it outright
+    delta, delta_docs = state['delta'], state['delta_docs']
+    if any(doc_id in doc_ids for doc_id, _ in delta_docs):
+        delta_docs = [(doc_id, doc) for doc_id, doc in delta_docs if doc_id not in doc_ids]
+        delta = _build_segment([doc for _, doc in delta_docs], np.array([doc_id for doc_id, _ in delta_docs])) if delta_docs else None
+
+    documents = list(state['documents'])
+    for doc_id in doc_ids:
+        documents[doc_id] = None
+    remaining = {path: doc_id for path, doc_id in state['paths'].items() if doc_id not in doc_ids}
+
+    index_state = _with_stats(dict(
+        state, segments=segments, delta=delta, delta_docs=delta_docs, documents=documents,
+        paths=remaining, tombstones=tombstones, deleted_df=deleted_df
+    ))
+
+    if len(tombstones) != len(state['tombstones']) and state['writable']:
+        _write_manifest(index_path, index_state)
+        indexed = sum(len(segment['doc_ids']) for segment in segments)
+        if len(tombstones) > MAX_TOMBSTONE_RATIO * indexed:
+            _merge_locked()
+
+def _merge_locked():
+    global index_state
+    state = index_state
+    live_ids = np.sort(np.concatenate(
+        [segment['doc_ids'][~segment['deleted']] for segment in state['segments']] + [np.empty(0, dtype=np.int64)]
+    ))
+    merged = _write_segment(index_path, _build_segment([state['documents'][doc_id] for doc_id in live_ids], live_ids))
+
+    index_state = _with_stats(dict(state, segments=[merged], tombstones=set(), deleted_df={}))
+    _write_manifest(index_path, index_state)
+    _remove_orphan_segments(index_path, index_state)
+    print(f"BM25 segments merged into one segment of {len(live_ids)} documents.")
+
+def _reconcile_locked(docs, indexed_hashes):
+    """Diff the caller's documents against the loaded index by path and content hash."""
+    global index_state
+    state = index_state
+    incoming = {doc['path']: doc for doc in docs}
+    documents = list(state['documents'])
+    changed = []
+    for path, doc in incoming.items():
+        if indexed_hashes.get(path) == _doc_hash(doc):
+            documents[state['paths'][path]] = doc
+        else:
+            changed.append(doc)
+    index_state = dict(state, documents=documents)
+
+    # Stale versions go first so a merge triggered by the removal never needs their text
+    removed = [path for path in indexed_hashes if path not in incoming]
+    removed += [doc['path'] for doc in changed if doc['path'] in indexed_hashes]
+    if removed:
+        _remove_locked(removed)
+    if changed:
+        _add_locked(changed)
+
+def _document_text(doc):
     # Use the pre-processed content directly
-    processed_docs = [f"{doc['name']} {doc['content']}" for doc in docs]
-    
-    # Use TfidfVectorizer with custom parameters
-    tfidf_vectorizer = TfidfVectorizer(lowercase=False, tokenizer=lambda x: x.split(), use_idf=True, smooth_idf=False, sublinear_tf=False)
-    tfidf_matrix = tfidf_vectorizer.fit_transform(processed_docs)
-    
-    # Extract term frequencies and document frequencies
-    term_freq = tfidf_matrix.copy()
-    term_freq.data = np.ones_like(term_freq.data)  # Set all non-zero elements to 1
-    term_freq = term_freq.multiply(tfidf_matrix)  # Element-wise multiplication to get term frequencies
-    
-    doc_freq = np.bincount(tfidf_matrix.indices, minlength=tfidf_matrix.shape[1])
-    
-    # Calculate document lengths and average document length
-    doc_lengths = term_freq.sum(axis=1).A1
-    avg_doc_length = np.mean(doc_lengths)
-    
-    # Calculate IDF
-    N = len(processed_docs)
-    idf = np.log((N - doc_freq + 0.5) / (doc_freq + 0.5))
-    
-    # Calculate BM25 scores
-    bm25_scores = []
-    for i in range(N):
-        doc_tf = term_freq[i].toarray().flatten()
-        numerator = doc_tf * (k1 + 1)
-        denominator = doc_tf + k1 * (1 - b + b * doc_lengths[i] / avg_doc_length)
-        bm25_scores.append(idf * numerator / denominator)
-    
-    bm25_matrix = np.vstack(bm25_scores)
-    
-    # Normalize BM25 scores
-    bm25_matrix_normalized = normalize(bm25_matrix, norm='l2', axis=1)
-    
-    # Create and train the FAISS index
-    dimension = bm25_matrix_normalized.shape[1]
-    faiss_index = faiss.IndexFlatIP(dimension)  # Inner Product Index
-    faiss_index.add(bm25_matrix_normalized.astype('float32'))
-    
-    # Save the FAISS index
-    faiss.write_index(faiss_index, FAISS_INDEX_PATH)
-    
-    print(f"BM25 FAISS search initialized with {len(documents)} documents.")
-
-def search(query, k=5):
-    if faiss_index is None or tfidf_vectorizer is None:
-        raise ValueError("BM25 FAISS search not initialized. Call init() first.")
-    
-    # Process the query in the same way as the documents
-    processed_query = clear_text(query)
-    
-    # Transform query to TF-IDF vector
-    query_vec = tfidf_vectorizer.transform([processed_query])
-    
-    # Convert to BM25 vector
-    query_tf = query_vec.copy()
-    query_tf.data = np.ones_like(query_tf.data)  # Set all non-zero elements to 1
-    query_tf = query_tf.multiply(query_vec)  # Element-wise multiplication to get term frequencies
-    
-    N = len(documents)
-    doc_freq = np.bincount(query_vec.indices, minlength=query_vec.shape[1])
-    idf = np.log((N - doc_freq + 0.5) / (doc_freq + 0.5))
-    
-    query_tf = query_tf.toarray().flatten()
-    numerator = query_tf * (k1 + 1)
-    denominator = query_tf + k1
-    query_bm25 = idf * numerator / denominator
-    
-    query_bm25_normalized = normalize(query_bm25.reshape(1, -1), norm='l2')
-    
-    # Perform the search
-    scores, indices = faiss_index.search(query_bm25_normalized.astype('float32'), k)
-    
+    return f"{doc['name']} {doc['content']}"
+
+def _doc_hash(doc):
+    digest = hashlib.blake2b(digest_size=8)
+    for field in (doc['path'], doc['name'], doc['content']):
+        digest.update(field.encode('utf-8'))
+        digest.update(b'\0')
+    return int.from_bytes(digest.digest(), 'little')
+
+def _document_terms(segment, local_ids):
+    """{term: number of the given local documents containing it}, read back from the postings."""
+    positions = np.flatnonzero(np.isin(segment['postings_docs'], local_ids))
+    term_ids = np.searchsorted(segment['postings_indptr'], positions, side='right') - 1
+    term_ids, counts = np.unique(term_ids, return_counts=True)
+    return {
+        _unpack_string(segment['term_blob'], segment['term_offsets'], term_id): int(count)
+        for term_id, count in zip(term_ids, counts)
+    }
+
+def _build_segment(docs, doc_ids):
+    segment = {}
+    segment['doc_path_blob'], segment['doc_path_offsets'] = _pack_strings(doc['path'] for doc in docs)
+    segment['doc_ids'] = np.asarray(doc_ids, dtype=np.int64)
+    segment['doc_hashes'] = np.array([_doc_hash(doc) for doc in docs], dtype=np.uint64)
+
+    if docs:
+        # Raw term counts, documents x vocabulary, stored sparse. Features come out sorted,
+        # which is what the binary search in _term_id relies on.
+        count_vectorizer = CountVectorizer(lowercase=False, tokenizer=str.split, token_pattern=None, dtype=np.float32)
+        term_freq = count_vectorizer.fit_transform([_document_text(doc) for doc in docs])
+        segment['term_blob'], segment['term_offsets'] = _pack_strings(count_vectorizer.get_feature_names_out())
+
+        # Column-major layout turns every vocabulary column into a posting list
+        postings = term_freq.tocsc()
+        postings.sort_indices()
+        segment['postings_indptr'] = postings.indptr.astype(np.int64)
+        segment['postings_docs'] = postings.indices.astype(np.int32)
+        segment['postings_tf'] = postings.data.astype(np.float32)
+        segment['doc_lengths'] = np.asarray(term_freq.sum(axis=1)).ravel().astype(np.float32)
+    else:
+        segment['term_blob'], segment['term_offsets'] = _pack_strings([])
+        segment['postings_indptr'] = np.zeros(1, dtype=np.int64)
+        segment['postings_docs'] = np.empty(0, dtype=np.int32)
+        segment['postings_tf'] = np.empty(0, dtype=np.float32)
+        segment['doc_lengths'] = np.empty(0, dtype=np.float32)
+
+    segment.update(_build_block_maxes(segment['postings_indptr'], segment['postings_docs'],
+                                      segment['postings_tf'], segment['doc_lengths']))
+    return _with_segment_stats(dict(segment, name=None, deleted=np.zeros(len(docs), dtype=bool)))
+
+def _build_block_maxes(postings_indptr, postings_docs, postings_tf, doc_lengths):
+    vocab_size = len(postings_indptr) - 1
+    posting_terms = np.repeat(np.arange(vocab_size), np.diff(postings_indptr))
+    posting_blocks = postings_docs // BLOCK_SIZE
+
+    # A new block entry starts wherever the (term, doc range) pair changes
+    boundaries = np.ones(len(postings_docs), dtype=bool)
+    boundaries[1:] = (posting_terms[1:] != posting_terms[:-1]) | (posting_blocks[1:] != posting_blocks[:-1])
+    starts = np.flatnonzero(boundaries)
+
+    block_indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(posting_terms[starts], minlength=vocab_size), out=block_indptr[1:])
+    if not len(starts):
+        return {
+            'block_indptr': block_indptr,
+            'block_ids': np.empty(0, dtype=np.int32),
+            'block_max_tf': np.empty(0, dtype=np.float32),
+            'block_min_len': np.empty(0, dtype=np.float32),
+            'block_offsets': np.zeros(1, dtype=np.int64),
+        }
+    return {
+        'block_indptr': block_indptr,
+        'block_ids': posting_blocks[starts].astype(np.int32),
+        'block_max_tf': np.maximum.reduceat(postings_tf, starts),
+        'block_min_len': np.minimum.reduceat(doc_lengths[postings_docs], starts),
+        'block_offsets': np.append(starts, len(postings_docs)).astype(np.int64),
+    }
+
+def _mark_deleted(segment, local_ids):
+    deleted = segment['deleted'].copy()
+    deleted[local_ids] = True
+    return _with_segment_stats(dict(segment, deleted=deleted))
+
+def _with_segment_stats(segment):
+    live = ~segment['deleted']
+    return dict(segment, live_docs=int(live.sum()), live_length=float(segment['doc_lengths'][live].sum()))
+
+def _with_stats(state):
+    """Recompute N and avgdl from the per-segment live counts."""
+    segments = _all_segments(state)
+    num_docs = sum(segment['live_docs'] for segment in segments)
+    total_length = sum(segment['live_length'] for segment in segments)
+    return dict(state, num_docs=num_docs, avg_doc_length=total_length / num_docs if num_docs else 0.0)
+
+def _all_segments(state):
+    return state['segments'] + ([state['delta']] if state['delta'] is not None else [])
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _manifest_matches(manifest, path):
+    if not manifest:
+        return False
+    expected = {'version': INDEX_FORMAT_VERSION, 'k1': k1, 'b': b, 'block_size': BLOCK_SIZE}
+    if any(manifest.get(key) != value for key, value in expected.items()):
+        return False
+    return all(
+        os.path.exists(os.path.join(path, 'segments', name, f"{array}.npy"))
+        for name in manifest['segments'] for array in SEGMENT_ARRAYS
+    )
+
+def _write_manifest(path, state):
+    manifest = {
+        'version': INDEX_FORMAT_VERSION,
+        'k1': k1,
+        'b': b,
+        'block_size': BLOCK_SIZE,
+        'segments': [segment['name'] for segment in state['segments']],
+        'tombstones': sorted(state['tombstones']),
+        'deleted_df': state['deleted_df'],
+        'next_doc_id': state['next_doc_id'],
+    }
+    scratch = os.path.join(path, f".manifest.{uuid.uuid4().hex}.json")
+    with open(scratch, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(scratch, os.path.join(path, 'manifest.json'))
+
+def _write_segment(path, segment):
+    """Write into a scratch directory and rename it, so readers never see a partial segment."""
+    segments_dir = os.path.join(path, 'segments')
+    os.makedirs(segments_dir, exist_ok=True)
+    name = uuid.uuid4().hex
+    scratch = tempfile.mkdtemp(prefix='.segment_', dir=segments_dir)
+    try:
+        for array in SEGMENT_ARRAYS:
+            np.save(os.path.join(scratch, f"{array}.npy"), segment[array])
+        os.rename(scratch, os.path.join(segments_dir, name))
+    except OSError:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return _load_segment(path, name, segment['deleted'])
+
+def _load_segment(path, name, deleted):
+    directory = os.path.join(path, 'segments', name)
+    segment = {array: np.load(os.path.join(directory, f"{array}.npy"), mmap_mode='r') for array in SEGMENT_ARRAYS}
+    return _with_segment_stats(dict(segment, name=name, deleted=deleted))
+
+def _load_state(path, manifest):
+    """Map every segment listed in the manifest; documents are attached by _reconcile_locked."""
+    tombstones = set(manifest['tombstones'])
+    segments = []
+    paths, indexed_hashes = {}, {}
+    for name in manifest['segments']:
+        segment = np.load(os.path.join(path, 'segments', name, 'doc_ids.npy'), mmap_mode='r')
+        segment = _load_segment(path, name, np.isin(segment, list(tombstones)))
+        for local in np.flatnonzero(~segment['deleted']):
+            doc_path = _unpack_string(segment['doc_path_blob'], segment['doc_path_offsets'], local)
+            paths[doc_path] = int(segment['doc_ids'][local])
+            indexed_hashes[doc_path] = int(segment['doc_hashes'][local])
+        segments.append(segment)
+
+    state = _with_stats({
+        'segments': segments,
+        'delta': None,
+        'delta_docs': [],
+        'documents': [None] * manifest['next_doc_id'],
+        'paths': paths,
+        'tombstones': tombstones,
+        'deleted_df': manifest['deleted_df'],
+        'next_doc_id': manifest['next_doc_id'],
+    })
+    return state, indexed_hashes
+
+def _remove_orphan_segments(path, state):
+    """
+    Delete segment directories the manifest no longer references (merged or abandoned).
+    Called with the index lock held, right after this state's manifest was written;
+    dot-prefixed scratch directories of segments being written are left alone.
+    """
+    segments_dir = os.path.join(path, 'segments')
+    if not os.path.isdir(segments_dir):
+        return
+    live = {segment['name'] for segment in state['segments']}
+    for name in os.listdir(segments_dir):
+        # Workers that already mapped the old files keep their pages after the unlink
+        if name not in live and not name.startswith('.'):
+            shutil.rmtree(os.path.join(segments_dir, name), ignore_errors=True)
+
+def _pack_strings(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def _unpack_string(blob, offsets, i):
+    return blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+def _term_id(segment, term):
+    """Binary search the segment's sorted vocabulary blob; None when the term is unknown."""
+    term_blob, term_offsets = segment['term_blob'], segment['term_offsets']
+    key = term.encode('utf-8')
+    lo, hi = 0, len(term_offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        candidate = term_blob[term_offsets[mid]:term_offsets[mid + 1]].tobytes()
+        if candidate < key:
+            lo = mid + 1
+        elif candidate > key:
+            hi = mid
+        else:
+            return mid
+    return None
+
+def _idf(doc_freq, N):
+    # Lucene-style IDF, never negative so common terms can only add to a score
+    return math.log1p((N - doc_freq + 0.5) / (doc_freq + 0.5))
+
+def _query_terms(query, state):
+    """
+    Resolve the processed query against every segment.
+    Returns the segments and, per segment, a list of (weight, local term id) pairs
+    where weight is the global idf times the saturated query term frequency.
+    """
+    counts = {}
+    for token in clear_text(query).split():
+        counts[token] = counts.get(token, 0) + 1
+
+    segments = _all_segments(state)
+    per_segment = [[] for _ in segments]
+    for term, qtf in counts.items():
+        local_ids = [_term_id(segment, term) for segment in segments]
+        doc_freq = sum(
+            int(segment['postings_indptr'][term_id + 1] - segment['postings_indptr'][term_id])
+            for segment, term_id in zip(segments, local_ids) if term_id is not None
+        ) - state['deleted_df'].get(term, 0)
+        if doc_freq <= 0:
+            continue
+
+        weight = _idf(doc_freq, state['num_docs']) * (qtf * (k1 + 1)) / (qtf + k1)
+        for terms, term_id in zip(per_segment, local_ids):
+            if term_id is not None:
+                terms.append((weight, term_id))
+    return segments, per_segment
+
+def _score_segment(segment, terms, avg_length, in_batch=None):
+    """
+    Accumulate BM25 scores over the query terms' postings in one segment,
+    restricted to the block ranges flagged in in_batch when given.
+    Returns global doc ids and scores of the live documents touched.
+    """
+    scores = np.zeros(len(segment['doc_ids']), dtype=np.float32)
+    touched = []
+    for weight, term_id in terms:
+        if in_batch is None:
+            selected = slice(segment['postings_indptr'][term_id], segment['postings_indptr'][term_id + 1])
+        else:
+            start, end = segment['block_indptr'][term_id], segment['block_indptr'][term_id + 1]
+            entries = np.flatnonzero(in_batch[segment['block_ids'][start:end]]) + start
+            if not len(entries):
+                continue
+            selected = _ranges(segment['block_offsets'][entries], segment['block_offsets'][entries + 1])
+        docs = segment['postings_docs'][selected]
+        tf = segment['postings_tf'][selected]
+        norms = k1 * (1 - b + b * segment['doc_lengths'][docs] / avg_length)
+        scores[docs] += weight * tf * (k1 + 1) / (tf + norms)
+        touched.append(docs)
+
+    if not touched:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    local = np.unique(np.concatenate(touched))
+    local = local[~segment['deleted'][local]]
+    return segment['doc_ids'][local], scores[local]
+
+def _score_exhaustive(state, query, k):
+    """Score every posting of the query terms in every segment."""
+    segments, per_segment = _query_terms(query, state)
+    doc_ids, scores = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float32)]
+    for segment, terms in zip(segments, per_segment):
+        segment_ids, segment_scores = _score_segment(segment, terms, state['avg_doc_length'])
+        doc_ids.append(segment_ids)
+        scores.append(segment_scores)
+    return _top_k(np.concatenate(doc_ids), np.concatenate(scores), k)
+
+def _ranges(starts, ends):
+    """Concatenate np.arange(start, end) for every (start, end) pair."""
+    lengths = ends - starts
+    return np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+
+def _score_block_max(state, query, k):
+    """
+    Exact top-k with block-max dynamic pruning.
+    Document ranges of all segments are visited in decreasing order of their score
+    upper bound (the sum of the query terms' block maxima) and scoring stops as
+    soon as the next range cannot beat the current k-th best score.
+    """
+    segments, per_segment = _query_terms(query, state)
+    avg_length = state['avg_doc_length']
+
+    block_segments = [np.empty(0, dtype=np.int64)]
+    block_numbers = [np.empty(0, dtype=np.int64)]
+    bounds = [np.empty(0, dtype=np.float64)]
+    for segment_index, (segment, terms) in enumerate(zip(segments, per_segment)):
+        upper_bounds = np.zeros((len(segment['doc_ids']) + BLOCK_SIZE - 1) // BLOCK_SIZE, dtype=np.float64)
+        for weight, term_id in terms:
+            start, end = segment['block_indptr'][term_id], segment['block_indptr'][term_id + 1]
+            max_tf = segment['block_max_tf'][start:end]
+            min_norm = k1 * (1 - b + b * segment['block_min_len'][start:end] / avg_length)
+            upper_bounds[segment['block_ids'][start:end]] += weight * max_tf * (k1 + 1) / (max_tf + min_norm)
+        blocks = np.flatnonzero(upper_bounds > 0)
+        block_segments.append(np.full(len(blocks), segment_index))
+        block_numbers.append(blocks)
+        bounds.append(upper_bounds[blocks])
+
+    block_segments = np.concatenate(block_segments)
+    block_numbers = np.concatenate(block_numbers)
+    bounds = np.concatenate(bounds)
+    order = np.argsort(-bounds, kind='stable')
+
+    best_ids = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    position, batch_size = 0, 4
+
+    while position < len(order):
+        # Small slack so float32 rounding in the exact scores never outruns the bound
+        if len(best_ids) >= k and bounds[order[position]] * (1 + 1e-6) < best_scores[-1]:
+            break
+
+        batch = order[position:position + batch_size]
+        position += batch_size
+        batch_size *= 2
+
+        for segment_index in np.unique(block_segments[batch]):
+            segment = segments[segment_index]
+            in_batch = np.zeros((len(segment['doc_ids']) + BLOCK_SIZE - 1) // BLOCK_SIZE, dtype=bool)
+            in_batch[block_numbers[batch][block_segments[batch] == segment_index]] = True
+            segment_ids, segment_scores = _score_segment(segment, per_segment[segment_index], avg_length, in_batch)
+            best_ids, best_scores = _top_k(
+                np.concatenate([best_ids, segment_ids]),
+                np.concatenate([best_scores, segment_scores]),
+                k
+            )
+
+    return best_ids, best_scores
+
+def _top_k(doc_ids, scores, k):
+    """Top k by score descending, ties broken by ascending doc id."""
+    if k <= 0:
+        return doc_ids[:0], scores[:0]
+    if len(doc_ids) > k:
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        keep = scores >= threshold
+        doc_ids, scores = doc_ids[keep], scores[keep]
+
+    order = np.lexsort((doc_ids, -scores))[:k]
+    return doc_ids[order], scores[order]
+
+def search(query, k=5, strategy='exhaustive'):
+    """
+    strategy='exhaustive' scores every posting of the query terms,
+    strategy='block_max' returns the same top k while skipping document
+    ranges that cannot make it into the result.
+    """
+    state = index_state
+    _ensure_initialized(state)
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown BM25 search strategy: {strategy}")
+
+    if state['num_docs'] == 0:
+        return []
+    if strategy == 'block_max':
+        doc_ids, scores = _score_block_max(state, query, k)
+    else:
+        doc_ids, scores = _score_exhaustive(state, query, k)
+
+    # BM25 scores are unbounded; relevance is reported on the 0-100 scale the other engines
+    # and the fusion methods use, relative to the best match
+    top_score = float(scores[0]) if len(scores) else 0.0
+    relevance = scores / top_score * 100 if top_score > 0 else np.zeros(len(scores))
+
     results = []
-    for i, idx in enumerate(indices[0]):
-        doc = documents[idx]
+    for idx, relevance_score in zip(doc_ids, relevance):
+        doc = state['documents'][idx]
         content = doc['content']
-        original_content = doc['original_content']
-        content_length = len(original_content)
-        
+        content_length = len(doc['original_content'])
+
+        # Only the snippet is highlighted here; the full body is highlighted on demand
         content_snippet = find_snippet(content, query)
-        
-        highlighted_content = highlight_terms(original_content, query)
         highlighted_name = highlight_terms(doc['name'], query)
-        
-        relevance_score = float(scores[0][i])
-        
+
         results.append({
+            "doc_id": document_store.doc_id(doc['path']),
             "path": doc['path'],
             "highlighted_name": highlighted_name,
             "content_snippet": content_snippet,
-            "content": content,
-            "original_content": original_content,
-            "highlighted_content": highlighted_content,
+            "name": doc['name'],
             "content_length": content_length,
-            "relevance_score": relevance_score,
+            "relevance_score": float(relevance_score),
         })
-    
-    return results
-
 
+    return results
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from config.config import DATA_FOLDER
+
+# Documents shared by every search engine, addressed by integer doc ids. Ids are stable:
+# a path keeps its id while it stays indexed (also across restarts, the id assignment is
+# saved to DOCUMENT_STORE_PATH) so indexes persisted by the engines can refer to documents
+# by id. Ids of removed documents are not reused. version() changes whenever a document
+# is added, edited or removed, and is the same for the same corpus across restarts.
+#
+# store_state is replaced, never mutated, so readers work on a consistent snapshot.
+store_state = None
+store_path = None
+
+DOCUMENT_STORE_PATH = os.path.join(DATA_FOLDER, "document_store.json")
+
+_write_lock = threading.Lock()
+
+def init(docs, path=DOCUMENT_STORE_PATH):
+    """Hold exactly docs; paths seen before keep their saved ids."""
+    global store_state, store_path
+    with _write_lock:
+        store_path = path
+        saved_paths = _read_ids(path)
+        state = {
+            'documents': [None] * len(saved_paths),
+            'hashes': [0] * len(saved_paths),
+            'version': 0,
+            'paths': {},
+            'saved_paths': saved_paths,
+        }
+        state = _with_documents(state, docs)
+        # Ids that were saved but are not in docs are retired
+        state['saved_paths'] = [doc['path'] if doc is not None else None for doc in state['documents']]
+        _write_ids(path, state['saved_paths'])
+        store_state = state
+    print(f"Document store initialized with {len(state['paths'])} documents.")
+
+def add_documents(docs):
+    """Store docs (replacing documents with the same path) and return their doc ids in order."""
+    global store_state
+    with _write_lock:
+        state = store_state if store_state is not None else {
+            'documents': [], 'hashes': [], 'version': 0, 'paths': {}, 'saved_paths': []
+        }
+        new_state = _with_documents(state, docs)
+        if new_state['saved_paths'] != state['saved_paths'] and store_path is not None:
+            _write_ids(store_path, new_state['saved_paths'])
+        store_state = new_state
+        return [new_state['paths'][doc['path']] for doc in docs]
+
+def remove_documents(paths):
+    """Drop the documents with these paths; unknown paths are ignored."""
+    global store_state
+    with _write_lock:
+        state = store_state
+        if state is None:
+            return
+        documents = list(state['documents'])
+        hashes = list(state['hashes'])
+        version = state['version']
+        known = dict(state['paths'])
+        for path in paths:
+            doc_id = known.pop(path, None)
+            if doc_id is not None:
+                documents[doc_id] = None
+                version ^= hashes[doc_id]
+                hashes[doc_id] = 0
+        saved_paths = [doc['path'] if doc is not None else None for doc in documents]
+        if store_path is not None:
+            _write_ids(store_path, saved_paths)
+        store_state = {'documents': documents, 'hashes': hashes, 'version': version,
+                       'paths': known, 'saved_paths': saved_paths}
+
+def _with_documents(state, docs):
+    documents = list(state['documents'])
+    hashes = list(state['hashes'])
+    version = state['version']
+    paths = dict(state['paths'])
+    saved_paths = list(state['saved_paths'])
+    saved_ids = {path: doc_id for doc_id, path in enumerate(saved_paths) if path is not None}
+
+    for doc in docs:
+        doc_id = paths.get(doc['path'], saved_ids.get(doc['path']))
+        if doc_id is None:
+            doc_id = len(documents)
+            documents.append(None)
+            hashes.append(0)
+            saved_paths.append(doc['path'])
+        # The version is the XOR of the document hashes, so it is updated in O(1) per document
+        doc_hash = _doc_hash(doc)
+        version ^= hashes[doc_id] ^ doc_hash
+        hashes[doc_id] = doc_hash
+        documents[doc_id] = doc
+        paths[doc['path']] = doc_id
+    return {'documents': documents, 'hashes': hashes, 'version': version,
+            'paths': paths, 'saved_paths': saved_paths}
+
+def _doc_hash(doc):
+    digest = hashlib.blake2b(digest_size=8)
+    for field in (doc['path'], doc['name'], doc['original_content']):
+        digest.update(field.encode('utf-8'))
+        digest.update(b'\0')
+    return int.from_bytes(digest.digest(), 'little')
+
+def _read_ids(path):
+    """Saved paths by doc id (None for retired ids)."""
+    try:
+        with open(path) as f:
+            return json.load(f)['paths']
+    except (OSError, ValueError, KeyError):
+        return []
+
+def _write_ids(path, saved_paths):
+    directory = os.path.dirname(path) or '.'
+    scratch = os.path.join(directory, f".document_store.{uuid.uuid4().hex}.json")
+    with open(scratch, 'w') as f:
+        json.dump({'paths': saved_paths}, f)
+    os.replace(scratch, path)
+
+def version():
+    """Identifies the stored corpus; None before the store is initialized."""
+    state = store_state
+    if state is None:
+        return None
+    return f"{state['version']:016x}"
+
+def doc_id(path):
+    """The doc id of the document with this path, or None."""
+    state = store_state
+    if state is None:
+        return None
+    return state['paths'].get(path)
+
+def get(doc_id):
+    """The document with this doc id, or None."""
+    state = store_state
+    if state is None or not 0 <= doc_id < len(state['documents']):
+        return None
+    return state['documents'][doc_id]
+
+def path(doc_id):
+    """The path of the document with this doc id, or None."""
+    doc = get(doc_id)
+    return doc['path'] if doc is not None else None
+
+def get_document(path):
+    """The document with this path, or None."""
+    state = store_state
+    if state is None or path not in state['paths']:
+        return None
+    return state['documents'][state['paths'][path]]
+
+def stats():
+    state = store_state
+    if state is None:
+        return {'initialized': False}
+    return {
+        'initialized': True,
+        'documents': len(state['paths']),
+        'ids': len(state['documents']),
+    }
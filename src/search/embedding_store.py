@@ -0,0 +1,192 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from search import embeddings as embedding_backend
+
+# Chunk embeddings on disk, keyed by a hash of the chunk text, so an index rebuild only
+# embeds chunks it has not seen before. Vectors live in immutable segments under
+# <path>/segments/<name>/{hashes,vectors,scales}.npy; every sync that embeds something
+# writes one new segment (the delta) and the manifest lists the live segments.
+# Once too many rows belong to chunks that are gone, or there are too many segments,
+# the live rows are compacted into a single segment.
+#
+# Several worker processes may share a store: sync runs under an exclusive flock on
+# LOCK_FILE and starts from the manifest on disk, and segments are written in
+# dot-prefixed scratch directories that cleanup never touches.
+LOCK_FILE = '.lock'
+MAX_SEGMENTS = 16
+MAX_DEAD_RATIO = 0.3
+
+def chunk_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def open_store(path, dtype='float32'):
+    """The store at path (empty when missing or saved with another dtype)."""
+    manifest = _read_manifest(path)
+    segments = []
+    if manifest is not None and manifest.get('dtype') == dtype:
+        try:
+            segments = [_load_segment(path, name) for name in manifest['segments']]
+        except (OSError, ValueError):
+            segments = []
+    return _with_positions({'path': path, 'dtype': dtype, 'segments': segments})
+
+def _with_positions(store):
+    positions = {}
+    for segment_index, segment in enumerate(store['segments']):
+        for row, hash_value in enumerate(segment['hashes'].tolist()):
+            positions[hash_value] = (segment_index, row)
+    return dict(store, positions=positions)
+
+def sync(store, texts, embed):
+    """
+    (store, float32 vectors of texts in order, number of texts embedded). Only texts
+    whose hash is not stored are passed to embed(texts) -> float32 rows; rows of texts
+    no longer passed in are dropped at the next compaction. Segments another process
+    added since store was opened are picked up rather than overwritten.
+    """
+    with _store_lock(store['path']):
+        return _sync_locked(_latest(store), texts, embed)
+
+def _sync_locked(store, texts, embed):
+    hashes = [chunk_hash(text) for text in texts]
+
+    missing = {}
+    for text, hash_value in zip(texts, hashes):
+        if hash_value not in store['positions'] and hash_value not in missing:
+            missing[hash_value] = text
+    if missing:
+        vectors = np.asarray(embed(list(missing.values())), dtype=np.float32)
+        stored, scales = embedding_backend.quantize(vectors, store['dtype'])
+        segment = {
+            'name': uuid.uuid4().hex,
+            'hashes': np.fromiter(missing.keys(), dtype=np.uint64, count=len(missing)),
+            'vectors': stored,
+            'scales': scales,
+        }
+        _write_segment(store['path'], segment)
+        store = _with_positions(dict(store, segments=store['segments'] + [segment]))
+
+    live = set(hashes)
+    total_rows = sum(len(segment['hashes']) for segment in store['segments'])
+    compact = len(store['segments']) > MAX_SEGMENTS or total_rows - len(live) > MAX_DEAD_RATIO * total_rows
+    if compact:
+        store = _compact(store, live)
+
+    if missing or compact:
+        _write_manifest(store['path'], store)
+        _remove_orphan_segments(store['path'], store)
+    return store, gather(store, hashes), len(missing)
+
+@contextmanager
+def _store_lock(path):
+    """Exclusive lock on the store directory, shared with the other processes using it."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _latest(store):
+    """store, or the store on disk when another process has changed it since."""
+    manifest = _read_manifest(store['path'])
+    if manifest is None or manifest.get('dtype') != store['dtype']:
+        return store
+    if manifest['segments'] == [segment['name'] for segment in store['segments']]:
+        return store
+    return open_store(store['path'], store['dtype'])
+
+def gather(store, hashes):
+    """Float32 vectors of the stored hashes, in order."""
+    if not hashes:
+        return np.empty((0, 0), dtype=np.float32)
+    locations = np.array([store['positions'][hash_value] for hash_value in hashes], dtype=np.int64)
+    dimensions = store['segments'][0]['vectors'].shape[1]
+    vectors = np.empty((len(hashes), dimensions), dtype=np.float32)
+    for segment_index, segment in enumerate(store['segments']):
+        mask = locations[:, 0] == segment_index
+        if not mask.any():
+            continue
+        rows = locations[mask, 1]
+        block = segment['vectors'][rows].astype(np.float32)
+        if segment['scales'] is not None:
+            block *= segment['scales'][rows][:, None]
+        vectors[mask] = block
+    return vectors
+
+def load_vectors(path):
+    """Float32 vectors of every chunk in the store at path, whatever dtype it was saved with."""
+    manifest = _read_manifest(path)
+    if manifest is None:
+        return np.empty((0, 0), dtype=np.float32)
+    store = open_store(path, manifest['dtype'])
+    return gather(store, list(store['positions']))
+
+def _compact(store, live):
+    """Rewrite the rows of live hashes into one segment."""
+    live = np.fromiter(live, dtype=np.uint64, count=len(live))
+    kept = [(segment, np.isin(segment['hashes'], live)) for segment in store['segments']]
+    kept = [(segment, keep) for segment, keep in kept if keep.any()]
+    if not kept:
+        return _with_positions(dict(store, segments=[]))
+
+    scaled = kept[0][0]['scales'] is not None
+    segment = {
+        'name': uuid.uuid4().hex,
+        'hashes': np.concatenate([segment['hashes'][keep] for segment, keep in kept]),
+        'vectors': np.concatenate([segment['vectors'][keep] for segment, keep in kept]),
+        'scales': np.concatenate([segment['scales'][keep] for segment, keep in kept]) if scaled else None,
+    }
+    _write_segment(store['path'], segment)
+    return _with_positions(dict(store, segments=[segment]))
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(path, store):
+    os.makedirs(path, exist_ok=True)
+    scratch = os.path.join(path, f".manifest.{uuid.uuid4().hex}.json")
+    with open(scratch, 'w') as f:
+        json.dump({'dtype': store['dtype'], 'segments': [segment['name'] for segment in store['segments']]}, f)
+    os.replace(scratch, os.path.join(path, 'manifest.json'))
+
+def _write_segment(path, segment):
+    """Write into a scratch directory and rename it, so readers never see a partial segment."""
+    segments_dir = os.path.join(path, 'segments')
+    os.makedirs(segments_dir, exist_ok=True)
+    scratch = os.path.join(segments_dir, f".{segment['name']}")
+    os.makedirs(scratch)
+    np.save(os.path.join(scratch, 'hashes.npy'), segment['hashes'])
+    np.save(os.path.join(scratch, 'vectors.npy'), segment['vectors'])
+    if segment['scales'] is not None:
+        np.save(os.path.join(scratch, 'scales.npy'), segment['scales'])
+    os.replace(scratch, os.path.join(segments_dir, segment['name']))
+
+def _load_segment(path, name):
+    directory = os.path.join(path, 'segments', name)
+    scales_path = os.path.join(directory, 'scales.npy')
+    return {
+        'name': name,
+        'hashes': np.load(os.path.join(directory, 'hashes.npy')),
+        'vectors': np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r'),
+        'scales': np.load(scales_path) if os.path.exists(scales_path) else None,
+    }
+
+def _remove_orphan_segments(path, store):
+    segments_dir = os.path.join(path, 'segments')
+    live = {segment['name'] for segment in store['segments']}
+    for name in os.listdir(segments_dir) if os.path.isdir(segments_dir) else []:
+        # Dot-prefixed directories are segments another process is still writing
+        if name not in live and not name.startswith('.'):
+            shutil.rmtree(os.path.join(segments_dir, name), ignore_errors=True)
@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from config.config import (
+    EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_DEVICE,
+    QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL,
+)
+
+# Local embedding backend shared by the sentence-transformer engines: models run on CPU
+# (PyTorch or ONNX Runtime), documents are encoded in batches and vectors can be stored as
+# float16 or int8 to cut memory. Vectors are L2-normalized, so dot products are cosines.
+VECTOR_DTYPES = ('float32', 'float16', 'int8')
+
+# Rows scored per step when stored vectors have to be widened to float32
+SCORE_BLOCK_ROWS = 65536
+
+_models = {}
+_model_lock = threading.Lock()
+
+# Query embeddings of every semantic engine, keyed by (model, normalized query):
+# {key: (expires_at, embedding)} in least to most recently used order. Concurrent
+# requests for a key that is being computed wait for that computation (single flight).
+_query_cache = OrderedDict()
+_in_flight = {}
+_query_cache_lock = threading.Lock()
+_query_cache_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+def load_model(model_name):
+    """One SentenceTransformer per model name, loaded on first use (the import is slow)."""
+    with _model_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            options = {'backend': EMBEDDING_BACKEND} if EMBEDDING_BACKEND != 'torch' else {}
+            _models[model_name] = SentenceTransformer(model_name, device=EMBEDDING_DEVICE, **options)
+        return _models[model_name]
+
+def encode(model_name, texts):
+    """Normalized float32 embeddings of texts, encoded in batches of EMBEDDING_BATCH_SIZE."""
+    return np.asarray(load_model(model_name).encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    ), dtype=np.float32)
+
+def normalize_query(text):
+    """Queries that only differ in case, Unicode form or spacing share an embedding."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip().casefold()
+
+def query_embedding(model_key, text, compute, timeout=None):
+    """
+    compute(normalized text) for this model, served from the query cache while fresh.
+    Identical queries arriving while it runs wait for its result instead of computing
+    again, for at most timeout seconds (TimeoutError).
+    """
+    normalized = normalize_query(text)
+    key = (model_key, normalized)
+    with _query_cache_lock:
+        entry = _query_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _query_cache.move_to_end(key)
+            _query_cache_stats['hits'] += 1
+            return entry[1]
+        flight = _in_flight.get(key)
+        if flight is None:
+            flight = _in_flight[key] = {'done': threading.Event(), 'value': None, 'error': None}
+            leader = True
+            _query_cache_stats['misses'] += 1
+        else:
+            leader = False
+            _query_cache_stats['coalesced'] += 1
+
+    if not leader:
+        if not flight['done'].wait(timeout):
+            raise TimeoutError(f"Query embedding with {model_key} did not finish within {timeout}s")
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['value']
+
+    try:
+        embedding = np.asarray(compute(normalized), dtype=np.float32)
+        embedding.flags.writeable = False
+        flight['value'] = embedding
+    except BaseException as e:
+        flight['error'] = e
+        raise
+    finally:
+        with _query_cache_lock:
+            del _in_flight[key]
+            if flight['error'] is None:
+                _query_cache[key] = (time.monotonic() + QUERY_EMBEDDING_CACHE_TTL, flight['value'])
+                _query_cache.move_to_end(key)
+                while len(_query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                    _query_cache.popitem(last=False)
+        flight['done'].set()
+    return embedding
+
+def query_cache_stats():
+    with _query_cache_lock:
+        return dict(_query_cache_stats, entries=len(_query_cache), in_flight=len(_in_flight))
+
+def encode_query(model_name, text, prefix='', timeout=None):
+    """
+    Embedding of a single query (prefix is prepended for models that want an instruction).
+    A local encode cannot be interrupted, so timeout only bounds waiting for an identical
+    query that is already being encoded.
+    """
+    return query_embedding(model_name, text, lambda normalized: encode(model_name, [prefix + normalized])[0],
+                           timeout=timeout)
+
+def quantize(vectors, dtype):
+    """
+    (stored vectors, per-row scales or None). int8 keeps each row scaled so its largest
+    component maps to 127; float16 and float32 are stored as is.
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+    if dtype != 'int8':
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    stored = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return stored, scales.astype(np.float32)
+
+def similarities(stored, scales, query_embedding):
+    """Dot product of the query with every stored row, widening at most SCORE_BLOCK_ROWS rows at a time."""
+    if stored.dtype == np.float32:
+        return stored @ query_embedding
+    scores = np.empty(len(stored), dtype=np.float32)
+    for start in range(0, len(stored), SCORE_BLOCK_ROWS):
+        block = stored[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+        scores[start:start + len(block)] = block @ query_embedding
+    if scales is not None:
+        scores *= scales
+    return scores
@@ -0,0 +1,205 @@
+import threading
+import time
+from functools import partial
+from config.config import SEARCH_LAZY_ENGINES, SEARCH_REQUIRED_ENGINES
+from search import document_store, embeddings
+
+# Every search engine is registered here with what it costs to bring up. At startup
+# engines with a low init cost are initialized before serving, the others are warmed up
+# one by one on a background thread, and engines listed in SEARCH_LAZY_ENGINES are only
+# loaded the first time a search asks for them. Searches skip engines that are not ready.
+# The service is ready once the engines in SEARCH_REQUIRED_ENGINES are.
+# Documents leave the corpus through remove_documents, which updates the document store
+# and every engine.
+engines = {}
+
+INIT_COSTS = ('low', 'medium', 'high')
+STATUSES = ('pending', 'loading', 'ready', 'failed')
+
+documents = None
+_lock = threading.Lock()
+_update_lock = threading.Lock()
+_warmup_thread = None
+
+def register_engine(name, init, search, stats, get_document, init_cost='low', memory='low',
+                    remove_documents=None):
+    """
+    init(docs) loads the engine, search(query, k) queries it, stats() describes it and
+    get_document(path) looks documents up in it. init_cost and memory are rough
+    'low' / 'medium' / 'high' classes used to schedule loading. remove_documents(paths)
+    drops documents from a loaded engine; engines without it are initialized again
+    with the remaining documents instead.
+
+    search returns up to k results, best first, each with a relevance_score between
+    0 and 100: the fusion methods and the cascade threshold compare scores across
+    engines, and the frontend shows them as percentages.
+    """
+    if init_cost not in INIT_COSTS or memory not in INIT_COSTS:
+        raise ValueError(f"Unknown cost class for engine {name}")
+    if name in SEARCH_LAZY_ENGINES:
+        load = 'lazy'
+    else:
+        load = 'eager' if init_cost == 'low' else 'background'
+
+    engines[name] = {
+        'name': name,
+        'init': init,
+        'search': search,
+        'stats': stats,
+        'get_document': get_document,
+        'remove_documents': remove_documents,
+        'init_cost': init_cost,
+        'memory': memory,
+        'load': load,
+        'status': 'pending',
+        'error': None,
+        'init_ms': None,
+    }
+
+def init_engines(docs):
+    """Initialize eager engines now and warm up the background ones on a thread."""
+    global documents, _warmup_thread
+    document_store.init(docs)
+    with _lock:
+        documents = docs
+        for engine in engines.values():
+            engine['status'], engine['error'], engine['init_ms'] = 'pending', None, None
+
+    for name, engine in engines.items():
+        if engine['load'] == 'eager':
+            _load(name)
+
+    background = [name for name, engine in engines.items() if engine['load'] == 'background']
+    if background:
+        _warmup_thread = threading.Thread(target=_warm_up, args=(background,), name='search-warmup', daemon=True)
+        _warmup_thread.start()
+
+def _warm_up(names):
+    # One at a time so heavy models do not compete for memory and cores
+    for name in names:
+        _load(name)
+
+def _claim(name):
+    """Mark the engine as loading; False when it is already loading, loaded or there are no documents."""
+    with _lock:
+        engine = engines[name]
+        if documents is None or engine['status'] not in ('pending', 'failed'):
+            return False
+        engine['status'] = 'loading'
+        return True
+
+def _load(name):
+    if not _claim(name):
+        return
+    engine = engines[name]
+    start = time.perf_counter()
+    try:
+        # Documents removed while the engine was loading are caught up by loading again
+        docs = None
+        while docs is not documents:
+            docs = documents
+            engine['init'](docs)
+    except Exception as e:
+        print(f"Failed to initialize search engine {name}: {e}")
+        engine['error'], engine['status'] = str(e), 'failed'
+        return
+    engine['init_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    engine['status'] = 'ready'
+    print(f"Search engine {name} ready in {engine['init_ms']} ms")
+
+def remove_documents(paths):
+    """
+    Drop the documents with these paths from the corpus: the document store first, so
+    no engine resolves them any more, then every loaded engine. Engines that are not
+    loaded yet will load the remaining documents.
+    """
+    global documents
+    paths = set(paths)
+    with _update_lock:
+        with _lock:
+            if documents is None:
+                return
+            documents = [doc for doc in documents if doc['path'] not in paths]
+            remaining = documents
+        document_store.remove_documents(paths)
+
+        for name, engine in engines.items():
+            if engine['status'] != 'ready':
+                continue
+            try:
+                if engine['remove_documents'] is not None:
+                    engine['remove_documents'](paths)
+                else:
+                    engine['init'](remaining)
+            except Exception as e:
+                print(f"Failed to remove documents from search engine {name}: {e}")
+                engine['error'], engine['status'] = str(e), 'failed'
+
+def is_ready(name):
+    """
+    True when the engine can serve searches. Asking for a lazy engine that has
+    not been loaded yet starts loading it in the background.
+    """
+    engine = engines.get(name)
+    if engine is None:
+        return False
+    if engine['status'] == 'pending' and engine['load'] == 'lazy' and documents is not None:
+        threading.Thread(target=_load, args=(name,), name=f'search-load-{name}', daemon=True).start()
+    return engine['status'] == 'ready'
+
+def status(name):
+    """'unknown' for unregistered names, otherwise one of STATUSES."""
+    engine = engines.get(name)
+    return engine['status'] if engine is not None else 'unknown'
+
+def get_search_function(name):
+    engine = engines.get(name)
+    return engine['search'] if engine is not None else None
+
+def get_document(path):
+    """The document with this path, or None."""
+    return document_store.get_document(path)
+
+def readiness():
+    """Per-engine load state and measured footprint, and whether every required engine is ready."""
+    report = {}
+    for name, engine in engines.items():
+        report[name] = {
+            'status': engine['status'],
+            'load': engine['load'],
+            'required': name in SEARCH_REQUIRED_ENGINES,
+            'init_cost': engine['init_cost'],
+            'memory': engine['memory'],
+            'init_ms': engine['init_ms'],
+            'error': engine['error'],
+            'stats': engine['stats']() if engine['status'] == 'ready' else None,
+        }
+    ready = all(engines[name]['status'] == 'ready' for name in SEARCH_REQUIRED_ENGINES if name in engines)
+    return {'ready': ready, 'engines': report, 'query_embedding_cache': embeddings.query_cache_stats()}
+
+def _register_builtin_engines():
+    from search import bm25_search, fulltext_search, tfidf_search, openai_search, sentence_transformer_search
+
+    register_engine('fulltext', fulltext_search.init, fulltext_search.search, fulltext_search.stats,
+                    fulltext_search.get_document, init_cost='low', memory='low')
+    register_engine('bm25', bm25_search.init, bm25_search.search, bm25_search.stats,
+                    bm25_search.get_document, init_cost='low', memory='low',
+                    remove_documents=bm25_search.remove_documents)
+    register_engine('tfidf', tfidf_search.init, tfidf_search.search, tfidf_search.stats,
+                    tfidf_search.get_document, init_cost='low', memory='medium')
+    register_engine('openai', openai_search.init, openai_search.search, openai_search.stats,
+                    openai_search.get_document, init_cost='medium', memory='medium',
+                    remove_documents=openai_search.remove_documents)
+    for name in sentence_transformer_search.MODELS:
+        register_engine(
+            name,
+            partial(sentence_transformer_search.init, engine=name),
+            partial(sentence_transformer_search.search, engine=name),
+            partial(sentence_transformer_search.stats, name),
+            partial(sentence_transformer_search.get_document, engine=name),
+            init_cost='high',
+            memory='high',
+            remove_documents=partial(sentence_transformer_search.remove_documents, engine=name),
+        )
+
+_register_builtin_engines()
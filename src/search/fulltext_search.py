@@ -0,0 +1,123 @@
+import hashlib
+import os
+import re
+import threading
+from config.config import DATA_FOLDER
+from config.database import get_connection
+from search import document_store
+from search.syntactic_helper import find_snippet, highlight_terms
+
+# Full-text search on an SQLite FTS5 table. The table lives in its own database file
+# and is reconciled with the documents at init, so restarts only re-index what changed.
+FULLTEXT_DB_PATH = os.path.join(DATA_FOLDER, "fulltext.db")
+
+# Column weights for FTS5's bm25(): path and hash (unindexed), name, content
+NAME_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+
+# Queries are reduced to plain word tokens so user input never reaches FTS5 query syntax
+QUERY_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+num_documents = None
+db_path = None
+
+_write_lock = threading.Lock()
+
+def init(docs, path=FULLTEXT_DB_PATH):
+    """Bring the FTS5 table at path in line with docs: unchanged rows are kept, the rest re-indexed."""
+    global num_documents, db_path
+    with _write_lock:
+        db_path = path
+        with get_connection(path) as conn, conn:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts
+                USING fts5(path UNINDEXED, hash UNINDEXED, name, content, tokenize='porter unicode61')
+            """)
+            indexed = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, rowid, hash FROM documents_fts")}
+
+            hashes = {doc['path']: _doc_hash(doc) for doc in docs}
+            stale = [rowid for doc_path, (rowid, doc_hash) in indexed.items() if hashes.get(doc_path) != doc_hash]
+            fresh = [doc for doc in docs
+                     if doc['path'] not in indexed or indexed[doc['path']][1] != hashes[doc['path']]]
+
+            conn.executemany("DELETE FROM documents_fts WHERE rowid = ?", [(rowid,) for rowid in stale])
+            conn.executemany(
+                "INSERT INTO documents_fts (path, hash, name, content) VALUES (?, ?, ?, ?)",
+                [(doc['path'], hashes[doc['path']], doc['name'], doc['original_content']) for doc in fresh]
+            )
+        if stale or fresh:
+            with get_connection(path) as conn, conn:
+                conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+
+        document_store.add_documents(docs)
+        num_documents = len(docs)
+
+    print(f"Full-text FTS5 search initialized with {num_documents} documents ({len(fresh)} re-indexed).")
+
+def _doc_hash(doc):
+    digest = hashlib.blake2b(digest_size=8)
+    for field in (doc['name'], doc['original_content']):
+        digest.update(field.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _connection():
+    """A pooled read-only connection; searches run concurrently from the hybrid search pool."""
+    return get_connection(db_path, readonly=True)
+
+def _match_expression(query):
+    """Any of the query words, each quoted so it is matched literally."""
+    tokens = dict.fromkeys(token.lower() for token in QUERY_TOKEN_PATTERN.findall(query))
+    return " OR ".join(f'"{token}"' for token in tokens)
+
+def get_document(path):
+    """The indexed document with this path, or None."""
+    return document_store.get_document(path) if num_documents is not None else None
+
+def stats():
+    if num_documents is None:
+        return {'initialized': False}
+    return {
+        'initialized': True,
+        'documents': num_documents,
+        'index_bytes': os.path.getsize(db_path) if os.path.exists(db_path) else 0,
+    }
+
+def search(query, k=5):
+    if num_documents is None:
+        raise ValueError("Full-text search not initialized. Call init() first.")
+
+    expression = _match_expression(query)
+    if not expression or k <= 0:
+        return []
+
+    with _connection() as conn:
+        rows = conn.execute(
+            "SELECT path, -bm25(documents_fts, 0.0, 0.0, ?, ?) AS score FROM documents_fts "
+            "WHERE documents_fts MATCH ? ORDER BY score DESC LIMIT ?",
+            (NAME_WEIGHT, CONTENT_WEIGHT, expression, k)
+        ).fetchall()
+
+    # bm25() is unbounded and close to zero for words most documents contain; relevance is
+    # reported on the shared 0-100 scale, relative to the best match
+    top_score = rows[0][1] if rows else 0.0
+
+    results = []
+    for doc_path, score in rows:
+        doc_id = document_store.doc_id(doc_path)
+        if doc_id is None:
+            continue
+        doc = document_store.get(doc_id)
+
+        # Only the snippet is highlighted here; the full body is highlighted on demand
+        results.append({
+            "doc_id": doc_id,
+            "path": doc['path'],
+            "highlighted_name": highlight_terms(doc['name'], query),
+            "content_snippet": find_snippet(doc['content'], query),
+            "name": doc['name'],
+            "content_length": len(doc['original_content']),
+            "relevance_score": score / top_score * 100 if top_score > 0 else 0.0,
+        })
+
+    return results
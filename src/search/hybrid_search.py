@@ -1,6 +1,8 @@
-from search.bm25_search import init as init_bm25, search as search_bm25
-from search.openai_search import init as init_openai, search as search_openai
-from collections import defaultdict
+from config.config import HYBRID_SEARCH_WORKERS, SEARCH_METHOD_TIMEOUTS, DEFAULT_SEARCH_METHOD_TIMEOUT
+from search import engine_registry
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import time
+import numpy as np
 
 METHOD_WEIGHTS = {
     'fulltext': 0.3,    
@@ -16,35 +18,135 @@ METHOD_WEIGHTS = {
 RANK_FUSION_K = 60  # Controls penalty for lower ranks
 CASCADE_THRESHOLD = 0.65  # Minimum score to consider result good enough
 
-def search(query, methods=[], weights=None, combination_method='linear'):
-    all_results = {}
-    for method in methods:
-        if method == 'fulltext':
-            all_results[method] = search_fulltext(query)
-        elif method == 'tfidf':
-            all_results[method] = search_tfidf(query)
-        elif method == 'bm25':
-            all_results[method] = search_bm25(query)
-
-        elif method == 'openai':
-            all_results[method] = search_openai(query)
-        elif method == 'st_1':
-            all_results[method] = search_st_1(query)
-        elif method == 'st_2':
-            all_results[method] = search_st_2(query)
-        elif method == 'st_3':
-            all_results[method] = search_st_3(query)
+# Candidates requested from every method before fusing
+DEFAULT_FUSION_DEPTH = 20
+
+# Per-method time budget in seconds, counted from when the fan-out starts.
+# A method that overruns is left out of the fusion instead of holding up the response.
+# A running method cannot be cancelled; embedding calls time out on their own after the
+# same budget, which frees its worker.
+METHOD_TIMEOUTS = SEARCH_METHOD_TIMEOUTS
+DEFAULT_METHOD_TIMEOUT = DEFAULT_SEARCH_METHOD_TIMEOUT
+
+# Methods mostly wait on embedding calls, so threads are enough to overlap them
+_executor = ThreadPoolExecutor(max_workers=HYBRID_SEARCH_WORKERS, thread_name_prefix='hybrid-search')
+
+def search(query, methods=[], weights=None, combination_method='linear', return_timings=False,
+           depth=DEFAULT_FUSION_DEPTH, debug=False):
+    """
+    depth is the number of candidates fetched from each method; with debug=True
+    every result explains how its fused score was built.
+    """
+    all_results, timings = run_methods(query, methods, depth)
+    completed = [method for method in methods if method in all_results]
 
     if combination_method == 'rank_fusion':
-        return rank_fusion(all_results)
+        results = rank_fusion(all_results, debug)
     elif combination_method == 'cascade':
-        return cascade_search(all_results, methods)
+        results = cascade_search(all_results, completed, debug) if completed else []
     elif combination_method == 'linear':
-        return linear_combination(all_results)
+        results = linear_combination(all_results, debug)
+    elif combination_method == 'single':
+        # One method, its own ranking and scores
+        results = all_results[completed[0]] if completed else []
     else:
         raise ValueError(f"Unknown combination method: {combination_method}")
 
-def linear_combination(results):
+    return (results, timings) if return_timings else results
+
+def _timed_search(search_function, query, depth):
+    start = time.perf_counter()
+    results = search_function(query, k=depth)
+    return results, time.perf_counter() - start
+
+def run_methods(query, methods, depth=DEFAULT_FUSION_DEPTH):
+    """
+    Run every method concurrently and collect what finishes within its budget.
+    Returns ({method: results}, {method: timing}); methods that time out, fail,
+    are still loading or are unknown only show up in the timings.
+    """
+    start = time.perf_counter()
+    futures = {
+        method: _executor.submit(_timed_search, engine_registry.get_search_function(method), query, depth)
+        for method in methods if engine_registry.is_ready(method)
+    }
+
+    all_results = {}
+    timings = {}
+    for method in methods:
+        if method not in futures:
+            status = engine_registry.status(method)
+            timings[method] = {'status': 'loading' if status in ('pending', 'loading') else 'unavailable'}
+            continue
+
+        remaining = start + METHOD_TIMEOUTS.get(method, DEFAULT_METHOD_TIMEOUT) - time.perf_counter()
+        try:
+            results, elapsed = futures[method].result(timeout=max(0, remaining))
+        except FutureTimeoutError:
+            futures[method].cancel()
+            timings[method] = {'status': 'timeout', 'ms': round((time.perf_counter() - start) * 1000, 1)}
+            continue
+        except Exception as e:
+            print(f"Search method {method} failed: {e}")
+            timings[method] = {'status': 'error', 'error': str(e), 'ms': round((time.perf_counter() - start) * 1000, 1)}
+            continue
+
+        all_results[method] = results
+        timings[method] = {'status': 'ok', 'ms': round(elapsed * 1000, 1), 'results': len(results)}
+
+    return all_results, timings
+
+def _index_results(results):
+    """
+    Give every distinct document a dense integer id in first-seen order.
+    Returns the result dict per id (the last method to return a document wins) and,
+    per method, the ids and relevance scores of its results as arrays in rank order.
+    """
+    dense_ids = {}
+    docs = []
+    per_method = {}
+    for method, method_results in results.items():
+        ids = np.empty(len(method_results), dtype=np.int64)
+        for rank, result in enumerate(method_results):
+            # Document store ids when the engine provides them, paths otherwise
+            key = result.get('doc_id')
+            if key is None:
+                key = result['path']
+            doc_id = dense_ids.get(key)
+            if doc_id is None:
+                doc_id = dense_ids[key] = len(docs)
+                docs.append(result)
+            docs[doc_id] = result
+            ids[rank] = doc_id
+        relevance = np.fromiter((result['relevance_score'] for result in method_results),
+                                dtype=np.float64, count=len(method_results))
+        per_method[method] = (ids, relevance)
+    return docs, per_method
+
+def _fuse(docs, contributions, breakdowns=None):
+    """
+    Sum per-method contributions by doc id, normalize to 0-100 and
+    materialize the results best first (ties keep first-seen order).
+    """
+    fused = np.zeros(len(docs), dtype=np.float64)
+    for ids, scores in contributions:
+        fused += np.bincount(ids, weights=scores, minlength=len(docs))
+
+    # Normalize to 0-100
+    max_score = fused.max() if len(fused) else 0
+    if max_score > 0:
+        fused = fused / max_score * 100
+
+    final_results = []
+    for doc_id in np.argsort(-fused, kind='stable'):
+        result = docs[doc_id].copy()
+        result['relevance_score'] = int(fused[doc_id])
+        if breakdowns is not None:
+            result.update(breakdowns[doc_id])
+        final_results.append(result)
+    return final_results
+
+def linear_combination(results, debug=False):
     """
     Linear combination with hardcoded weights.
     Each result's score is weighted by:
@@ -52,52 +154,32 @@ def linear_combination(results):
     2. Its relevance_score from the original method
     3. The method's weight from METHOD_WEIGHTS
     """
-    combined_scores = defaultdict(float)
-    all_docs = {}
-    
-    # For logging/debugging
-    score_breakdown = defaultdict(dict)
-    
-    for method, method_results in results.items():
+    docs, per_method = _index_results(results)
+    breakdowns = [{'score_breakdown': {}} for _ in docs] if debug else None
+
+    contributions = []
+    for method, (ids, relevance) in per_method.items():
         weight = METHOD_WEIGHTS.get(method, 1.0/len(results))  # Fallback to equal weights
-        
-        for rank, result in enumerate(method_results):
-            doc_id = result['path']
-            all_docs[doc_id] = result
-            
-            # Position score * relevance score * method weight
-            position_score = len(method_results) - rank
-            relevance = result['relevance_score'] / 100.0  # Normalize to 0-1
-            score = position_score * relevance * weight
-            
-            combined_scores[doc_id] += score
-            
-            # Store breakdown for debugging
-            score_breakdown[doc_id][method] = {
-                'position_score': position_score,
-                'relevance': relevance,
-                'weight': weight,
-                'final_contribution': score
-            }
-    
-    # Normalize scores to 0-100 range
-    max_score = max(combined_scores.values()) if combined_scores else 1
-    for doc_id in combined_scores:
-        combined_scores[doc_id] = (combined_scores[doc_id] / max_score) * 100
-    
-    sorted_results = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
-    
-    final_results = []
-    for doc_id, combined_score in sorted_results:
-        result = all_docs[doc_id].copy()
-        result['relevance_score'] = int(combined_score)
-        result['score_breakdown'] = score_breakdown[doc_id]  # Add breakdown for transparency
-        final_results.append(result)
-    
-    return final_results
 
+        # Position score * relevance score * method weight
+        position_scores = len(ids) - np.arange(len(ids))
+        normalized = relevance / 100.0  # Normalize to 0-1
+        scores = position_scores * normalized * weight
+        contributions.append((ids, scores))
+
+        if debug:
+            for doc_id, position_score, rel, score in zip(ids, position_scores, normalized, scores):
+                breakdowns[doc_id]['score_breakdown'][method] = {
+                    'position_score': int(position_score),
+                    'relevance': float(rel),
+                    'weight': weight,
+                    'final_contribution': float(score)
+                }
+
+    return _fuse(docs, contributions, breakdowns)
 
-def rank_fusion(results):
+
+def rank_fusion(results, debug=False):
     """
     Reciprocal Rank Fusion (RRF) with hardcoded k value.
     Each document gets a score of 1/(rank + k) from each method,
@@ -106,90 +188,82 @@ def rank_fusion(results):
     A smaller k (e.g., 20) gives more weight to top results
     A larger k (e.g., 60) makes ranking more democratic
     """
-    fused_scores = defaultdict(float)
-    all_docs = {}
-    rank_contributions = defaultdict(dict)
-    
-    for method, method_results in results.items():
+    docs, per_method = _index_results(results)
+    breakdowns = [{'rank_contributions': {}} for _ in docs] if debug else None
+
+    contributions = []
+    for method, (ids, _) in per_method.items():
         weight = METHOD_WEIGHTS.get(method, 1.0/len(results))
-        
-        for rank, result in enumerate(method_results, start=1):
-            doc_id = result['path']
-            all_docs[doc_id] = result
-            
-            # RRF score formula with method weight
-            rrf_score = (1 / (rank + RANK_FUSION_K)) * weight
-            fused_scores[doc_id] += rrf_score
-            
-            # Store contribution for debugging
-            rank_contributions[doc_id][method] = {
-                'rank': rank,
-                'rrf_score': rrf_score,
-                'weight': weight
-            }
-    
-    # Normalize to 0-100
-    max_score = max(fused_scores.values()) if fused_scores else 1
-    for doc_id in fused_scores:
-        fused_scores[doc_id] = (fused_scores[doc_id] / max_score) * 100
-    
-    sorted_results = sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
-    
-    final_results = []
-    for doc_id, fused_score in sorted_results:
-        result = all_docs[doc_id].copy()
-        result['relevance_score'] = int(fused_score)
-        result['rank_contributions'] = rank_contributions[doc_id]
-        final_results.append(result)
-    
-    return final_results
 
+        # RRF score formula with method weight
+        ranks = np.arange(1, len(ids) + 1)
+        scores = (1 / (ranks + RANK_FUSION_K)) * weight
+        contributions.append((ids, scores))
+
+        if debug:
+            for doc_id, rank, score in zip(ids, ranks, scores):
+                breakdowns[doc_id]['rank_contributions'][method] = {
+                    'rank': int(rank),
+                    'rrf_score': float(score),
+                    'weight': weight
+                }
+
+    return _fuse(docs, contributions, breakdowns)
 
-def cascade_search(results, methods):
-    all_docs = {}
+
+def cascade_search(results, methods, debug=False):
+    """
+    Try methods in order and stop at the first one with results whose
+    weighted score clears CASCADE_THRESHOLD; fall back to the top results
+    of the last method when none does.
+    """
     final_results = []
     method_attempts = []
-    
+
     for method in methods:
         method_results = results[method]
         method_weight = METHOD_WEIGHTS.get(method, 1.0/len(methods))
-        
+
+        # Apply method weight to the score
+        relevance = np.fromiter((result['relevance_score'] for result in method_results),
+                                dtype=np.float64, count=len(method_results))
+        weighted = (relevance / 100.0) * method_weight
+
         current_method_results = []
-        for result in method_results:
-            doc_id = result['path']
-            all_docs[doc_id] = result
-            
-            # Apply method weight to the score
-            score = (result['relevance_score'] / 100.0) * method_weight
-            
-            if score >= CASCADE_THRESHOLD:
-                if doc_id not in [r['path'] for r in final_results]:
-                    result_copy = result.copy()
-                    result_copy['method_found'] = method
-                    result_copy['weighted_score'] = score
-                    current_method_results.append(result_copy)
-        
-        method_attempts.append({
-            'method': method,
-            'results_found': len(current_method_results),
-            'max_score': max([r['weighted_score'] for r in current_method_results]) if current_method_results else 0
-        })
-        
+        seen = set()
+        for index in np.flatnonzero(weighted >= CASCADE_THRESHOLD):
+            result = method_results[index]
+            if result['path'] in seen:
+                continue
+            seen.add(result['path'])
+            result_copy = result.copy()
+            result_copy['method_found'] = method
+            result_copy['weighted_score'] = float(weighted[index])
+            current_method_results.append(result_copy)
+
+        if debug:
+            method_attempts.append({
+                'method': method,
+                'results_found': len(current_method_results),
+                'max_score': max([r['weighted_score'] for r in current_method_results]) if current_method_results else 0
+            })
+
         if current_method_results:
             final_results.extend(current_method_results)
             break
-    
+
     # If no results meet threshold, use top results from last method
     if not final_results and method_results:
-        top_results = method_results[:5]
-        for result in top_results:
+        last_weight = METHOD_WEIGHTS.get(methods[-1], 1.0/len(methods))
+        for result in method_results[:5]:
             result_copy = result.copy()
             result_copy['method_found'] = methods[-1]
-            result_copy['weighted_score'] = (result['relevance_score'] / 100.0) * METHOD_WEIGHTS.get(methods[-1], 1.0/len(methods))
+            result_copy['weighted_score'] = (result['relevance_score'] / 100.0) * last_weight
             final_results.append(result_copy)
-    
+
     # Add search attempt history
-    for result in final_results:
-        result['method_attempts'] = method_attempts
-    
+    if debug:
+        for result in final_results:
+            result['method_attempts'] = method_attempts
+
     return sorted(final_results, key=lambda x: x['relevance_score'], reverse=True)
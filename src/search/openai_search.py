@@ -1,83 +1,198 @@
+import hashlib
+import json
 import os
+import threading
+import numpy as np
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-from config.config import DATA_FOLDER
+from config.config import DATA_FOLDER, ANN_INDEX_TYPE, SEARCH_METHOD_TIMEOUTS
+from search import ann_index, document_store, embedding_store, embeddings as embedding_backend
 from search.syntactic_helper import find_snippet, highlight_terms
 from collections import defaultdict
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Created at init rather than import, so importing the search package needs no API access.
+# Queries go through their own client that gives up after the method's search budget
+# without retrying; indexing keeps the client defaults.
+embeddings = None
+query_embeddings = None
+QUERY_TIMEOUT = SEARCH_METHOD_TIMEOUTS['openai']
 documents = None
-vector_store = None
-FAISS_INDEX_PATH = os.path.join(DATA_FOLDER, "faiss_openai_index")
+# {'index': FAISS index over the chunk embeddings, 'chunks': texts, 'chunk_docs': doc id per chunk}
+index_state = None
+_write_lock = threading.Lock()
+
+# The FAISS index is written with faiss.write_index next to a manifest fingerprinting the
+# chunks it was built from; chunk texts are re-derived from the documents, nothing is pickled.
+# Chunk embeddings are kept by content hash in an embedding store under vectors/, so a
+# rebuild only sends new or changed chunks to the API.
+OPENAI_INDEX_PATH = os.path.join(DATA_FOLDER, "openai_index")
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 20
 
 def init(docs):
-    global documents, vector_store
-    documents = docs
-    
-    if os.path.exists(FAISS_INDEX_PATH):
-        try:
-            vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        except Exception:
-            vector_store = create_new_index(documents)
-    else:
-        vector_store = create_new_index(documents)
-    
+    global embeddings, query_embeddings
+    if embeddings is None:
+        embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
+        query_embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, request_timeout=QUERY_TIMEOUT, max_retries=0)
+    with _write_lock:
+        _build_locked(list(docs))
     print(f"OpenAI embeddings FAISS search initialized with {len(documents)} documents.")
 
-def create_new_index(docs):
-    langchain_docs = [
-        Document(page_content=doc['content'], metadata={"path": doc['path'], "name": doc['name']})
-        for doc in docs
-    ]
-    
+def add_documents(docs):
+    """Index docs; a document whose path is already indexed replaces the old version."""
+    with _write_lock:
+        _ensure_initialized()
+        paths = {doc['path'] for doc in docs}
+        _build_locked([doc for doc in documents if doc['path'] not in paths] + list(docs))
+
+def remove_documents(paths):
+    """Drop the documents with these paths from the index; unknown paths are ignored."""
+    with _write_lock:
+        _ensure_initialized()
+        paths = set(paths)
+        _build_locked([doc for doc in documents if doc['path'] not in paths])
+
+def _ensure_initialized():
+    if index_state is None:
+        raise ValueError("OpenAI embeddings vector store not initialized. Call init() first.")
+
+def _build_locked(docs):
+    global documents, index_state
+    chunks, chunk_docs = _split_chunks(docs, document_store.add_documents(docs))
+    fingerprint = _fingerprint(chunks, chunk_docs)
+
+    index = _load_index(fingerprint)
+    if index is None:
+        index = create_new_index(chunks, fingerprint)
+    else:
+        print(f"Loaded OpenAI embeddings index with {index.ntotal} vectors")
+
+    documents = docs
+    index_state = {'index': index, 'chunks': chunks, 'chunk_docs': chunk_docs}
+
+def _split_chunks(docs, doc_ids):
+    """(chunk texts, owning document store id per chunk); chunks only reference documents by id."""
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=20,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
     )
-    split_docs = text_splitter.split_documents(langchain_docs)
-    
-    vs = FAISS.from_documents(split_docs, embeddings)
-    
-    vs.save_local(FAISS_INDEX_PATH)
-    
-    return vs
+    chunks, chunk_docs = [], []
+    for doc_id, doc in zip(doc_ids, docs):
+        for chunk in text_splitter.split_text(doc['content']):
+            chunks.append(chunk)
+            chunk_docs.append(doc_id)
+    return chunks, np.asarray(chunk_docs, dtype=np.int64)
+
+def _fingerprint(chunks, chunk_docs):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(OPENAI_EMBEDDING_MODEL.encode('utf-8'))
+    digest.update(ANN_INDEX_TYPE.encode('utf-8'))
+    digest.update(chunk_docs.tobytes())
+    for chunk in chunks:
+        digest.update(b'\0')
+        digest.update(chunk.encode('utf-8'))
+    return digest.hexdigest()
+
+def _load_index(fingerprint):
+    try:
+        with open(os.path.join(OPENAI_INDEX_PATH, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('fingerprint') != fingerprint:
+        return None
+    index = ann_index.load_index(os.path.join(OPENAI_INDEX_PATH, 'index.faiss'))
+    # Another process may have replaced the index but not yet its manifest
+    if index is None or index.ntotal != manifest.get('vectors'):
+        return None
+    return index
+
+def create_new_index(chunks, fingerprint):
+    """Index the chunks, embedding only those the embedding store does not have yet."""
+    if not chunks:
+        return None
+    store = embedding_store.open_store(os.path.join(OPENAI_INDEX_PATH, 'vectors'))
+    store, vectors, embedded = embedding_store.sync(store, chunks, _embed_documents)
+    print(f"Embedded {embedded} new or changed chunks, reused {len(chunks) - embedded}")
+    index = ann_index.build_index(vectors, ANN_INDEX_TYPE)
+
+    ann_index.save_index(index, os.path.join(OPENAI_INDEX_PATH, 'index.faiss'))
+    ann_index.save_manifest({'fingerprint': fingerprint, 'index_type': ann_index.index_type(index), 'vectors': index.ntotal},
+                            os.path.join(OPENAI_INDEX_PATH, 'manifest.json'))
+
+    return index
+
+def _embed_documents(texts):
+    # Embedded in batches by the client; normalized so inner products are cosines
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def get_document(path):
+    """The indexed document with this path, or None."""
+    if documents is None:
+        return None
+    return document_store.get_document(path)
+
+def _embed_query(query):
+    embedding = np.asarray(query_embeddings.embed_query(query), dtype=np.float32)
+    return embedding / max(np.linalg.norm(embedding), 1e-12)
+
+def _query_embedding(query):
+    """Repeated and concurrent identical queries share one API round-trip through the query cache."""
+    return embedding_backend.query_embedding(OPENAI_EMBEDDING_MODEL, query, _embed_query, timeout=QUERY_TIMEOUT)
+
+def stats():
+    state = index_state
+    if state is None:
+        return {'initialized': False}
+    index = state['index']
+    return {
+        'initialized': True,
+        'documents': len(documents),
+        'chunks': len(state['chunks']),
+        'index_type': ann_index.index_type(index) if index is not None else None,
+    }
 
 def search(query, k=5):
-    if vector_store is None:
+    state = index_state
+    if state is None:
         raise ValueError("OpenAI embeddings vector store not initialized. Call init() first.")
+    if state['index'] is None or k <= 0:
+        return []
     
     # Get more results initially to ensure we have enough unique documents
-    semantic_results = vector_store.similarity_search_with_score(query, k=k*3)
+    scores, chunk_ids = ann_index.search_index(state['index'], _query_embedding(query), k*3)
     
-    # Group results by document path
+    # Group results by document
     doc_results = defaultdict(lambda: {'chunks': [], 'max_score': 0})
     
-    for doc, score in semantic_results:
-        doc_path = doc.metadata["path"]
-        relevance_score = 1 - score
+    for chunk_id, score in zip(chunk_ids[0].tolist(), scores[0].tolist()):
+        if chunk_id < 0:
+            continue
+        doc_id = int(state['chunk_docs'][chunk_id])
+        relevance_score = score
         
-        doc_results[doc_path]['chunks'].append({
-            'content': doc.page_content,
+        doc_results[doc_id]['chunks'].append({
+            'content': state['chunks'][chunk_id],
             'score': relevance_score
         })
         
         # Update max score if this chunk has a higher score
-        if relevance_score > doc_results[doc_path]['max_score']:
-            doc_results[doc_path]['max_score'] = relevance_score
+        if relevance_score > doc_results[doc_id]['max_score']:
+            doc_results[doc_id]['max_score'] = relevance_score
 
     # Convert to final results format
     results = []
     
-    for doc_path, result_data in doc_results.items():
-        global_doc = next((d for d in documents if d['path'] == doc_path), None)
+    for doc_id, result_data in doc_results.items():
+        global_doc = document_store.get(doc_id)
         
         if global_doc:
-            content = global_doc['content']
-            original_content = global_doc['original_content']
-            content_length = len(original_content)
+            content_length = len(global_doc['original_content'])
             
             # Sort chunks by score
             sorted_chunks = sorted(result_data['chunks'], 
@@ -86,20 +201,19 @@ def search(query, k=5):
             
             # Get the highest scoring chunk for the snippet
             best_chunk = sorted_chunks[0]
+            # Only the snippet is highlighted here; the full body is highlighted on demand
             content_snippet = find_snippet(best_chunk['content'], query)
-            
-            highlighted_content = highlight_terms(original_content, query)
             highlighted_name = highlight_terms(global_doc['name'], query)
             
             result = {
-                "path": doc_path,
+                "doc_id": doc_id,
+                "path": global_doc['path'],
                 "highlighted_name": highlighted_name,
                 "content_snippet": content_snippet,
-                "content": content,
-                "original_content": original_content,
-                "highlighted_content": highlighted_content,
+                "name": global_doc['name'],
                 "content_length": content_length,
-                "relevance_score": result_data['max_score'],
+                # Cosine similarity on the shared 0-100 relevance scale
+                "relevance_score": float(np.clip(result_data['max_score'], 0.0, 1.0)) * 100,
                 "chunks": [
                     {
                         "content": chunk['content'],
@@ -1,17 +1,68 @@
-from search.bm25_search import init as init_bm25, search as search_bm25
-from search.openai_search import init as init_openai, search as search_openai
+import hashlib
+import os
+from config.config import DATA_FOLDER, INDEX_PROCESSES, TEXT_TOKENIZER
+from config.database import get_connection
+from search import engine_registry
+from search.syntactic_helper import clear_texts
 from search.hybrid_search import search as hybrid_search
 
-def perform_search(query, aggregation_method, syntactic_methods, semantic_methods):
+# Normalized content of the documents, keyed by a hash of the original text and the
+# tokenizer, so a restart only runs clear_texts over documents that are new or changed
+NORMALIZED_CONTENT_DB_PATH = os.path.join(DATA_FOLDER, "normalized_content.db")
+
+def perform_search(query, aggregation_method, syntactic_methods, semantic_methods, debug=False):
+    """
+    Returns (results, per-method timings); results is None for unsupported aggregations.
+    'single' searches with the first selected method only.
+    """
     all_methods = syntactic_methods + semantic_methods
+    if not all_methods:
+        return None, {}
+
+    if aggregation_method == 'single':
+        all_methods = all_methods[:1]
+    if aggregation_method in ['single', 'linear', 'rank_fusion', 'cascade']:
+        return hybrid_search(query, methods=all_methods, combination_method=aggregation_method,
+                             return_timings=True, debug=debug)
+    return None, {}
+
+def prepare_documents(raw_documents, path=NORMALIZED_CONTENT_DB_PATH):
+    """
+    Add the normalized 'content' every engine indexes to {path, name, original_content}
+    documents. Contents normalized by an earlier run are read back from path; rows of
+    documents that are gone are dropped.
+    """
+    hashes = [_content_hash(doc['original_content']) for doc in raw_documents]
+    with get_connection(path) as conn:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS normalized_content (hash TEXT PRIMARY KEY, content TEXT NOT NULL)")
+        stored = dict(conn.execute("SELECT hash, content FROM normalized_content"))
+
+    missing = {}
+    for doc, content_hash in zip(raw_documents, hashes):
+        if content_hash not in stored:
+            missing[content_hash] = doc['original_content']
+    fresh = dict(zip(missing, clear_texts(list(missing.values()), processes=INDEX_PROCESSES))) if missing else {}
+    stale = stored.keys() - set(hashes)
+    if fresh or stale:
+        with get_connection(path) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO normalized_content (hash, content) VALUES (?, ?)", fresh.items())
+            conn.executemany("DELETE FROM normalized_content WHERE hash = ?", [(content_hash,) for content_hash in stale])
+    stored.update(fresh)
+    print(f"Normalized {len(fresh)} of {len(raw_documents)} documents ({len(stale)} stale entries dropped).")
+
+    return [dict(doc, content=stored[content_hash]) for doc, content_hash in zip(raw_documents, hashes)]
 
-    if aggregation_method in ['rank_fusion']:
-        return hybrid_search(query, methods=all_methods, combination_method=aggregation_method)
+def _content_hash(text):
+    # Documents and queries must be normalized with the same tokenizer, so it is part of the key
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(TEXT_TOKENIZER.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
 
 def get_search_function(method):
-    search_functions = {
-        'bm25': search_bm25,
-        'openai': search_openai,
-    }
-    return search_functions.get(method.lower())
+    return engine_registry.get_search_function(method.lower())
 
+def get_document(path):
+    return engine_registry.get_document(path)
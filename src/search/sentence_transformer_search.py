@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+import numpy as np
+from config.config import (
+    DATA_FOLDER, EMBEDDING_VECTOR_DTYPE, ANN_INDEX_TYPE, SEARCH_METHOD_TIMEOUTS, DEFAULT_SEARCH_METHOD_TIMEOUT,
+)
+from search import ann_index, document_store, embedding_store, embeddings as embedding_backend
+from search.syntactic_helper import find_snippet, highlight_terms
+
+# Local sentence-transformer engines. Documents are split into chunks like the OpenAI
+# engine, encoded once in batches by the local embedding backend and kept as a matrix of
+# EMBEDDING_VECTOR_DTYPE rows, so a search is one (cached) query encoding plus a
+# matrix-vector product. With an ANN_INDEX_TYPE other than 'flat' the vectors go into a
+# FAISS index instead and searches are approximate. Chunk vectors are kept by content hash
+# in an embedding store per engine under ST_INDEX_PATH, so re-indexing only encodes new or
+# changed chunks; a FAISS index is saved too and reused while the chunks are unchanged.
+MODELS = {
+    'st_1': {'model': 'sentence-transformers/all-MiniLM-L6-v2', 'query_prefix': ''},
+    'st_2': {'model': 'sentence-transformers/all-mpnet-base-v2', 'query_prefix': ''},
+    # BGE retrieval expects queries (not passages) to carry this instruction
+    'st_3': {'model': 'BAAI/bge-base-en-v1.5',
+             'query_prefix': 'Represent this sentence for searching relevant passages: '},
+}
+
+ST_INDEX_PATH = os.path.join(DATA_FOLDER, "st_index")
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 20
+
+# {engine: state}; each state is replaced, never mutated
+engines = {}
+_write_lock = threading.Lock()
+
+def _split_chunks(docs, doc_ids):
+    """(chunk texts, owning document store id per chunk)"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
+    chunks, chunk_docs = [], []
+    for doc_id, doc in zip(doc_ids, docs):
+        for chunk in splitter.split_text(doc['content']):
+            chunks.append(chunk)
+            chunk_docs.append(doc_id)
+    return chunks, np.asarray(chunk_docs, dtype=np.int64)
+
+def _fingerprint(model_name, chunks):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_name.encode('utf-8'))
+    digest.update(EMBEDDING_VECTOR_DTYPE.encode('utf-8'))
+    digest.update(ANN_INDEX_TYPE.encode('utf-8'))
+    for chunk in chunks:
+        digest.update(b'\0')
+        digest.update(chunk.encode('utf-8'))
+    return digest.hexdigest()
+
+def init(docs, engine):
+    if engine not in MODELS:
+        raise ValueError(f"Unknown sentence-transformer engine: {engine}")
+    with _write_lock:
+        _build_locked(list(docs), engine)
+    print(f"{MODELS[engine]['model']} embeddings search initialized with {len(docs)} documents.")
+
+def add_documents(docs, engine):
+    """Index docs; a document whose path is already indexed replaces the old version."""
+    with _write_lock:
+        state = _ensure_initialized(engine)
+        paths = {doc['path'] for doc in docs}
+        _build_locked([doc for doc in state['documents'] if doc['path'] not in paths] + list(docs), engine)
+
+def remove_documents(paths, engine):
+    """Drop the documents with these paths from the index; unknown paths are ignored."""
+    with _write_lock:
+        state = _ensure_initialized(engine)
+        paths = set(paths)
+        _build_locked([doc for doc in state['documents'] if doc['path'] not in paths], engine)
+
+def _ensure_initialized(engine):
+    state = engines.get(engine)
+    if state is None:
+        raise ValueError(f"Sentence-transformer engine {engine} not initialized. Call init() first.")
+    return state
+
+def _build_locked(docs, engine):
+    model_name = MODELS[engine]['model']
+    chunks, chunk_docs = _split_chunks(docs, document_store.add_documents(docs))
+    fingerprint = _fingerprint(model_name, chunks)
+    path = os.path.join(ST_INDEX_PATH, engine)
+
+    vectors, scales, index = None, None, None
+    if ANN_INDEX_TYPE != 'flat':
+        index = _load_ann_index(path, fingerprint)
+        if index is not None:
+            print(f"Loaded {index.ntotal} {model_name} embeddings ({ann_index.index_type(index)}) from {path}")
+
+    if index is None and chunks:
+        store = embedding_store.open_store(os.path.join(path, 'vectors'), EMBEDDING_VECTOR_DTYPE)
+        store, chunk_vectors, embedded = embedding_store.sync(
+            store, chunks, lambda texts: embedding_backend.encode(model_name, texts)
+        )
+        print(f"Encoded {embedded} new or changed {model_name} chunks, reused {len(chunks) - embedded}")
+        if ANN_INDEX_TYPE == 'flat':
+            vectors, scales = embedding_backend.quantize(chunk_vectors, EMBEDDING_VECTOR_DTYPE)
+        else:
+            index = ann_index.build_index(chunk_vectors, ANN_INDEX_TYPE)
+            _save_ann_index(path, fingerprint, index)
+
+    engines[engine] = {
+        'model_name': model_name,
+        'documents': docs,
+        'chunks': chunks,
+        'chunk_docs': chunk_docs,
+        'vectors': vectors,
+        'scales': scales,
+        'index': index,
+        'num_documents': len(docs),
+    }
+
+def _load_ann_index(path, fingerprint):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('fingerprint') != fingerprint:
+        return None
+    index = ann_index.load_index(os.path.join(path, 'index.faiss'))
+    # Another process may have replaced the index but not yet its manifest
+    if index is None or index.ntotal != manifest.get('vectors'):
+        return None
+    return index
+
+def _save_ann_index(path, fingerprint, index):
+    if index is None:
+        return
+    ann_index.save_index(index, os.path.join(path, 'index.faiss'))
+    ann_index.save_manifest({'fingerprint': fingerprint, 'index_type': ann_index.index_type(index), 'vectors': index.ntotal},
+                            os.path.join(path, 'manifest.json'))
+
+def _top_chunks(state, query_embedding, top):
+    """Ids and similarities of the best chunks, best first."""
+    if state['index'] is not None:
+        scores, chunk_ids = ann_index.search_index(state['index'], query_embedding, top)
+        found = chunk_ids[0] >= 0
+        return chunk_ids[0][found], scores[0][found]
+
+    similarities = embedding_backend.similarities(state['vectors'], state['scales'], query_embedding)
+    chunk_ids = np.argpartition(-similarities, top - 1)[:top]
+    chunk_ids = chunk_ids[np.argsort(-similarities[chunk_ids], kind='stable')]
+    return chunk_ids, similarities[chunk_ids]
+
+def get_document(path, engine=None):
+    """The document with this path once any (or the given) engine is initialized, or None."""
+    initialized = engine in engines if engine else bool(engines)
+    return document_store.get_document(path) if initialized else None
+
+def stats(engine):
+    state = engines.get(engine)
+    if state is None:
+        return {'initialized': False}
+    info = {
+        'initialized': True,
+        'model': state['model_name'],
+        'documents': state['num_documents'],
+        'chunks': len(state['chunks']),
+    }
+    if state['index'] is not None:
+        info.update({
+            'index_type': ann_index.index_type(state['index']),
+            'dimensions': state['index'].d,
+        })
+    elif state['vectors'] is not None:
+        info.update({
+            'index_type': 'flat',
+            'dimensions': state['vectors'].shape[1] if state['vectors'].ndim == 2 else 0,
+            'dtype': str(state['vectors'].dtype),
+            'index_bytes': state['vectors'].nbytes + (state['scales'].nbytes if state['scales'] is not None else 0),
+        })
+    return info
+
+def search(query, k=5, engine='st_1'):
+    state = engines.get(engine)
+    if state is None:
+        raise ValueError(f"Sentence-transformer engine {engine} not initialized. Call init() first.")
+    if len(state['chunks']) == 0 or k <= 0:
+        return []
+
+    query_embedding = embedding_backend.encode_query(
+        state['model_name'], query, MODELS[engine]['query_prefix'],
+        timeout=SEARCH_METHOD_TIMEOUTS.get(engine, DEFAULT_SEARCH_METHOD_TIMEOUT)
+    )
+
+    # Get more chunks than documents needed, several chunks may share a document
+    chunk_ids, scores = _top_chunks(state, query_embedding, min(k * 3, len(state['chunks'])))
+    similarities = dict(zip(chunk_ids.tolist(), scores.tolist()))
+
+    # Group chunks by document; chunk_ids are best first, so the first chunk seen is the best
+    doc_chunks = defaultdict(list)
+    for chunk_id in chunk_ids.tolist():
+        doc_chunks[int(state['chunk_docs'][chunk_id])].append(chunk_id)
+
+    results = []
+    for doc_id, doc_chunk_ids in list(doc_chunks.items())[:k]:
+        doc = document_store.get(doc_id)
+        if doc is None:
+            continue
+        best_chunk = state['chunks'][doc_chunk_ids[0]]
+
+        # Only the snippet is highlighted here; the full body is highlighted on demand
+        results.append({
+            "doc_id": doc_id,
+            "path": doc['path'],
+            "highlighted_name": highlight_terms(doc['name'], query),
+            "content_snippet": find_snippet(best_chunk, query),
+            "name": doc['name'],
+            "content_length": len(doc['original_content']),
+            # Cosine similarity on the shared 0-100 relevance scale; quantized vectors can land just outside [0, 1]
+            "relevance_score": float(np.clip(similarities[doc_chunk_ids[0]], 0.0, 1.0)) * 100,
+            "chunks": [
+                {
+                    "content": state['chunks'][chunk_id],
+                    "score": float(similarities[chunk_id])
+                }
+                for chunk_id in doc_chunk_ids
+            ]
+        })
+
+    return results
@@ -1,86 +1,182 @@
 import re
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.util import ngrams
-
-nltk.download('punkt_tab')
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-
-
-def clear_text(text):
-    # This function should mimic the preprocessing steps used for the documents
-    # You may need to import necessary libraries (e.g., nltk) at the top of the file
-
-    # Convert to lowercase
-    text = text.lower()
-    
-    # Tokenize
-    tokens = word_tokenize(text)
-    
-    # Remove stop words
-    stop_words = set(stopwords.words('english'))
-    tokens = [token for token in tokens if token not in stop_words]
-    
-    # Lemmatization
-    lemmatizer = WordNetLemmatizer()
-    lemmatized_tokens = [lemmatizer.lemmatize(token) for token in tokens]
-    
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from config.config import TEXT_TOKENIZER, LEMMA_CACHE_SIZE, NLTK_DATA_PATH, NLTK_AUTO_DOWNLOAD
+
+# NLTK itself and its data are loaded on first use: importing nltk takes over a second
+# and the data may have to come from NLTK_DATA_PATH in containers without network access.
+# Resource name -> path checked with nltk.data.find before anything is downloaded.
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+    'omw-1.4': 'corpora/omw-1.4',
+}
+
+# Approximates the Treebank rules word_tokenize applies: contractions ("do", "n't"),
+# clitics ("'s") and single punctuation marks become their own tokens, while hyphenated
+# words and decimal numbers stay whole.
+REGEX_TOKEN_PATTERN = re.compile(r"\w+(?=n't\b)|n't\b|'\w+|\w+(?:[-.,]\w+)*|[^\w\s]")
+
+# Batches smaller than this are not worth shipping to a process pool
+MIN_PARALLEL_BATCH = 64
+
+_available_resources = set()
+_word_tokenize = None
+_stop_words = None
+_lemmatizer = None
+
+def _require_resources(*names):
+    """Make sure the NLTK resources are on disk, downloading only when allowed."""
+    import nltk
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_PATH)
+
+    for name in names:
+        if name in _available_resources:
+            continue
+        try:
+            nltk.data.find(NLTK_RESOURCES[name])
+        except LookupError:
+            if not NLTK_AUTO_DOWNLOAD or not nltk.download(name, download_dir=NLTK_DATA_PATH, quiet=True):
+                raise LookupError(
+                    f"NLTK resource '{name}' not found in {nltk.data.path}. "
+                    f"Run `python -m search.syntactic_helper` to bundle it into {NLTK_DATA_PATH}."
+                )
+        _available_resources.add(name)
+
+def prepare_resources():
+    """Download every NLTK resource into NLTK_DATA_PATH, e.g. while building an image."""
+    import nltk
+    for name in NLTK_RESOURCES:
+        if not nltk.download(name, download_dir=NLTK_DATA_PATH, quiet=True):
+            raise RuntimeError(f"Failed to download NLTK resource '{name}'")
+    print(f"NLTK resources saved to {NLTK_DATA_PATH}")
+
+def _get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        _require_resources('stopwords')
+        from nltk.corpus import stopwords
+        _stop_words = frozenset(stopwords.words('english'))
+    return _stop_words
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _lemmatize(token):
+    global _lemmatizer
+    if _lemmatizer is None:
+        _require_resources('wordnet', 'omw-1.4')
+        from nltk.stem import WordNetLemmatizer
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer.lemmatize(token)
+
+def tokenize(text, tokenizer=None):
+    """Split lowercased text with NLTK's word_tokenize or the regex fast path."""
+    global _word_tokenize
+    if (tokenizer or TEXT_TOKENIZER) == 'regex':
+        return REGEX_TOKEN_PATTERN.findall(text)
+    if _word_tokenize is None:
+        _require_resources('punkt_tab')
+        from nltk.tokenize import word_tokenize
+        _word_tokenize = word_tokenize
+    return _word_tokenize(text)
+
+def normalized_terms(text, tokenizer=None):
+    # Lowercase, tokenize, drop stop words and lemmatize; stop words and the
+    # lemmatizer are loaded once and lemmas are memoized per token
+    stop_words = _get_stop_words()
+    return [
+        _lemmatize(token)
+        for token in tokenize(text.lower(), tokenizer)
+        if token not in stop_words
+    ]
+
+def clear_text(text, tokenizer=None):
+    lemmatized_tokens = normalized_terms(text, tokenizer)
+
     # Generate bigrams
-    bigrams = [' '.join(bg) for bg in ngrams(lemmatized_tokens, 2)]
-    
+    bigrams = [' '.join(bg) for bg in zip(lemmatized_tokens, lemmatized_tokens[1:])]
+
     # Combine lemmatized tokens and bigrams
     processed_text = ' '.join(lemmatized_tokens + bigrams)
-    
+
     return processed_text
 
+def clear_texts(texts, tokenizer=None, processes=None):
+    """
+    Batch version of clear_text for indexing.
+    With processes > 1 large batches are spread over a process pool, each
+    worker keeping its own stop word set and lemma cache.
+    """
+    texts = list(texts)
+    if not processes or processes <= 1 or len(texts) < MIN_PARALLEL_BATCH:
+        return [clear_text(text, tokenizer) for text in texts]
+
+    chunksize = max(1, len(texts) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(clear_text, texts, [tokenizer] * len(texts), chunksize=chunksize))
+
+# Number of distinct queries whose compiled highlight pattern is kept
+QUERY_PATTERN_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=QUERY_PATTERN_CACHE_SIZE)
+def query_pattern(query):
+    """
+    One case-insensitive alternation over the query terms (two characters or more),
+    longest first so overlapping terms match the longer one. None when no term is left.
+    Cached, so every result of a request reuses the same compiled pattern.
+    """
+    terms = sorted({term.lower() for term in query.split() if len(term) >= 2}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
 def find_snippet(text, query, snippet_length=100):
-    query_terms = query.lower().split()
-    text_lower = text.lower()
-    
-    # Find the earliest occurrence of any query term
-    earliest_pos = len(text)
-    for term in query_terms:
-        pos = text_lower.find(term)
-        if pos != -1 and pos < earliest_pos:
-            earliest_pos = pos
-    
+    """
+    Return the snippet_length window holding the most query term matches, found in
+    a single scan of text, with only that window highlighted.
+    """
+    pattern = query_pattern(query)
+    matches = [match.span() for match in pattern.finditer(text)] if pattern else []
+
     # If no term is found, return the beginning of the text
-    if earliest_pos == len(text):
-        return highlight_terms(text[:snippet_length] + "...", query)
-    
-    # Calculate snippet start and end
-    start = max(0, earliest_pos - snippet_length // 2)
+    if not matches:
+        return text[:snippet_length] + ("..." if len(text) > snippet_length else "")
+
+    # Two pointers over the match positions: the densest run fitting in one window
+    best_first, best_last = 0, 0
+    first = 0
+    for last, (_, match_end) in enumerate(matches):
+        while first < last and match_end - matches[first][0] > snippet_length:
+            first += 1
+        if last - first > best_last - best_first:
+            best_first, best_last = first, last
+
+    # Centre the window on the matched span
+    span_start, span_end = matches[best_first][0], matches[best_last][1]
+    start = max(0, span_start - (snippet_length - (span_end - span_start)) // 2)
     end = min(len(text), start + snippet_length)
-    
+
     # Adjust start if end is at text length
     if end == len(text):
         start = max(0, end - snippet_length)
-    
-    snippet = text[start:end]
-    
+
+    snippet = highlight_terms(text[start:end], query)
+
     # Add ellipsis if snippet is not at the start or end of the text
     if start > 0:
         snippet = "..." + snippet
     if end < len(text):
         snippet = snippet + "..."
-    
-    return highlight_terms(snippet, query)
+
+    return snippet
 
 def highlight_terms(text, query):
-    highlighted = text
-    for term in query.split():
-        if len(term) < 2:
-            continue
+    pattern = query_pattern(query)
+    if pattern is None:
+        return text
+    return pattern.sub(r'<mark>\g<0></mark>', text)
 
-        # Create a regular expression pattern for case-insensitive matching
-        pattern = re.compile(re.escape(term), re.IGNORECASE)
-        
-        # Use the pattern to replace all occurrences with the highlighted version
-        highlighted = pattern.sub(lambda m: f"<mark>{m.group()}</mark>", highlighted)
-    
-    return highlighted
+if __name__ == '__main__':
+    prepare_resources()
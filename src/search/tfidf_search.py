@@ -0,0 +1,92 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from search import document_store
+from search.syntactic_helper import clear_text, find_snippet, highlight_terms
+
+# TF-IDF cosine search over the pre-processed document text. Rows of the document matrix
+# are L2-normalized, so a query's cosine similarity with every document is a sparse
+# product restricted to the matrix columns of the query's terms. The matrix is kept in
+# CSC form to make that column slice cheap. Matrix rows map to document store ids
+# through doc_ids.
+index_state = None
+
+# Documents below this similarity are not returned
+MIN_SIMILARITY = 0.0
+
+def init(docs):
+    global index_state
+    # Content is already normalized by clear_text, so terms are just the whitespace tokens
+    vectorizer = TfidfVectorizer(analyzer=str.split, sublinear_tf=True, dtype=np.float32)
+    matrix = vectorizer.fit_transform(_document_text(doc) for doc in docs) if docs else None
+
+    index_state = {
+        'vectorizer': vectorizer,
+        'matrix': matrix.tocsc() if matrix is not None else None,
+        'doc_ids': np.asarray(document_store.add_documents(docs), dtype=np.int64),
+    }
+    print(f"TF-IDF sparse search initialized with {len(docs)} documents.")
+
+def _document_text(doc):
+    return f"{doc['name']} {doc['content']}"
+
+def get_document(path):
+    """The indexed document with this path, or None."""
+    return document_store.get_document(path) if index_state is not None else None
+
+def stats():
+    state = index_state
+    if state is None:
+        return {'initialized': False}
+    matrix = state['matrix']
+    return {
+        'initialized': True,
+        'documents': len(state['doc_ids']),
+        'terms': matrix.shape[1] if matrix is not None else 0,
+        'nonzeros': matrix.nnz if matrix is not None else 0,
+        'index_bytes': matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes if matrix is not None else 0,
+    }
+
+def _similarities(state, query):
+    """Cosine similarity of the query with every document."""
+    query_vector = state['vectorizer'].transform([clear_text(query)])
+    if query_vector.nnz == 0:
+        return None
+    return np.asarray(state['matrix'][:, query_vector.indices] @ query_vector.data).ravel()
+
+def search(query, k=5):
+    state = index_state
+    if state is None:
+        raise ValueError("TF-IDF search not initialized. Call init() first.")
+    if state['matrix'] is None or k <= 0:
+        return []
+
+    similarities = _similarities(state, query)
+    if similarities is None:
+        return []
+
+    candidates = np.flatnonzero(similarities > MIN_SIMILARITY)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-similarities[candidates], k - 1)[:k]]
+    # Best first, ties broken by document order
+    candidates = candidates[np.lexsort((candidates, -similarities[candidates]))]
+
+    results = []
+    for idx in candidates:
+        doc_id = int(state['doc_ids'][idx])
+        doc = document_store.get(doc_id)
+        if doc is None:
+            continue
+
+        # Only the snippet is highlighted here; the full body is highlighted on demand
+        results.append({
+            "doc_id": doc_id,
+            "path": doc['path'],
+            "highlighted_name": highlight_terms(doc['name'], query),
+            "content_snippet": find_snippet(doc['content'], query),
+            "name": doc['name'],
+            "content_length": len(doc['original_content']),
+            "relevance_score": float(similarities[idx]) * 100,
+        })
+
+    return results
@@ -1,13 +1,36 @@
 # routes/search_routes.py
 from flask import Blueprint, request, jsonify
 import json
-from search.search_module import perform_search
-from cache import store_results, get_results
+from search.search_module import perform_search, get_document
+from search.engine_registry import readiness
+from search.syntactic_helper import highlight_terms
+from cache import store_results, get_results, cache_stats
 from llm.llm_module import generate_ai_response
-from autocomplete import get_autocomplete_suggestions, update_click_count
+from autocomplete import get_autocomplete_suggestions, update_click_count, autocomplete_stats
 
 search_bp = Blueprint('search', __name__)
 
+# Fusion explanations, only present when the 'debug' option is set
+DEBUG_FIELDS = ('score_breakdown', 'rank_contributions', 'method_attempts')
+
+def compact_result(result, include_chunks=False):
+    """
+    Search results only carry what a result list shows; bodies are fetched
+    from /search/document/<id> when a result is opened.
+    """
+    compact = {
+        "id": result['path'],
+        "name": result.get('highlighted_name', result.get('name')),
+        "score": result['relevance_score'],
+        "snippet": result.get('content_snippet', '')
+    }
+    if include_chunks and result.get('chunks'):
+        compact["chunks"] = result['chunks']
+    for field in DEBUG_FIELDS:
+        if field in result:
+            compact[field] = result[field]
+    return compact
+
 @search_bp.route('/', methods=['GET'])
 def search():
     query = request.args.get('q', '')
@@ -28,12 +51,14 @@ def search():
         if cached_results:
             return jsonify(cached_results)
 
-    results = perform_search(query, aggregation_method, syntactic_methods, semantic_methods)
+    results, timings = perform_search(query, aggregation_method, syntactic_methods, semantic_methods,
+                                      debug='debug' in options)
 
     if results is None:
         print("No results found")
         return jsonify({
             "search_results": [],
+            "timings": timings,
             "error": "Search failed - no results found"
         })
     
@@ -42,24 +67,62 @@ def search():
         ai_response = generate_ai_response(query, results[:3])
     
     response = {
-        "search_results": results[:10],
-        "ai_response": ai_response.get('full_content', '') if ai_response else None
+        "search_results": [compact_result(result, 'chunks' in options) for result in results[:10]],
+        "ai_response": ai_response.get('full_content', '') if ai_response else None,
+        "timings": timings
     }
 
-    if 'caching' in options:
-        store_results(query, aggregation_method, search_methods, options, results, response.get('ai_response'))
+    # A method that was loading, slow or failing left a partial fusion; recompute it next time
+    if 'caching' in options and all(timing['status'] == 'ok' for timing in timings.values()):
+        store_results(query, aggregation_method, search_methods, options, response['search_results'], response.get('ai_response'))
     
     return jsonify(response)
 
+@search_bp.route('/ready', methods=['GET'])
+def ready():
+    """Load state of every search engine; 503 until the required engines are ready."""
+    report = readiness()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@search_bp.route('/cache', methods=['GET'])
+def cache_metrics():
+    return jsonify(cache_stats())
+
+@search_bp.route('/document/<path:doc_id>', methods=['GET'])
+def document(doc_id):
+    """Full document body for a search result id, highlighted when q is given."""
+    query = request.args.get('q', '')
+
+    doc = get_document(doc_id)
+    if doc is None:
+        return jsonify({"error": "Document not found"}), 404
+
+    response = {
+        "id": doc_id,
+        "name": doc['name'],
+        "content": doc['original_content'],
+        "content_length": len(doc['original_content'])
+    }
+    if query:
+        response["highlighted_name"] = highlight_terms(doc['name'], query)
+        response["highlighted_content"] = highlight_terms(doc['original_content'], query)
+    return jsonify(response)
+
 @search_bp.route('/autocomplete', methods=['GET'])
 def autocomplete():
     query = request.args.get('q', '')
     if not query:
         return jsonify([])
-    
-    suggestions = get_autocomplete_suggestions(query)
+
+    # fuzzy=1 adds corrected completions when the typed prefix has too few exact ones
+    fuzzy = request.args.get('fuzzy', '0') in ('1', 'true')
+    suggestions = get_autocomplete_suggestions(query, fuzzy=fuzzy)
     return jsonify(suggestions)
 
+@search_bp.route('/autocomplete/stats', methods=['GET'])
+def autocomplete_metrics():
+    return jsonify(autocomplete_stats())
+
 @search_bp.route('/update_click_count', methods=['POST'])
 def update_click():
     data = request.json
@@ -1,6 +1,7 @@
 # routes/youtube_routes.py
 from flask import Blueprint, request, jsonify
 from index import youtube_service
+from search import remove_documents
 
 youtube_bp = Blueprint('youtube', __name__)
 
@@ -30,6 +31,8 @@ def remove_channel(channel_id):
     try:
         success = youtube_service.remove_channel(channel_id)
         if success:
+            # Documents are keyed by video id; searches stop returning it right away
+            remove_documents([channel_id])
             return jsonify({"message": "Channel removed successfully"})
         return jsonify({"error": "Channel not found"}), 404
     except Exception as e:
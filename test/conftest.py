@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend is not packaged; its modules import each other from src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
@@ -0,0 +1,126 @@
+import fcntl
+
+import numpy as np
+import pytest
+
+from search import bm25_search, document_store
+
+QUERIES = ['w1', 'w2 w7', 'w3 w40 w41', 'w0 w1 w2 w3', 'w120 w5', 'w199', 'missing', 'w4 missing w9']
+
+def _docs(count, seed=0, prefix='doc'):
+    """Documents over a Zipf-like vocabulary, long enough to span several posting blocks."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, 201)
+    weights /= weights.sum()
+    docs = []
+    for i in range(count):
+        words = ' '.join(f"w{term}" for term in rng.choice(200, size=rng.integers(5, 60), p=weights))
+        docs.append({'path': f"{prefix}{i}", 'name': f"name {i}", 'original_content': words, 'content': words})
+    return docs
+
+def _ranking(query, k, strategy='exhaustive'):
+    # Ties are ordered by internal doc id, which differs between an updated and a rebuilt index
+    ranking = [(result['path'], round(result['relevance_score'], 3))
+               for result in bm25_search.search(query, k, strategy=strategy)]
+    return sorted(ranking, key=lambda item: (-item[1], item[0]))
+
+@pytest.fixture(autouse=True)
+def isolated_index(monkeypatch):
+    # Documents in the tests are already normalized; keep queries as plain words too
+    monkeypatch.setattr(bm25_search, 'clear_text', str.lower)
+    monkeypatch.setattr(bm25_search, 'index_state', None)
+    monkeypatch.setattr(bm25_search, 'index_path', None)
+    monkeypatch.setattr(document_store, 'store_state', None)
+    monkeypatch.setattr(document_store, 'store_path', None)
+
+@pytest.mark.parametrize('k', [1, 5, 20])
+def test_block_max_matches_exhaustive(tmp_path, k):
+    bm25_search.init(_docs(700), path=str(tmp_path))
+    for query in QUERIES:
+        assert _ranking(query, k, 'block_max') == _ranking(query, k, 'exhaustive')
+
+def test_unknown_strategy(tmp_path):
+    bm25_search.init(_docs(10), path=str(tmp_path))
+    with pytest.raises(ValueError):
+        bm25_search.search('w1', strategy='nope')
+
+def _segment_names():
+    return [segment['name'] for segment in bm25_search.index_state['segments']]
+
+def test_reload_maps_the_saved_segments(tmp_path, capsys):
+    docs = _docs(300)
+    bm25_search.init(docs, path=str(tmp_path))
+    built = {query: _ranking(query, 20) for query in QUERIES}
+    segments = _segment_names()
+
+    bm25_search.init(docs, path=str(tmp_path))
+    assert "Loading BM25 index" in capsys.readouterr().out
+    assert _segment_names() == segments
+    assert isinstance(bm25_search.index_state['segments'][0]['postings_docs'], np.memmap)
+    assert {query: _ranking(query, 20) for query in QUERIES} == built
+
+def test_changed_parameters_rebuild_the_index(tmp_path, monkeypatch):
+    docs = _docs(50)
+    bm25_search.init(docs, path=str(tmp_path))
+    segments = _segment_names()
+
+    monkeypatch.setattr(bm25_search, 'k1', 1.2)
+    bm25_search.init(docs, path=str(tmp_path))
+    assert _segment_names() != segments
+    assert sorted((tmp_path / 'segments').iterdir()) == [tmp_path / 'segments' / _segment_names()[0]]
+
+def test_updates_match_a_fresh_build(tmp_path, monkeypatch):
+    # Small delta so additions are flushed into on-disk segments, and no merges so removals stay tombstones
+    monkeypatch.setattr(bm25_search, 'DELTA_MAX_DOCS', 50)
+    monkeypatch.setattr(bm25_search, 'MAX_SEGMENTS', 100)
+    monkeypatch.setattr(bm25_search, 'MAX_TOMBSTONE_RATIO', 1.0)
+
+    docs = _docs(400)
+    added = _docs(120, seed=1, prefix='added')
+    edited = [dict(doc, content=doc['content'] + ' w199 w199') for doc in docs[:10]]
+    removed = {doc['path'] for doc in docs[300:340]}
+    bm25_search.init(docs, path=str(tmp_path / 'updated'))
+    bm25_search.add_documents(added)
+    bm25_search.add_documents(edited)
+    bm25_search.remove_documents(removed)
+    assert bm25_search.stats()['tombstones'] > 0
+
+    final = edited + [doc for doc in docs[10:] if doc['path'] not in removed] + added
+    updated = {query: _ranking(query, 20) for query in QUERIES}
+    for query in QUERIES:
+        assert _ranking(query, 20, 'block_max') == updated[query]
+
+    # Reloading the segments and tombstones from disk gives the same results
+    bm25_search.init(final, path=str(tmp_path / 'updated'))
+    assert {query: _ranking(query, 20) for query in QUERIES} == updated
+
+    bm25_search.init(final, path=str(tmp_path / 'fresh'))
+    assert {query: _ranking(query, 20) for query in QUERIES} == updated
+
+    bm25_search.merge_segments()
+    assert bm25_search.stats()['tombstones'] == 0
+    assert {query: _ranking(query, 20) for query in QUERIES} == updated
+
+def test_second_process_keeps_changes_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25_search, 'DELTA_MAX_DOCS', 10)
+    monkeypatch.setattr(bm25_search, '_writer_leases', {})
+    docs = _docs(200)
+    bm25_search.init(docs, path=str(tmp_path))
+    on_disk = sorted(path.name for path in tmp_path.rglob('*'))
+    manifest = (tmp_path / 'manifest.json').read_text()
+
+    # Another open file description holding the lease stands in for another process
+    bm25_search._writer_leases.pop(str(tmp_path)).close()
+    with open(tmp_path / bm25_search.WRITER_LOCK_FILE, 'a') as lease:
+        fcntl.flock(lease, fcntl.LOCK_EX)
+        bm25_search.init(docs[5:] + _docs(30, seed=1, prefix='added'), path=str(tmp_path))
+        bm25_search.add_documents(_docs(30, seed=2, prefix='later'))
+        bm25_search.remove_documents(['doc100', 'added0'])
+        bm25_search.merge_segments()
+
+        assert not bm25_search.stats()['writable']
+        found = {result['path'] for result in bm25_search.search('w0 w1 w2 w3', 1000)}
+        assert {'added1', 'later1', 'doc5'} <= found
+        assert not {'doc0', 'doc100', 'added0'} & found
+        assert sorted(path.name for path in tmp_path.rglob('*')) == on_disk
+        assert (tmp_path / 'manifest.json').read_text() == manifest
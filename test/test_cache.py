@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+import pytest
+
+import cache
+
+RESULTS = [{'id': 'video-a', 'name': 'Redis', 'score': 100, 'snippet': 'cache'}]
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """A cache in tmp_path at a controllable time and index version, without the maintenance thread."""
+    clock = {'now': 1000.0, 'version': 'v1'}
+    monkeypatch.setattr(cache, 'CACHE_DB_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(cache.time, 'time', lambda: clock['now'])
+    monkeypatch.setattr(cache, '_index_version', lambda: clock['version'])
+    monkeypatch.setattr(cache, '_doc_id', {'video-a': 0}.get)
+    monkeypatch.setattr(cache, '_doc_path', {0: 'video-a'}.get)
+    monkeypatch.setattr(cache, '_memory', OrderedDict())
+    monkeypatch.setattr(cache, '_memory_bytes', 0)
+    monkeypatch.setattr(cache, '_pending_access', {})
+    monkeypatch.setattr(cache, '_metrics', dict.fromkeys(cache._metrics, 0))
+    cache.create_table()
+    return clock
+
+def _store(query='redis cache'):
+    cache.store_results(query, 'linear', ['bm25'], [], RESULTS, 'answer')
+
+def _get(query='redis cache'):
+    return cache.get_results(query, 'linear', ['bm25'], [])
+
+def _forget_memory():
+    cache._memory.clear()
+    cache._memory_bytes = 0
+
+def _rows():
+    with cache.get_db_connection() as conn:
+        return conn.execute('SELECT cache_key, last_access FROM cache').fetchall()
+
+def test_memory_then_disk_hit():
+    _store()
+    assert _get() == {'search_results': RESULTS, 'ai_response': 'answer'}
+    _forget_memory()
+    assert _get() == {'search_results': RESULTS, 'ai_response': 'answer'}
+    # Queries with the same normalized terms share the entry
+    assert _get('Redis  CACHE') is not None
+    stats = cache.cache_stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (2, 1, 0)
+
+def test_entries_expire_after_the_ttl(isolated_cache):
+    _store()
+    isolated_cache['now'] += cache.CACHE_TTL - 1
+    assert _get() is not None
+
+    # The memory entry is dropped and the SQLite row is expired too
+    isolated_cache['now'] += 2
+    assert _get() is None
+    assert len(cache._memory) == 0
+    assert cache.cache_stats()['expired'] == 1
+
+    cache.maintain()
+    assert _rows() == []
+
+def test_entries_of_another_index_version_are_misses(isolated_cache):
+    _store()
+    isolated_cache['version'] = 'v2'
+    assert _get() is None
+    assert len(cache._memory) == 0
+    assert cache.cache_stats()['stale'] == 1
+
+    cache.maintain()
+    assert _rows() == []
+
+    _store()
+    assert _get() is not None
+
+def test_access_times_are_written_by_maintenance(isolated_cache):
+    _store()
+    assert [last_access for _, last_access in _rows()] == [1000.0]
+    isolated_cache['now'] = 1500.0
+    _get()
+    assert [last_access for _, last_access in _rows()] == [1000.0]
+
+    cache.maintain()
+    assert [last_access for _, last_access in _rows()] == [1500.0]
+
+def test_database_errors_are_misses():
+    _store()
+    _forget_memory()
+    with cache.get_db_connection() as conn, conn:
+        conn.execute('DROP TABLE cache')
+    assert _get() is None
+    _store()
+    assert cache.cache_stats()['errors'] == 2
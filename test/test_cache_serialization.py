@@ -0,0 +1,64 @@
+import json
+import zlib
+
+import pytest
+
+from cache.serialization import HEADER, encode_results, decode_results
+
+PATHS = {0: 'video-a', 7: 'video-b'}
+IDS = {path: doc_id for doc_id, path in PATHS.items()}
+
+def _results():
+    return [
+        {'id': 'video-a', 'name': '<mark>Redis</mark> caching', 'score': 100, 'snippet': 'cache ... ümlaut'},
+        {'id': 'video-b', 'name': '', 'score': 41.5, 'snippet': '',
+         'chunks': [{'content': 'chunk', 'score': 0.42}]},
+        {'id': 'not-in-store', 'name': 'orphan', 'score': 3.25, 'snippet': 'x',
+         'score_breakdown': {'bm25': {'weight': 0.4}}},
+    ]
+
+def test_round_trip():
+    payload, size = encode_results(_results(), IDS.get)
+    decoded, decoded_size = decode_results(payload, PATHS.get)
+    assert decoded == _results()
+    assert decoded_size == size
+
+def test_empty_results():
+    payload, _ = encode_results([], IDS.get)
+    assert decode_results(payload, PATHS.get)[0] == []
+
+def test_removed_document_is_a_miss():
+    payload, _ = encode_results(_results(), IDS.get)
+    assert decode_results(payload, {0: 'video-a'}.get) is None
+
+def test_unreadable_payload_is_a_miss():
+    assert decode_results(b'not zlib', PATHS.get) is None
+
+def test_truncated_body_is_a_miss():
+    payload, _ = encode_results(_results(), IDS.get)
+    body = zlib.decompress(payload)
+    for cut in range(1, len(body)):
+        assert decode_results(zlib.compress(body[:-cut]), PATHS.get) is None
+
+def test_trailing_bytes_are_a_miss():
+    payload, _ = encode_results(_results(), IDS.get)
+    assert decode_results(zlib.compress(zlib.decompress(payload) + b'\0'), PATHS.get) is None
+
+def _body(extras):
+    """Uncompressed payload of one result outside the store whose extras slot holds these bytes."""
+    strings = [b'', b'', b'orphan', extras]
+    return b''.join([
+        HEADER.pack(1, 1),
+        (-1).to_bytes(8, 'little', signed=True),
+        bytes(8),
+        *(len(string).to_bytes(4, 'little') for string in strings),
+        *strings,
+    ])
+
+def test_hand_built_body():
+    decoded, _ = decode_results(zlib.compress(_body(json.dumps({'chunks': []}).encode('utf-8'))), PATHS.get)
+    assert decoded == [{'id': 'orphan', 'name': '', 'score': 0.0, 'snippet': '', 'chunks': []}]
+
+@pytest.mark.parametrize('extras', [b'\xff\xfe', b'{not json', b'[1]'])
+def test_unreadable_extras_are_a_miss(extras):
+    assert decode_results(zlib.compress(_body(extras)), PATHS.get) is None
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+import autocomplete
+
+ROWS = [('redis', 0.5, 0, False), ('redis cluster', 0.5, 0, False), ('rust', 0.1, 0, False)]
+
+@pytest.fixture(autouse=True)
+def phrases(tmp_path, monkeypatch):
+    """An autocomplete table in tmp_path with ROWS and the in-memory index over it."""
+    monkeypatch.setattr(autocomplete, 'AUTOCOMPLETE_DB_PATH', str(tmp_path / 'autocomplete.db'))
+    monkeypatch.setattr(autocomplete, 'AUTOCOMPLETE_FUZZY_DISTANCE', 0)
+    monkeypatch.setattr(autocomplete, '_index', None)
+    autocomplete.init_autocomplete([])
+    with autocomplete.get_db_connection() as conn, conn:
+        conn.executemany('INSERT INTO autocomplete_items (phrase, tfidf_score, click_count, is_doc_name) VALUES (?, ?, ?, ?)', ROWS)
+    autocomplete.load_autocomplete_index()
+
+@pytest.fixture
+def flushes(monkeypatch):
+    """The click batches the writer thread flushes, in order."""
+    batches = []
+    flush = autocomplete._flush_clicks
+    def recording_flush(pending):
+        batches.append(dict(pending))
+        flush(pending)
+    monkeypatch.setattr(autocomplete, '_flush_clicks', recording_flush)
+    return batches
+
+def _click_counts():
+    with autocomplete.get_db_connection() as conn:
+        return dict(conn.execute('SELECT phrase, click_count FROM autocomplete_items'))
+
+def test_clicks_are_summed_into_one_flush(monkeypatch, flushes):
+    monkeypatch.setattr(autocomplete, 'CLICK_FLUSH_INTERVAL', 60)
+    written = autocomplete.click_stats['written']
+    for phrase in ['Redis Cluster', 'rust', 'redis cluster', 'unknown phrase']:
+        autocomplete.update_click_count(phrase)
+
+    assert autocomplete.flush_click_counts(timeout=5)
+    assert flushes == [{'redis cluster': 2, 'rust': 1, 'unknown phrase': 1}]
+    assert _click_counts() == {'redis': 0, 'redis cluster': 2, 'rust': 1}
+    assert autocomplete.click_stats['written'] - written == 4
+    # The in-memory index follows without a reload
+    assert autocomplete.get_autocomplete_suggestions('red') == ['redis cluster', 'redis']
+
+def test_full_batches_are_flushed_without_waiting(monkeypatch, flushes):
+    monkeypatch.setattr(autocomplete, 'CLICK_FLUSH_INTERVAL', 60)
+    monkeypatch.setattr(autocomplete, 'CLICK_FLUSH_BATCH', 3)
+    for _ in range(7):
+        autocomplete.update_click_count('rust')
+
+    assert autocomplete.flush_click_counts(timeout=5)
+    assert flushes == [{'rust': 3}, {'rust': 3}, {'rust': 1}]
+    assert _click_counts()['rust'] == 7
+
+def test_clicks_are_written_within_the_flush_interval(monkeypatch, flushes):
+    monkeypatch.setattr(autocomplete, 'CLICK_FLUSH_INTERVAL', 0.05)
+    autocomplete.update_click_count('redis')
+
+    deadline = time.monotonic() + 5
+    while not flushes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert flushes == [{'redis': 1}]
+    assert _click_counts()['redis'] == 1
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from search import embedding_store
+
+class Embedder:
+    """Deterministic vectors per text, recording every text it is asked to embed."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([self.vector(text) for text in texts], dtype=np.float32)
+
+    @staticmethod
+    def vector(text):
+        return np.random.default_rng(embedding_store.chunk_hash(text) % 2 ** 32).normal(size=8).astype(np.float32)
+
+def _segment_dirs(path):
+    return sorted(entry.name for entry in (path / 'segments').iterdir())
+
+def test_sync_embeds_only_new_texts(tmp_path):
+    embed = Embedder()
+    store = embedding_store.open_store(str(tmp_path))
+    store, vectors, embedded = embedding_store.sync(store, ['a', 'b', 'a'], embed)
+    assert embedded == 2 and embed.calls == [['a', 'b']]
+    np.testing.assert_array_equal(vectors, [Embedder.vector(text) for text in ['a', 'b', 'a']])
+
+    store, vectors, embedded = embedding_store.sync(store, ['c', 'b'], embed)
+    assert embedded == 1 and embed.calls[-1] == ['c']
+    np.testing.assert_array_equal(vectors, [Embedder.vector(text) for text in ['c', 'b']])
+
+def test_reopened_store_reuses_vectors(tmp_path):
+    embedding_store.sync(embedding_store.open_store(str(tmp_path)), ['a', 'b'], Embedder())
+
+    embed = Embedder()
+    _, vectors, embedded = embedding_store.sync(embedding_store.open_store(str(tmp_path)), ['b', 'a'], embed)
+    assert embedded == 0 and embed.calls == []
+    np.testing.assert_array_equal(vectors, [Embedder.vector(text) for text in ['b', 'a']])
+
+    # A store saved with another dtype starts over
+    _, _, embedded = embedding_store.sync(embedding_store.open_store(str(tmp_path), 'float16'), ['a'], embed)
+    assert embedded == 1
+
+@pytest.mark.parametrize('dtype, tolerance', [('float16', 1e-2), ('int8', 5e-2)])
+def test_quantized_vectors_are_widened(tmp_path, dtype, tolerance):
+    store = embedding_store.open_store(str(tmp_path), dtype)
+    _, vectors, _ = embedding_store.sync(store, ['a', 'b'], Embedder())
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, [Embedder.vector('a'), Embedder.vector('b')], atol=tolerance)
+    np.testing.assert_array_equal(embedding_store.load_vectors(str(tmp_path)).shape, (2, 8))
+
+def test_dead_rows_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, 'MAX_DEAD_RATIO', 0.5)
+    store = embedding_store.open_store(str(tmp_path))
+    store, _, _ = embedding_store.sync(store, ['a', 'b', 'c', 'd'], Embedder())
+    store, _, _ = embedding_store.sync(store, ['a', 'e'], Embedder())
+    assert len(store['segments']) == 1
+    assert _segment_dirs(tmp_path) == [store['segments'][0]['name']]
+    assert sorted(store['positions']) == sorted(embedding_store.chunk_hash(text) for text in ['a', 'e'])
+
+def test_sync_keeps_segments_written_by_another_process(tmp_path):
+    first = embedding_store.open_store(str(tmp_path))
+    second = embedding_store.open_store(str(tmp_path))
+    (tmp_path / 'segments').mkdir()
+    (tmp_path / 'segments' / '.being-written').mkdir()
+
+    embedding_store.sync(second, ['a'], Embedder())
+    embed = Embedder()
+    store, _, embedded = embedding_store.sync(first, ['a', 'b'], embed)
+    assert embedded == 1 and embed.calls == [['b']]
+    assert len(store['segments']) == 2
+    assert _segment_dirs(tmp_path) == sorted(['.being-written'] + [segment['name'] for segment in store['segments']])
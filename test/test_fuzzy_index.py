@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from autocomplete import fuzzy_index, prefix_index
+
+@pytest.mark.parametrize('a, b, expected', [
+    ('', '', 0),
+    ('', 'abc', 3),
+    ('redis', 'redis', 0),
+    ('redis', 'redsi', 1),      # transposition
+    ('redis', 'rdis', 1),
+    ('redis', 'reddis', 1),
+    ('redis', 'rebis', 1),
+    ('kitten', 'sitting', 3),
+    ('ca', 'abc', 3),           # optimal string alignment edits no substring twice
+])
+def test_distance(a, b, expected):
+    assert fuzzy_index.distance(a, b) == expected
+    assert fuzzy_index.distance(b, a) == expected
+
+def _brute_force(keys, query, prefix_length, max_distance):
+    head, tail = query[:prefix_length], query[prefix_length:]
+    if len(head) < fuzzy_index.MIN_QUERY_LENGTH:
+        return []
+    prefixes = {key[:length] for key in keys for length in range(1, len(key) + 1)}
+    return sorted(
+        (fuzzy_index.distance(head, prefix), prefix + tail) for prefix in prefixes
+        if fuzzy_index.distance(head, prefix) <= max_distance
+        and not head.startswith(prefix) and not prefix.startswith(head)
+    )
+
+@pytest.mark.parametrize('prefix_length, max_distance', [(4, 1), (6, 2)])
+def test_corrections_match_brute_force(prefix_length, max_distance):
+    rng = random.Random(0)
+    keys = sorted({''.join(rng.choice('abcd') for _ in range(rng.randint(1, 9))) for _ in range(300)})
+    fuzzy = fuzzy_index.build(keys, prefix_length, max_distance)
+    queries = [''.join(rng.choice('abcde') for _ in range(length)) for length in (2, 3, 5, 8) for _ in range(50)]
+    for query in queries:
+        assert fuzzy_index.corrections(fuzzy, query) == _brute_force(keys, query, prefix_length, max_distance)
+
+def test_corrections_stop_at_the_deadline():
+    fuzzy = fuzzy_index.build(['redis', 'reddit', 'rust'], 5, 2)
+    assert fuzzy_index.corrections(fuzzy, 'redsi')
+    assert fuzzy_index.corrections(fuzzy, 'redsi', deadline=0) == []
+
+def _index():
+    rows = [('redis cluster', 0.9, 3, False), ('redis', 0.5, 0, True), ('reddit api', 0.2, 0, False),
+            ('rust async', 0.4, 1, False), ('python', 0.8, 5, True)]
+    index = prefix_index.build(rows)
+    return index, fuzzy_index.build(index['keys'], 5, 2)
+
+def test_complete_corrects_typos():
+    index, fuzzy = _index()
+    # One transposition away from 'redis', one substitution from 'reddi'; equal edits rank by score
+    assert fuzzy_index.complete(fuzzy, index, 'Redsi') == ['redis', 'redis cluster', 'reddit api']
+    assert fuzzy_index.complete(fuzzy, index, 'redsi c') == ['redis cluster']
+    assert fuzzy_index.complete(fuzzy, index, 'redsi', exclude={'redis'}, limit=1) == ['redis cluster']
+
+def test_complete_ignores_short_and_distant_queries():
+    index, fuzzy = _index()
+    assert fuzzy_index.complete(fuzzy, index, 'rd') == []
+    assert fuzzy_index.complete(fuzzy, index, 'zzzzz') == []
+    assert fuzzy_index.complete(fuzzy, index, 'redsi', budget_ms=0) == []
@@ -0,0 +1,67 @@
+import pytest
+
+from search.hybrid_search import linear_combination, rank_fusion, cascade_search, METHOD_WEIGHTS, RANK_FUSION_K
+
+def _result(path, score, **fields):
+    return dict({'path': path, 'name': path.upper(), 'relevance_score': score}, **fields)
+
+RESULTS = {
+    'bm25': [_result('a', 100), _result('b', 50, source='bm25')],
+    'fulltext': [_result('b', 100, source='fulltext'), _result('c', 80)],
+}
+
+def _scores(results):
+    return [(result['path'], result['relevance_score']) for result in results]
+
+def test_linear_combination():
+    # bm25 (weight 0.4): a 2 * 1.0 * 0.4, b 1 * 0.5 * 0.4; fulltext (0.3): b 2 * 1.0 * 0.3, c 1 * 0.8 * 0.3
+    results = linear_combination(RESULTS)
+    assert _scores(results) == [('a', 100), ('b', 100), ('c', 30)]
+    # The last method to return a document provides its fields
+    assert results[1]['source'] == 'fulltext'
+    assert 'score_breakdown' not in results[0]
+
+def test_linear_combination_debug():
+    results = linear_combination(RESULTS, debug=True)
+    breakdown = results[1]['score_breakdown']
+    assert set(breakdown) == {'bm25', 'fulltext'}
+    assert breakdown['bm25'] == {'position_score': 1, 'relevance': 0.5, 'weight': 0.4, 'final_contribution': pytest.approx(0.2)}
+
+def test_rank_fusion():
+    scores = {
+        'a': 0.4 / (1 + RANK_FUSION_K),
+        'b': 0.4 / (2 + RANK_FUSION_K) + 0.3 / (1 + RANK_FUSION_K),
+        'c': 0.3 / (2 + RANK_FUSION_K),
+    }
+    expected = [(path, int(score / scores['b'] * 100)) for path, score in sorted(scores.items(), key=lambda item: -item[1])]
+    results = rank_fusion(RESULTS, debug=True)
+    assert _scores(results) == expected
+    assert results[0]['rank_contributions']['fulltext']['rank'] == 1
+
+def test_documents_are_merged_by_doc_id():
+    results = linear_combination({
+        'bm25': [_result('a', 100, doc_id=1)],
+        'fulltext': [_result('a-renamed', 100, doc_id=1), _result('b', 100, doc_id=2)],
+    })
+    assert [result['path'] for result in results] == ['a-renamed', 'b']
+
+def test_empty_results():
+    assert linear_combination({}) == []
+    assert rank_fusion({'bm25': []}) == []
+    assert cascade_search({'bm25': []}, ['bm25']) == []
+
+def test_cascade_stops_at_the_first_method_above_the_threshold(monkeypatch):
+    monkeypatch.setitem(METHOD_WEIGHTS, 'bm25', 0.5)
+    monkeypatch.setitem(METHOD_WEIGHTS, 'fulltext', 1.0)
+    results = cascade_search(RESULTS, ['bm25', 'fulltext'], debug=True)
+    # bm25 peaks at 1.0 * 0.5, under CASCADE_THRESHOLD; fulltext's b (1.0) and c (0.8) clear it
+    assert _scores(results) == [('b', 100), ('c', 80)]
+    assert {result['method_found'] for result in results} == {'fulltext'}
+    assert [attempt['results_found'] for attempt in results[0]['method_attempts']] == [0, 2]
+
+def test_cascade_falls_back_to_the_last_method():
+    # With the default weights no method can clear the threshold
+    results = cascade_search(RESULTS, ['fulltext', 'bm25'])
+    assert _scores(results) == [('a', 100), ('b', 50)]
+    assert results[0]['method_found'] == 'bm25'
+    assert results[0]['weighted_score'] == pytest.approx(0.4)
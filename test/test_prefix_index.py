@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from autocomplete import prefix_index
+
+def _rows(count, seed=0):
+    """(phrase, tfidf_score, click_count, is_doc_name) rows over a small alphabet, so prefixes share many phrases."""
+    rng = random.Random(seed)
+    phrases = sorted({''.join(rng.choice('abc') for _ in range(rng.randint(1, 7))) for _ in range(count)})
+    return [(phrase.upper() if rng.random() < 0.2 else phrase, round(rng.random(), 2), rng.randint(0, 5), rng.random() < 0.3)
+            for phrase in phrases]
+
+def _brute_force(rows, prefix, limit):
+    """Score descending, then shorter phrases, then the sorted (lowercased) order."""
+    max_clicks = max(row[2] for row in rows)
+    def score(row):
+        clicks = row[2] / max_clicks if max_clicks else 0.0
+        return (prefix_index.TFIDF_WEIGHT * row[1] + prefix_index.CLICK_COUNT_WEIGHT * clicks
+                + prefix_index.DOC_NAME_WEIGHT * row[3])
+    matches = [row for row in rows if row[0].lower().startswith(prefix.lower())]
+    return [row[0] for row in sorted(matches, key=lambda row: (-score(row), len(row[0]), row[0].lower()))[:limit]]
+
+PREFIXES = ['a', 'B', 'ab', 'abc', 'cab', 'ccc', 'abcabca', 'd', '']
+
+@pytest.fixture(params=[prefix_index.PRECOMPUTE_MIN_MATCHES, 4], ids=['ranges', 'precomputed'])
+def min_matches(request, monkeypatch):
+    monkeypatch.setattr(prefix_index, 'PRECOMPUTE_MIN_MATCHES', request.param)
+    return request.param
+
+@pytest.mark.parametrize('limit', [1, 3, 10, 50])
+def test_complete_matches_brute_force(min_matches, limit):
+    rows = _rows(600)
+    index = prefix_index.build(rows)
+    assert bool(index['top']) == (min_matches == 4)
+    for prefix in PREFIXES:
+        assert prefix_index.complete(index, prefix, limit) == _brute_force(rows, prefix, limit)
+
+def test_with_clicks_matches_a_rebuild(min_matches):
+    rows = _rows(600)
+    index = prefix_index.build(rows)
+    counts = {rows[0][0]: 1, rows[10][0]: 2, 'unknown phrase': 7}
+    clicked = [(phrase, tfidf, clicks + counts.get(phrase, 0), doc_name) for phrase, tfidf, clicks, doc_name in rows]
+
+    updated = prefix_index.with_clicks(index, counts)
+    for prefix in PREFIXES:
+        assert prefix_index.complete(updated, prefix) == _brute_force(clicked, prefix, 10)
+    # The old index is left as it was
+    assert prefix_index.complete(index, 'a') == _brute_force(rows, 'a', 10)
+
+def test_new_click_maximum_rescales_scores():
+    rows = [('alpha', 0.5, 1, False), ('alps', 0.5, 0, False), ('altitude', 0.0, 0, True)]
+    index = prefix_index.build(rows)
+    assert prefix_index.complete(index, 'al') == ['alpha', 'altitude', 'alps']
+
+    index = prefix_index.with_clicks(index, {'alps': 10})
+    assert prefix_index.complete(index, 'al') == ['alps', 'altitude', 'alpha']
+    assert prefix_index.stats(index)['max_clicks'] == 10
+
+def test_empty_index():
+    index = prefix_index.build([])
+    assert prefix_index.complete(index, 'a') == []
+    assert prefix_index.with_clicks(index, {'a': 1}) is index